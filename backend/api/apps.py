@@ -1,6 +1,31 @@
+import os
+import sys
+
 from django.apps import AppConfig
+from django.conf import settings
+
+
+def _is_server_process() -> bool:
+    """True for web server processes (gunicorn/uvicorn/runserver), not other manage.py commands."""
+    from .inference import is_pool_worker
+    if is_pool_worker():
+        # Inference pool workers (api/inference.py) load the model themselves
+        return False
+    argv = sys.argv
+    if argv and os.path.basename(argv[0]) == 'manage.py':
+        # runserver's autoreloader parent only watches files; the child sets RUN_MAIN
+        return len(argv) > 1 and argv[1] == 'runserver' and os.environ.get('RUN_MAIN') == 'true'
+    return True
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from . import signals  # noqa: F401  (registers receivers)
+
+        preloaded = getattr(settings, 'MODEL_PRELOAD', False)
+        if getattr(settings, 'MODEL_WARMUP', False) and not preloaded and _is_server_process():
+            from . import inference
+            inference.warmup_in_background()
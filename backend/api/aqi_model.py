@@ -0,0 +1,208 @@
+"""
+Process-wide AQI model holder.
+
+The model is loaded at most once per process, under a lock, so concurrent
+first requests do not each import TensorFlow and read the ``.h5`` file. A
+failed load is remembered and only retried after a backoff that doubles per
+failure (MODEL_RETRY_BACKOFF .. MODEL_RETRY_BACKOFF_MAX seconds); in between,
+callers get the cached error immediately.
+
+The artifact format is detected from the file (api/model_formats.py): the
+notebook's joblib/XGBoost HDF5 is loaded as a tabular model, and Keras models
+run on the NumPy backend (api/numpy_model.py) from the ``.npz`` written by
+``manage.py convert_aqi_model``, so workers never import TensorFlow. A Keras
+file that has not been converted yet still loads through ``tensorflow.keras``
+when TensorFlow is installed. AQI_MODEL_BACKEND=keras forces that loader.
+
+With MODEL_WARMUP enabled, ApiConfig.ready() loads the model in the background
+at startup and runs one dummy ``predict`` so graph building also happens before
+the first user request. :func:`stats` exposes state and timings
+(``/api/model/status/``).
+"""
+import importlib.util
+import os
+import threading
+import time
+from typing import Any, Optional, Tuple
+
+from django.conf import settings
+
+from . import model_formats
+
+UNLOADED = 'unloaded'
+LOADING = 'loading'
+READY = 'ready'
+FAILED = 'failed'
+
+# Width of one component-model input row (views.PREDICTION_FEATURE_KEYS)
+N_FEATURES = 8
+
+
+def default_model_path() -> str:
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # backend/
+    return os.path.abspath(os.path.join(base_dir, '..', 'Models', 'AQI_prediction_model.h5'))
+
+
+def weights_path(model_path: str) -> str:
+    """Where convert_aqi_model writes the NumPy weights for a model file."""
+    return os.path.splitext(model_path)[0] + '.npz'
+
+
+def _load_numpy(path: str) -> Any:
+    npz = weights_path(path)
+    if not os.path.exists(npz):
+        raise FileNotFoundError(f"NumPy weights not found at {npz}; run `python manage.py convert_aqi_model`")
+    return model_formats.load(npz, 'numpy')
+
+
+def _tensorflow_available() -> bool:
+    return importlib.util.find_spec('tensorflow') is not None
+
+
+def load_model(path: str) -> Any:
+    """
+    Load with the configured backend (AQI_MODEL_BACKEND).
+
+    auto: detect the artifact format (api/model_formats.py); Keras files are
+    served from their converted .npz so TensorFlow is never imported, and
+    through tensorflow.keras as before when there is no .npz yet but
+    TensorFlow is installed.
+    numpy / keras: force that backend for a Keras model.
+    """
+    backend = getattr(settings, 'AQI_MODEL_BACKEND', 'auto')
+    if backend == 'keras':
+        return model_formats.load(path, 'keras')
+    if backend == 'numpy':
+        return _load_numpy(path)
+    fmt = model_formats.detect_format(path)
+    if fmt == 'keras':
+        if not os.path.exists(weights_path(path)) and _tensorflow_available():
+            return model_formats.load(path, 'keras')
+        return _load_numpy(path)
+    return model_formats.load(path, fmt)
+
+
+class ModelManager:
+
+    def __init__(self, path: Optional[str] = None, loader=load_model):
+        self.path = path
+        self.loader = loader
+        self.state = UNLOADED
+        self.model: Any = None
+        self.error: Optional[str] = None
+        self.attempts = 0
+        self.failures = 0
+        self.retry_at = 0.0
+        self.load_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+        self.loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _resolved_path(self) -> str:
+        return self.path or getattr(settings, 'AQI_MODEL_PATH', '') or default_model_path()
+
+    def _backoff(self) -> float:
+        base = float(getattr(settings, 'MODEL_RETRY_BACKOFF', 30))
+        cap = float(getattr(settings, 'MODEL_RETRY_BACKOFF_MAX', 600))
+        return min(cap, base * (2 ** max(0, self.failures - 1)))
+
+    def get(self) -> Tuple[Any, Optional[str]]:
+        """(model, None) once loaded, else (None, error). Loads at most once at a time."""
+        if self.state == READY:
+            return self.model, None
+        if self.state == FAILED and time.monotonic() < self.retry_at:
+            return None, self.error
+        with self._lock:
+            # Another thread may have finished (or failed) while we waited
+            if self.state == READY:
+                return self.model, None
+            if self.state == FAILED and time.monotonic() < self.retry_at:
+                return None, self.error
+            return self._load()
+
+    def _load(self) -> Tuple[Any, Optional[str]]:
+        self.state = LOADING
+        self.attempts += 1
+        started = time.perf_counter()
+        try:
+            self.model = self.loader(self._resolved_path())
+        except Exception as e:
+            self.failures += 1
+            self.error = str(e)
+            self.retry_at = time.monotonic() + self._backoff()
+            self.state = FAILED
+            return None, self.error
+        self.load_seconds = time.perf_counter() - started
+        self.loaded_at = time.time()
+        self.error = None
+        self.failures = 0
+        self.state = READY
+        return self.model, None
+
+    def warmup(self) -> bool:
+        """Load and run one dummy prediction (builds the inference graph). True on success."""
+        model, _ = self.get()
+        if model is None:
+            return False
+        import numpy as np
+        started = time.perf_counter()
+        try:
+            width = getattr(model, 'n_features', None) or N_FEATURES
+            model.predict(np.zeros((1, width), dtype=float), verbose=0)
+        except Exception as e:
+            self.error = f"warmup predict failed: {e}"
+            return False
+        self.warmup_seconds = time.perf_counter() - started
+        return True
+
+    def reset(self) -> None:
+        with self._lock:
+            self.state = UNLOADED
+            self.model = None
+            self.error = None
+            self.failures = 0
+            self.retry_at = 0.0
+
+    def stats(self) -> dict:
+        return {
+            'state': self.state,
+            'backend': getattr(settings, 'AQI_MODEL_BACKEND', 'auto'),
+            'format': getattr(self.model, 'format', 'keras') if self.model is not None else None,
+            'feature_columns': getattr(self.model, 'feature_columns', None),
+            'path': self._resolved_path(),
+            'error': self.error,
+            'attempts': self.attempts,
+            'load_seconds': self.load_seconds,
+            'warmup_seconds': self.warmup_seconds,
+            'loaded_at': self.loaded_at,
+            'retry_in_seconds': max(0.0, self.retry_at - time.monotonic()) if self.state == FAILED else None,
+        }
+
+
+_manager = ModelManager()
+
+
+def model_path() -> str:
+    return _manager._resolved_path()
+
+
+def get_model() -> Tuple[Any, Optional[str]]:
+    return _manager.get()
+
+
+def warmup() -> bool:
+    return _manager.warmup()
+
+
+def warmup_in_background() -> threading.Thread:
+    thread = threading.Thread(target=_manager.warmup, name='aqi-model-warmup', daemon=True)
+    thread.start()
+    return thread
+
+
+def stats() -> dict:
+    return _manager.stats()
+
+
+def reset() -> None:
+    _manager.reset()
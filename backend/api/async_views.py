@@ -0,0 +1,271 @@
+"""
+Async (ASGI-native) versions of the upstream-bound views.
+
+Same URLs, parameters and response shapes as their counterparts in
+api/views.py, whose pure helpers they reuse. The difference is that nothing
+here parks a thread on I/O: OpenWeather is called through ``aget_json``
+(httpx), Gemini through ``generate_content_async``, and the database through
+the async ORM. Work that must stay synchronous (the COPY loader, the spatial
+index, model inference) runs in a worker thread via ``sync_to_async``.
+
+Enabled with ASYNC_VIEWS=True (see api/urls.py); serve the project with an
+ASGI server, e.g. ``uvicorn myapp.asgi:application``.
+"""
+import decouple
+import google.generativeai as genai
+from adrf.decorators import api_view
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.response import Response
+
+from . import history_store, response_cache, spatial
+from .geocoding import ageocode_city
+from .measurements import HISTORY_ENDPOINT
+from .models import Location
+from .serializers import GenerateReportRequestSerializer, PredictAQIQuerySerializer
+from .upstream import UpstreamError, aget_json
+from .views import (
+    AIR_POLLUTION_ENDPOINT,
+    DEFAULT_COORDS,
+    WEATHER_ENDPOINT,
+    _air_quality_body,
+    _curate_weather,
+    _followup_prompt,
+    _history_error_response,
+    _history_station,
+    _prediction_features,
+    _prediction_payload,
+    _prediction_response,
+    _prediction_summary_prompt,
+    _report_context,
+    _report_response,
+    _resolve_time_range,
+    _run_aqi_model,
+    _store_history,
+    _upstream_error_response,
+    _upstream_history,
+    _upstream_history_params,
+)
+
+
+def _api_key():
+    return decouple.config("OPENWEATHER_API", default=None) or decouple.config("OPENWHEATHER_API", default=None)
+
+
+def _missing_key_response():
+    return Response({"error": "OpenWeather API key missing. Set OPENWEATHER_API in backend/.env"}, status=500)
+
+
+async def _resolve_coordinates(validated: dict, api_key: str):
+    """Async twin of views._resolve_coordinates: ((lat, lon), None) or (None, error Response)."""
+    q_city = validated.get('q') or validated.get('city')
+    lat_param = validated.get('lat')
+    lon_param = validated.get('lon')
+    try:
+        if lat_param is not None and lon_param is not None:
+            return (float(lat_param), float(lon_param)), None
+    except ValueError:
+        return None, Response({"error": "lat and lon must be valid numbers"}, status=400)
+    if not q_city:
+        return DEFAULT_COORDS, None
+
+    try:
+        coords = await ageocode_city(q_city, api_key)
+    except UpstreamError as e:
+        return None, _upstream_error_response(e, "Geocoding failed", "Failed to reach OpenWeather Geocoding", "Invalid Geocoding response")
+    except (TypeError, ValueError, AttributeError):
+        return None, Response({"error": "Invalid Geocoding response"}, status=502)
+    if coords is None:
+        return None, Response({"error": "City not found"}, status=404)
+    return coords, None
+
+
+async def _prediction_history(lat_val: float, lon_val: float, nearest_loc_id: int, nearest_dist: float,
+                              start_ts: int, end_ts: int, api_key: str):
+    """Async twin of views._prediction_history: same helpers, only the I/O is awaited."""
+    station = await sync_to_async(_history_station)(nearest_loc_id, nearest_dist)
+    if station is not None:
+        return _store_history(*await history_store.aget_history(nearest_loc_id, station[0], station[1], start_ts, end_ts, api_key))
+    hist_params = _upstream_history_params(lat_val, lon_val, start_ts, end_ts, api_key)
+    return _upstream_history(await aget_json(HISTORY_ENDPOINT, hist_params, timeout=settings.UPSTREAM_HISTORY_TIMEOUT))
+
+
+def _gemini_model():
+    genai.configure(api_key=decouple.config("GEMINI_API_KEY", default=""))
+    return genai.GenerativeModel('gemini-2.0-flash-exp')
+
+
+@api_view(['GET'])
+async def latest_measurements(request):
+    api_key = _api_key()
+    if not api_key:
+        return _missing_key_response()
+
+    query_serializer = PredictAQIQuerySerializer(data=request.query_params)
+    if not query_serializer.is_valid():
+        return Response({'error': 'Invalid query parameters', 'details': query_serializer.errors}, status=400)
+
+    coords, error = await _resolve_coordinates(query_serializer.validated_data, api_key)
+    if error is not None:
+        return error
+    lat_val, lon_val = coords
+
+    async def fetch_air(cell_lat, cell_lon):
+        return await aget_json(AIR_POLLUTION_ENDPOINT, {'lat': cell_lat, 'lon': cell_lon, 'appid': api_key})
+
+    try:
+        data, cache_state = await response_cache.aget_or_fetch('air', lat_val, lon_val, fetch_air)
+    except UpstreamError as e:
+        return _upstream_error_response(e, "OpenWeather Air Pollution API error", "Failed to reach OpenWeather", "Invalid JSON from OpenWeather")
+    return Response(_air_quality_body(data, cache_state, lat_val, lon_val))
+
+
+@api_view(['GET'])
+async def latest_weather(request):
+    api_key = _api_key()
+    if not api_key:
+        return _missing_key_response()
+
+    q_city = request.query_params.get('q') or request.query_params.get('city')
+    lat = request.query_params.get('lat')
+    lon = request.query_params.get('lon')
+    units = request.query_params.get('units', 'metric')
+    units = units if units in ('standard', 'metric', 'imperial') else 'metric'
+
+    coords, error = await _resolve_coordinates({'lat': lat, 'lon': lon, 'q': q_city}, api_key)
+    if error is not None:
+        return error
+
+    async def fetch_weather(cell_lat, cell_lon):
+        return await aget_json(WEATHER_ENDPOINT, {'lat': cell_lat, 'lon': cell_lon, 'units': units, 'appid': api_key})
+
+    try:
+        data, cache_state = await response_cache.aget_or_fetch('weather', coords[0], coords[1], fetch_weather, units=units)
+    except UpstreamError as e:
+        return _upstream_error_response(e, "OpenWeather API error", "Failed to reach OpenWeather", "Invalid JSON from OpenWeather", include_status=True)
+
+    if q_city and (lat is None or lon is None):
+        query = {'q': q_city, 'units': units}
+    else:
+        query = {'lat': coords[0], 'lon': coords[1], 'units': units}
+
+    return Response({
+        "message": "Latest current weather from OpenWeather",
+        "query": query,
+        "result": _curate_weather(data, units),
+        "cached": cache_state != response_cache.MISS,
+        "stale": cache_state == response_cache.STALE,
+    })
+
+
+@api_view(['GET'])
+async def predict_aqi(request):
+    """Async views.predict_aqi (same parameters and response)."""
+    api_key = _api_key()
+    if not api_key:
+        return _missing_key_response()
+
+    query_serializer = PredictAQIQuerySerializer(data=request.query_params)
+    if not query_serializer.is_valid():
+        return Response({'error': 'Invalid query parameters', 'details': query_serializer.errors}, status=400)
+
+    coords, error = await _resolve_coordinates(query_serializer.validated_data, api_key)
+    if error is not None:
+        return error
+    lat_val, lon_val = coords
+
+    start_ts, end_ts = _resolve_time_range(query_serializer.validated_data)
+    if end_ts <= start_ts:
+        return Response({"error": "end must be greater than start"}, status=400)
+
+    nearest = await sync_to_async(spatial.nearest_location)(lat_val, lon_val)
+    if nearest is None:
+        if not await Location.objects.aexists():
+            return Response({"error": "No locations found. Load locations first via /api/aqi/insert/."}, status=404)
+        return Response({"error": "Could not resolve nearest location from DB coordinates."}, status=404)
+    nearest_loc_id, nearest_dist = nearest
+
+    try:
+        items, history_info = await _prediction_history(lat_val, lon_val, nearest_loc_id, nearest_dist, start_ts, end_ts, api_key)
+    except UpstreamError as e:
+        return _history_error_response(e)
+
+    X, rows_meta = _prediction_features(items)
+    # CPU-bound, touches no connections: any worker thread will do
+    prediction = await sync_to_async(_run_aqi_model, thread_sensitive=False)(X, rows_meta, nearest_loc_id)
+    response_payload = _prediction_payload(
+        lat_val, lon_val, nearest_loc_id, nearest_dist, start_ts, end_ts, history_info, rows_meta, prediction,
+    )
+
+    generate_summary = request.query_params.get('generate_summary', '').lower() == 'true'
+    if generate_summary and response_payload['results']:
+        try:
+            prompt, summary_meta = _prediction_summary_prompt(response_payload['results'], start_ts, end_ts, lat_val, lon_val)
+            response = await _gemini_model().generate_content_async(prompt)
+            response_payload['ai_summary'] = {'summary': response.text.strip(), **summary_meta}
+        except Exception as e:
+            response_payload['ai_summary'] = {
+                'error': f"Failed to generate summary: {str(e)}"
+            }
+
+    return _prediction_response(response_payload)
+
+
+@api_view(['POST'])
+async def prediction_followup(request):
+    try:
+        question, prompt, error = _followup_prompt(request.data)
+        if error is not None:
+            return error
+
+        try:
+            response = await _gemini_model().generate_content_async(prompt)
+        except Exception as ai_error:
+            return Response({
+                "success": False,
+                "error": f"AI processing error: {str(ai_error)}"
+            }, status=500)
+        return Response({
+            "success": True,
+            "answer": response.text.strip(),
+            "question": question
+        })
+    except Exception as e:
+        return Response({
+            "success": False,
+            "error": f"Failed to process follow-up: {str(e)}"
+        }, status=500)
+
+
+@api_view(['POST'])
+async def generate_report(request):
+    try:
+        request_serializer = GenerateReportRequestSerializer(data=request.data)
+        if not request_serializer.is_valid():
+            return Response({
+                "success": False,
+                "error": "Invalid request data",
+                "details": request_serializer.errors
+            }, status=400)
+
+        ctx, error = _report_context(request_serializer.validated_data, request.data)
+        if error is not None:
+            return error
+
+        model = _gemini_model()
+        try:
+            if ctx['previous_context']:
+                response = await model.start_chat().send_message_async(ctx['prompt'])
+            else:
+                response = await model.generate_content_async(ctx['prompt'])
+        except Exception as ai_error:
+            return Response({
+                "success": False,
+                "error": f"Unable to generate summary: {str(ai_error)}"
+            }, status=500)
+        return Response(_report_response(ctx, response.text.strip()))
+    except Exception as e:
+        return Response({
+            "success": False,
+            "error": f"Failed to generate report: {str(e)}"
+        }, status=500)
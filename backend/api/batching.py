@@ -0,0 +1,176 @@
+"""
+Cross-request micro-batching for model inference.
+
+Concurrent requests each hold a few dozen rows; calling ``model.predict`` per
+request pays the per-call overhead every time. :class:`MicroBatcher` queues
+the rows of concurrent callers, and a single worker thread waits up to
+INFERENCE_BATCH_MAX_WAIT_MS after the first arrival (or until
+INFERENCE_BATCH_MAX_ROWS rows are queued), runs one ``predict`` over the
+concatenated matrix and hands each caller its slice of the output.
+
+Callers block on their own future, so this is used from request threads (and
+from ``sync_to_async`` worker threads in the async views), for at most
+INFERENCE_TIMEOUT seconds. With INFERENCE_BATCHING off, :func:`predict` calls
+the model directly.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, TimeoutError as FutureTimeout
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+
+class MicroBatcher:
+
+    def __init__(self, max_rows: int, max_wait: float, timeout: Optional[float] = None):
+        self.max_rows = max(1, max_rows)
+        self.max_wait = max(0.0, max_wait)
+        self.timeout = timeout
+        self.batches = 0
+        self.rows = 0
+        self.requests = 0
+        self.largest_batch = 0
+        self._queue: 'queue.Queue[Tuple[Any, Any, Future]]' = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self) -> None:
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked child: the parent's worker thread did not come along
+                self._queue = queue.Queue()
+                self._thread = None
+            if self._thread is None or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='inference-batcher', daemon=True)
+                self._thread.start()
+
+    def predict(self, model: Any, X) -> Any:
+        """``model.predict(X)``, run as part of a batch with concurrent callers."""
+        import numpy as np
+        X = np.asarray(X, dtype=float)
+        if len(X) == 0:
+            return model.predict(X, verbose=0)
+        future: Future = Future()
+        self._ensure_worker()
+        self._queue.put((model, X, future))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # Still queued: the worker skips it. Already running: its result is dropped
+            future.cancel()
+            raise FutureTimeout(f"inference did not finish within {self.timeout}s") from None
+
+    def _collect(self) -> List[Tuple[Any, Any, Future]]:
+        pending = [self._queue.get()]
+        rows = len(pending[0][1])
+        deadline = time.monotonic() + self.max_wait
+        while rows < self.max_rows:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            pending.append(item)
+            rows += len(item[1])
+        return pending
+
+    def _run(self) -> None:
+        while True:
+            pending = self._collect()
+            # A model reload mid-batch leaves two models queued: run each separately
+            groups: Dict[int, List[Tuple[Any, Any, Future]]] = {}
+            for item in pending:
+                groups.setdefault(id(item[0]), []).append(item)
+            for items in groups.values():
+                self._flush(items)
+
+    @staticmethod
+    def _settle(future: Future, result: Any = None, error: Optional[BaseException] = None) -> None:
+        try:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        except InvalidStateError:
+            # The caller timed out and cancelled it
+            pass
+
+    def _flush(self, items: List[Tuple[Any, Any, Future]]) -> None:
+        import numpy as np
+        items = [item for item in items if not item[2].cancelled()]
+        if not items:
+            return
+        model = items[0][0]
+        try:
+            X = np.concatenate([x for _, x, _ in items]) if len(items) > 1 else items[0][1]
+            y = np.asarray(model.predict(X, verbose=0))
+            if len(y) != len(X):
+                raise ValueError(f"model returned {len(y)} rows for {len(X)} inputs")
+        except BaseException as e:
+            # Anything, even SystemExit from a native extension: every caller gets it, the worker lives on
+            for _, _, future in items:
+                self._settle(future, error=e)
+            return
+        self.batches += 1
+        self.requests += len(items)
+        self.rows += len(X)
+        self.largest_batch = max(self.largest_batch, len(X))
+        start = 0
+        for _, x, future in items:
+            self._settle(future, y[start:start + len(x)])
+            start += len(x)
+
+    def stats(self) -> dict:
+        return {
+            'batches': self.batches,
+            'requests': self.requests,
+            'rows': self.rows,
+            'largest_batch': self.largest_batch,
+            'mean_requests_per_batch': round(self.requests / self.batches, 2) if self.batches else None,
+            'max_rows': self.max_rows,
+            'max_wait_ms': self.max_wait * 1000,
+        }
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return getattr(settings, 'INFERENCE_BATCHING', True)
+
+
+def get_batcher() -> MicroBatcher:
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = MicroBatcher(
+                    int(getattr(settings, 'INFERENCE_BATCH_MAX_ROWS', 512)),
+                    float(getattr(settings, 'INFERENCE_BATCH_MAX_WAIT_MS', 5)) / 1000.0,
+                    float(getattr(settings, 'INFERENCE_TIMEOUT', 30)),
+                )
+    return _batcher
+
+
+def predict(model: Any, X) -> Any:
+    """``model.predict(X)``, micro-batched across concurrent requests when enabled."""
+    if not enabled():
+        import numpy as np
+        return model.predict(np.asarray(X, dtype=float), verbose=0)
+    return get_batcher().predict(model, X)
+
+
+def stats() -> dict:
+    if not enabled():
+        return {'enabled': False}
+    return {'enabled': True, **get_batcher().stats()}
@@ -0,0 +1,108 @@
+"""
+Per-endpoint circuit breakers for upstream calls.
+
+After UPSTREAM_BREAKER_THRESHOLD consecutive failures (connection errors,
+timeouts, 429/5xx) the breaker for that endpoint opens and calls fail
+immediately for UPSTREAM_BREAKER_COOLDOWN seconds instead of waiting out the
+timeouts. Then a single trial call is let through (half-open): success closes
+the breaker, failure opens it for another cooldown.
+
+State is per process; every worker learns about an outage on its own.
+"""
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return CLOSED
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return OPEN
+        return HALF_OPEN
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream now (claims the half-open trial slot)."""
+        with self._lock:
+            state = self.state
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def release_trial(self) -> None:
+        """Give back a claimed trial slot without an outcome (the call was cancelled)."""
+        with self._lock:
+            self._trial = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_lock = threading.Lock()
+
+
+def endpoint_key(url: str) -> str:
+    """Breakers are per scheme://host/path (query string ignored)."""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}{parts.path}"
+
+
+def get_breaker(url: str) -> CircuitBreaker:
+    key = endpoint_key(url)
+    breaker = _breakers.get(key)
+    if breaker is None:
+        with _lock:
+            breaker = _breakers.get(key)
+            if breaker is None:
+                breaker = _breakers[key] = CircuitBreaker(
+                    int(getattr(settings, 'UPSTREAM_BREAKER_THRESHOLD', 5)),
+                    float(getattr(settings, 'UPSTREAM_BREAKER_COOLDOWN', 30)),
+                )
+    return breaker
+
+
+def states() -> Dict[str, str]:
+    """endpoint -> breaker state, for diagnostics."""
+    return {key: breaker.state for key, breaker in list(_breakers.items())}
+
+
+def reset() -> None:
+    with _lock:
+        _breakers.clear()
@@ -0,0 +1,53 @@
+"""
+Vectorized great-circle distances.
+
+:func:`haversine` broadcasts over NumPy arrays. :func:`nearest_k` handles
+many-to-many point sets in chunks of query rows,
+so the temporary (chunk x n) matrices stay under DISTANCE_CHUNK_ELEMENTS
+floats, no matter how many points a request sends.
+"""
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+EARTH_RADIUS_M = 6371000.0
+
+
+def haversine(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Great-circle distance in metres between points given in degrees (broadcasting)."""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = phi2 - phi1
+    dlam = np.radians(lon2) - np.radians(lon1)
+    h = np.sin(dphi / 2.0) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlam / 2.0) ** 2
+    return 2.0 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+def _chunks(m: int, n: int, max_elements: Optional[int]) -> Iterator[slice]:
+    limit = max_elements or int(getattr(settings, 'DISTANCE_CHUNK_ELEMENTS', 4_000_000))
+    rows = max(1, limit // max(1, n))
+    for start in range(0, m, rows):
+        yield slice(start, min(m, start + rows))
+
+
+def nearest_k(lat1, lon1, lat2, lon2, k: int = 1, max_elements: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    For each of m query points, the k nearest of n points: ((m, k) indices into
+    the n points, (m, k) distances in metres), nearest first. k is capped at n.
+    """
+    lat1, lon1 = np.asarray(lat1, dtype=float), np.asarray(lon1, dtype=float)
+    lat2, lon2 = np.asarray(lat2, dtype=float), np.asarray(lon2, dtype=float)
+    m, n = len(lat1), len(lat2)
+    k = max(0, min(k, n))
+    indices = np.empty((m, k), dtype=np.int64)
+    distances = np.empty((m, k))
+    if k == 0:
+        return indices, distances
+    for rows in _chunks(m, n, max_elements):
+        d = haversine(lat1[rows, None], lon1[rows, None], lat2[None, :], lon2[None, :])
+        part = np.argpartition(d, k - 1, axis=1)[:, :k] if k < n else np.broadcast_to(np.arange(n), d.shape)
+        part_d = np.take_along_axis(d, part, axis=1)
+        order = np.argsort(part_d, axis=1, kind='stable')
+        indices[rows] = np.take_along_axis(part, order, axis=1)
+        distances[rows] = np.take_along_axis(part_d, order, axis=1)
+    return indices, distances
@@ -0,0 +1,169 @@
+"""
+Cached city -> coordinates resolution for OpenWeather's direct geocoding API.
+
+Two levels sit in front of the upstream call:
+  1. an in-process LRU (microsecond hits, per worker)
+  2. the GeocodeCache table (shared by all workers, survives restarts)
+
+City coordinates never change, so positive results are kept indefinitely.
+"City not found" is cached too, but only for GEOCODE_NEGATIVE_TTL seconds so a
+typo'd or newly-added place name is eventually retried.
+"""
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+
+from .models import GeocodeCache
+from .upstream import aget_json, get_json
+
+GEO_ENDPOINT = 'https://api.openweathermap.org/geo/1.0/direct'
+
+Coords = Tuple[float, float]
+
+_MISSING = object()
+
+
+def normalize_city(q: str) -> str:
+    """Canonical cache key: 'Chennai ,  IN' and 'chennai,in' map to the same entry."""
+    q = unicodedata.normalize('NFKC', q or '')
+    parts = [' '.join(p.split()) for p in q.split(',')]
+    return ','.join(p for p in parts if p).casefold()
+
+
+class _LRU:
+    """Small thread-safe LRU mapping key -> (value, expires_at or None)."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return _MISSING
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: Optional[float] = None):
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_lru = _LRU(getattr(settings, 'GEOCODE_CACHE_SIZE', 1024))
+
+
+def _negative_ttl() -> float:
+    return float(getattr(settings, 'GEOCODE_NEGATIVE_TTL', 86400))
+
+
+def _from_db(key: str):
+    try:
+        row = GeocodeCache.objects.filter(query=key).first()
+    except DatabaseError:
+        # Table missing (migrations not applied) or DB hiccup: behave as a miss
+        return _MISSING
+    return _from_row(key, row)
+
+
+def _from_row(key: str, row: Optional[GeocodeCache]):
+    if row is None:
+        return _MISSING
+    if row.found:
+        coords = (row.latitude, row.longitude)
+        _lru.set(key, coords)
+        return coords
+    remaining = (row.updated_at + timedelta(seconds=_negative_ttl()) - timezone.now()).total_seconds()
+    if remaining <= 0:
+        return _MISSING
+    _lru.set(key, None, ttl=remaining)
+    return None
+
+
+def _defaults(coords: Optional[Coords]) -> dict:
+    return {
+        'latitude': coords[0] if coords else None,
+        'longitude': coords[1] if coords else None,
+        'found': coords is not None,
+    }
+
+
+def _store(key: str, coords: Optional[Coords]):
+    _lru.set(key, coords, ttl=None if coords is not None else _negative_ttl())
+    try:
+        GeocodeCache.objects.update_or_create(query=key, defaults=_defaults(coords))
+    except DatabaseError:
+        pass
+
+
+def _coords_from(geo_data) -> Optional[Coords]:
+    if geo_data:
+        return float(geo_data[0].get('lat')), float(geo_data[0].get('lon'))
+    return None
+
+
+def geocode_city(q_city: str, api_key: str) -> Optional[Coords]:
+    """
+    Resolve a city name to (lat, lon); None if OpenWeather does not know it.
+
+    Upstream failures propagate as UpstreamError and are never cached.
+    """
+    key = normalize_city(q_city)
+    hit = _lru.get(key)
+    if hit is not _MISSING:
+        return hit
+    hit = _from_db(key)
+    if hit is not _MISSING:
+        return hit
+
+    geo_data = get_json(GEO_ENDPOINT, {'q': q_city, 'limit': 1, 'appid': api_key})
+    coords = _coords_from(geo_data)
+    _store(key, coords)
+    return coords
+
+
+async def ageocode_city(q_city: str, api_key: str) -> Optional[Coords]:
+    """Async :func:`geocode_city` (async ORM for the table, non-blocking upstream call)."""
+    key = normalize_city(q_city)
+    hit = _lru.get(key)
+    if hit is not _MISSING:
+        return hit
+    try:
+        hit = _from_row(key, await GeocodeCache.objects.filter(query=key).afirst())
+    except DatabaseError:
+        hit = _MISSING
+    if hit is not _MISSING:
+        return hit
+
+    coords = _coords_from(await aget_json(GEO_ENDPOINT, {'q': q_city, 'limit': 1, 'appid': api_key}))
+    _lru.set(key, coords, ttl=None if coords is not None else _negative_ttl())
+    try:
+        await GeocodeCache.objects.aupdate_or_create(query=key, defaults=_defaults(coords))
+    except DatabaseError:
+        pass
+    return coords
+
+
+def clear_cache():
+    """Forget in-process entries (the DB table is left untouched)."""
+    _lru.clear()
@@ -0,0 +1,185 @@
+"""
+Local store for OpenWeather air pollution history, filled gap by gap.
+
+predict_aqi asks for a station's history over [start, end]. We keep a ledger of
+the intervals already fetched for that station (FetchedInterval), fetch only the
+sub-intervals that are missing, load them into Measurement (which also updates
+the rollups), and then answer the whole window from the database. Overlapping
+HistoryView requests become local reads plus a small tail fetch.
+
+The most recent HISTORY_SETTLE_SECONDS are never marked as covered because
+OpenWeather may still fill them in, so that tail is re-fetched each time.
+
+:func:`aget_history` is the async variant for api/async_views.py: the gaps are
+fetched concurrently without blocking, and the loader (COPY, transactions) runs
+in a worker thread.
+"""
+import asyncio
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .measurements import (
+    AQI_PARAMETER,
+    FEATURE_KEYS,
+    HISTORY_ENDPOINT,
+    fetch_openweather_history,
+    load_measurements,
+    openweather_history_params,
+    rows_from_openweather,
+)
+from .models import FetchedInterval, Location, Measurement
+from .upstream import aget_json
+
+SOURCE = 'openweather.history'
+
+Interval = Tuple[datetime, datetime]
+
+
+def missing_intervals(covered: List[Interval], start: datetime, end: datetime) -> List[Interval]:
+    """Sub-intervals of [start, end] not covered by any interval in `covered`."""
+    gaps: List[Interval] = []
+    cursor = start
+    for c_start, c_end in sorted(covered):
+        if c_end < cursor:
+            continue
+        if c_start > end:
+            break
+        if c_start > cursor:
+            gaps.append((cursor, c_start))
+        cursor = max(cursor, c_end)
+        if cursor >= end:
+            break
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+def station_coords(location_id: int):
+    """(lat, lon) of a station, or None if it has no coordinates."""
+    row = Location.objects.filter(location_id=location_id).values_list('latitude', 'longitude', 'geom').first()
+    if row is None:
+        return None
+    lat, lon, geom = row
+    if geom is not None:
+        # GeoDjango Point: x=lon, y=lat
+        return float(geom.y), float(geom.x)
+    if lat is None or lon is None:
+        return None
+    return float(lat), float(lon)
+
+
+def covered_intervals(location_id: int, start: datetime, end: datetime) -> List[Interval]:
+    return list(
+        FetchedInterval.objects.filter(
+            location_id=location_id, source=SOURCE, start__lte=end, end__gte=start,
+        ).values_list('start', 'end')
+    )
+
+
+def record_coverage(location_id: int, start: datetime, end: datetime) -> None:
+    """Add [start, end] to the ledger, merging it with overlapping/touching intervals."""
+    if end <= start:
+        return
+    with transaction.atomic():
+        overlapping = FetchedInterval.objects.select_for_update().filter(
+            location_id=location_id, source=SOURCE, start__lte=end, end__gte=start,
+        )
+        for interval in overlapping:
+            start = min(start, interval.start)
+            end = max(end, interval.end)
+        overlapping.delete()
+        FetchedInterval.objects.create(location_id=location_id, source=SOURCE, start=start, end=end)
+
+
+def _read_items(location_id: int, start: datetime, end: datetime) -> List[dict]:
+    """Rebuild OpenWeather-style history items ({dt, components, main}) from stored rows."""
+    rows = Measurement.objects.filter(
+        Q(parameter__in=FEATURE_KEYS) | Q(parameter=AQI_PARAMETER),
+        location_id=location_id,
+        last_updated__gte=start,
+        last_updated__lte=end,
+    ).order_by('last_updated').values_list('last_updated', 'parameter', 'value')
+
+    items: "OrderedDict[int, dict]" = OrderedDict()
+    for ts, parameter, value in rows:
+        dt = int(ts.timestamp())
+        item = items.get(dt)
+        if item is None:
+            item = items[dt] = {'dt': dt, 'components': {}, 'main': {}}
+        if parameter == AQI_PARAMETER:
+            item['main']['aqi'] = int(value) if value is not None else None
+        else:
+            item['components'][parameter] = value
+    return list(items.values())
+
+
+def _settled() -> datetime:
+    return datetime.now(dt_timezone.utc) - timedelta(seconds=getattr(settings, 'HISTORY_SETTLE_SECONDS', 7200))
+
+
+def _window(start_ts: int, end_ts: int) -> Tuple[datetime, datetime, datetime]:
+    """(start, end, settled) as aware UTC datetimes."""
+    start = datetime.fromtimestamp(start_ts, tz=dt_timezone.utc)
+    end = datetime.fromtimestamp(end_ts, tz=dt_timezone.utc)
+    return start, end, _settled()
+
+
+def record_fetched(location_id: int, start: datetime, end: datetime, settled: Optional[datetime] = None) -> None:
+    """Mark a loaded OpenWeather window as covered, except its unsettled tail."""
+    settled = settled or _settled()
+    if start < settled:
+        record_coverage(location_id, start, min(end, settled))
+
+
+def _load_gap(location_id: int, rows: list, gap_start: datetime, gap_end: datetime, settled: datetime) -> int:
+    loaded = load_measurements(rows).rows
+    record_fetched(location_id, gap_start, gap_end, settled)
+    return loaded
+
+
+def get_history(location_id: int, lat: float, lon: float, start_ts: int, end_ts: int, api_key: str) -> Tuple[List[dict], dict]:
+    """
+    History items for a station over [start_ts, end_ts], fetching only missing gaps.
+
+    Upstream failures propagate as UpstreamError. Returns (items, stats) where
+    stats reports how many gaps were fetched and how many rows they added.
+    """
+    start, end, settled = _window(start_ts, end_ts)
+
+    gaps = missing_intervals(covered_intervals(location_id, start, end), start, end)
+    loaded = 0
+    for gap_start, gap_end in gaps:
+        rows = fetch_openweather_history(location_id, lat, lon, gap_start, gap_end, api_key)
+        loaded += _load_gap(location_id, rows, gap_start, gap_end, settled)
+
+    return _read_items(location_id, start, end), {'gaps_fetched': len(gaps), 'rows_loaded': loaded}
+
+
+async def aget_history(location_id: int, lat: float, lon: float, start_ts: int, end_ts: int, api_key: str) -> Tuple[List[dict], dict]:
+    """Async :func:`get_history`; missing gaps are fetched concurrently."""
+    start, end, settled = _window(start_ts, end_ts)
+    covered = [
+        interval async for interval in FetchedInterval.objects.filter(
+            location_id=location_id, source=SOURCE, start__lte=end, end__gte=start,
+        ).values_list('start', 'end')
+    ]
+    gaps = missing_intervals(covered, start, end)
+    timeout = getattr(settings, 'UPSTREAM_HISTORY_TIMEOUT', 15)
+    payloads = await asyncio.gather(*[
+        aget_json(HISTORY_ENDPOINT, openweather_history_params(lat, lon, gap_start, gap_end, api_key), timeout=timeout)
+        for gap_start, gap_end in gaps
+    ])
+
+    loaded = 0
+    for (gap_start, gap_end), payload in zip(gaps, payloads):
+        rows = rows_from_openweather(location_id, payload)
+        loaded += await sync_to_async(_load_gap)(location_id, rows, gap_start, gap_end, settled)
+
+    items = await sync_to_async(_read_items)(location_id, start, end)
+    return items, {'gaps_fetched': len(gaps), 'rows_loaded': loaded}
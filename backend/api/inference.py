@@ -0,0 +1,255 @@
+"""
+Where model inference runs (INFERENCE_EXECUTOR).
+
+  - "inline":  in the request's own process (the default, and what tests use)
+  - "process": in a pool of INFERENCE_POOL_WORKERS processes, each of which
+               loads the model once at start. Inputs are handed over as
+               shared-memory arrays, so a long prediction holds the GIL of a
+               pool process instead of stalling every other request thread of
+               the web worker.
+
+Either way :func:`get_model` returns ``(model, error)`` where ``model`` has
+the usual ``predict`` (and, for tabular models, ``predict_components``); with
+the process backend it is a proxy whose ``predict`` runs in the pool. Feature
+rows are still assembled by the caller: that is cheap list building, the
+model's forward pass is what moves.
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Optional, Tuple
+
+from django.conf import settings
+
+from . import aqi_model
+
+INLINE = 'inline'
+PROCESS = 'process'
+
+# Set in the pool processes before django.setup(), so ApiConfig.ready() can tell them apart
+WORKER_ENV = 'AQI_INFERENCE_WORKER'
+
+
+class InlineExecutor:
+    name = INLINE
+
+    def get_model(self) -> Tuple[Any, Optional[str]]:
+        return aqi_model.get_model()
+
+    def warmup(self) -> bool:
+        return aqi_model.warmup()
+
+    def shutdown(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return {'backend': self.name}
+
+
+# --- Process pool (the functions below run in the pool processes) ---
+
+def is_pool_worker() -> bool:
+    return os.environ.get(WORKER_ENV) == '1'
+
+
+def _init_worker() -> None:
+    import django
+    os.environ[WORKER_ENV] = '1'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myapp.settings')
+    django.setup()
+    aqi_model.warmup()
+
+
+def _describe() -> dict:
+    model, error = aqi_model.get_model()
+    if model is None:
+        raise RuntimeError(error or "AQI model not loaded")
+    return {
+        'pid': os.getpid(),
+        'format': getattr(model, 'format', 'keras'),
+        'n_features': getattr(model, 'n_features', None),
+        'metadata': getattr(model, 'metadata', None),
+    }
+
+
+def _attach(name: str):
+    from multiprocessing import resource_tracker, shared_memory
+    shm = shared_memory.SharedMemory(name=name)
+    # The parent owns (and unlinks) the block; don't let this process's tracker claim it
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+def _predict_shared(name: str, shape: Tuple[int, ...], dtype: str):
+    import numpy as np
+    model, error = aqi_model.get_model()
+    if model is None:
+        raise RuntimeError(error or "AQI model not loaded")
+    shm = _attach(name)
+    try:
+        X = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        y = np.array(model.predict(X, verbose=0))
+        del X
+    finally:
+        shm.close()
+    return y
+
+
+class _RemotePredictor:
+    """``predict`` that ships X to the pool through shared memory."""
+
+    def __init__(self, executor: 'PoolExecutor', info: dict):
+        self._executor = executor
+        self.format = info['format']
+        self.n_features = info['n_features']
+
+    def predict(self, X, verbose: int = 0):
+        return self._executor.predict(X)
+
+
+class PoolExecutor:
+    name = PROCESS
+
+    def __init__(self, workers: int, timeout: float):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.calls = 0
+        self.restarts = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._model: Any = None
+        self._info: Optional[dict] = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    import multiprocessing
+                    # spawn: the web process has threads (batcher, HTTP pools) that fork would not copy
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn'),
+                        initializer=_init_worker,
+                    )
+        return self._pool
+
+    def _discard(self, pool: ProcessPoolExecutor, terminate: bool) -> None:
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+                self.restarts += 1
+        if terminate:
+            # shutdown() never stops a running task, so a hung worker would keep its slot
+            for process in list((getattr(pool, '_processes', None) or {}).values()):
+                process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, fn, *args):
+        pool = self._get_pool()
+        try:
+            return pool.submit(fn, *args).result(timeout=self.timeout)
+        except BrokenProcessPool:
+            # A worker died (OOM, segfault): start a fresh pool for the next call
+            self._discard(pool, terminate=False)
+            raise
+        except FutureTimeout:
+            # A worker is stuck past INFERENCE_TIMEOUT: replace the pool rather than queue behind it
+            self._discard(pool, terminate=True)
+            raise
+
+    def get_model(self) -> Tuple[Any, Optional[str]]:
+        if self._model is not None:
+            return self._model, None
+        try:
+            info = self._submit(_describe)
+        except Exception as e:
+            return None, str(e)
+        with self._lock:
+            if self._model is None:
+                self._info = info
+                if info['format'] == 'joblib':
+                    from .model_formats import JoblibModel
+                    # Rows are built here from the stored feature order; the estimator runs in the pool
+                    self._model = JoblibModel(_RemotePredictor(self, info), info['metadata'])
+                else:
+                    self._model = _RemotePredictor(self, info)
+        return self._model, None
+
+    def predict(self, X):
+        from multiprocessing import shared_memory
+
+        import numpy as np
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        self.calls += 1
+        shm = shared_memory.SharedMemory(create=True, size=max(1, X.nbytes))
+        try:
+            np.ndarray(X.shape, dtype=X.dtype, buffer=shm.buf)[:] = X
+            return self._submit(_predict_shared, shm.name, X.shape, X.dtype.str)
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def warmup(self) -> bool:
+        model, _ = self.get_model()
+        return model is not None
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+            self._model = None
+            self._info = None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            'backend': self.name,
+            'workers': self.workers,
+            'started': self._pool is not None,
+            'calls': self.calls,
+            'restarts': self.restarts,
+            'model': {k: v for k, v in (self._info or {}).items() if k != 'metadata'} or None,
+        }
+
+
+_executor: Any = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    backend = getattr(settings, 'INFERENCE_EXECUTOR', INLINE)
+    if _executor is None or _executor.name != backend:
+        with _executor_lock:
+            if _executor is None or _executor.name != backend:
+                if _executor is not None:
+                    _executor.shutdown()
+                if backend == PROCESS:
+                    _executor = PoolExecutor(
+                        int(getattr(settings, 'INFERENCE_POOL_WORKERS', 2)),
+                        float(getattr(settings, 'INFERENCE_TIMEOUT', 30)),
+                    )
+                elif backend == INLINE:
+                    _executor = InlineExecutor()
+                else:
+                    raise ValueError(f"Unknown INFERENCE_EXECUTOR: {backend}")
+    return _executor
+
+
+def get_model() -> Tuple[Any, Optional[str]]:
+    return get_executor().get_model()
+
+
+def warmup() -> bool:
+    return get_executor().warmup()
+
+
+def warmup_in_background() -> threading.Thread:
+    thread = threading.Thread(target=warmup, name='inference-warmup', daemon=True)
+    thread.start()
+    return thread
+
+
+def stats() -> dict:
+    return get_executor().stats()
@@ -0,0 +1,397 @@
+"""
+Batched OpenAQ -> Location ingestion.
+
+Pages are fetched concurrently by a small, rate-limited thread pool
+(:func:`iter_pages`) and handed to a single writer. Each OpenAQ page is normalized
+into Location rows and written with a single ``bulk_create(update_conflicts=True)``
+(INSERT ... ON CONFLICT DO UPDATE) instead of one update_or_create round trip per
+location.
+
+Long runs should go through ``manage.py ingest_locations`` (checkpointed and
+resumable, see :func:`ingest_locations_resumable`) rather than the HTTP endpoint.
+"""
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone as dt_timezone
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.gis.geos import Point
+from django.utils import timezone
+
+from . import spatial
+from .models import IngestionCheckpoint, Location
+
+# Tamil Nadu / Kerala bounding box used by /api/aqi/insert/ (min_lon, min_lat, max_lon, max_lat)
+DEFAULT_BBOX = (76.1667, 7.9119, 80.8167, 13.6453)
+PAGE_LIMIT = 100
+UPSERT_FIELDS = ['latitude', 'longitude', 'geom']
+LOCATIONS_SOURCE = 'openaq.locations'
+
+_MISSING = object()
+
+
+@dataclass
+class IngestStats:
+    pages: int = 0
+    rows: int = 0
+    skipped: int = 0  # unchanged locations not rewritten
+    seconds: float = 0.0
+    watermark: Optional[datetime] = None  # latest upstream "last seen" among fetched locations
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'pages': self.pages,
+            'rows': self.rows,
+            'skipped': self.skipped,
+            'seconds': round(self.seconds, 3),
+            'rows_per_sec': round(self.rows_per_sec, 1),
+        }
+
+
+def openaq_field(obj: Any, *names: str):
+    """First non-None attribute/key among names (OpenAQ SDK objects vary by version)."""
+    for name in names:
+        value = obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+        if value is not None:
+            return value
+    return None
+
+
+def extract_location(loc: Any) -> Optional[Tuple[int, Optional[float], Optional[float]]]:
+    """Return (location_id, latitude, longitude) from an OpenAQ location, or None without an id."""
+    loc_id = openaq_field(loc, 'id', 'locationId', 'location_id')
+    if loc_id is None:
+        # If we can't determine an ID, skip this record to avoid integrity errors
+        return None
+
+    # Coordinates can be nested or flat depending on SDK
+    coords = openaq_field(loc, 'coordinates', 'coord')
+    source = coords if coords is not None else loc
+    latitude = openaq_field(source, 'latitude', 'lat')
+    longitude = openaq_field(source, 'longitude', 'lon')
+    try:
+        latitude = float(latitude) if latitude is not None else None
+        longitude = float(longitude) if longitude is not None else None
+    except (TypeError, ValueError):
+        latitude = longitude = None
+    return int(loc_id), latitude, longitude
+
+
+def parse_openaq_datetime(value: Any) -> Optional[datetime]:
+    """OpenAQ datetimes come as ISO strings or {utc, local} objects; return aware UTC."""
+    if value is not None and not isinstance(value, (str, datetime)):
+        value = openaq_field(value, 'utc')
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=dt_timezone.utc)
+    return None
+
+
+def extract_last_seen(loc: Any) -> Optional[datetime]:
+    """OpenAQ v3 `datetimeLast` (when the location last reported)."""
+    return parse_openaq_datetime(openaq_field(loc, 'datetime_last', 'datetimeLast', 'last_updated', 'lastUpdated'))
+
+
+def page_results(response: Any) -> List[Any]:
+    """OpenAQ SDK may return a list, or an object with a .results list."""
+    locations = getattr(response, 'results', None)
+    if locations is None:
+        locations = response if isinstance(response, list) else []
+    return list(locations)
+
+
+def normalize_page(locations: Iterable[Any]) -> List[Location]:
+    """Build unsaved Location rows for one page, de-duplicated by id (last one wins)."""
+    rows = {}
+    for loc in locations:
+        extracted = extract_location(loc)
+        if extracted is None:
+            continue
+        loc_id, latitude, longitude = extracted
+        geom = None
+        if latitude is not None and longitude is not None:
+            # x=lon, y=lat
+            geom = Point(longitude, latitude, srid=4326)
+        rows[loc_id] = Location(location_id=loc_id, latitude=latitude, longitude=longitude, geom=geom)
+    return list(rows.values())
+
+
+def filter_changed(rows: List[Location]) -> List[Location]:
+    """Drop rows whose stored coordinates already match (one query per page)."""
+    if not rows:
+        return rows
+    existing = {
+        loc_id: (lat, lon)
+        for loc_id, lat, lon in Location.objects.filter(
+            location_id__in=[r.location_id for r in rows]
+        ).values_list('location_id', 'latitude', 'longitude')
+    }
+    return [r for r in rows if existing.get(r.location_id, _MISSING) != (r.latitude, r.longitude)]
+
+
+def upsert_locations(rows: List[Location]) -> int:
+    """Insert or update rows in one statement; returns the number of rows written."""
+    if not rows:
+        return 0
+    Location.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['location_id'],
+        update_fields=UPSERT_FIELDS,
+    )
+    return len(rows)
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a token is available, then take it."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def default_bucket() -> TokenBucket:
+    return TokenBucket(
+        getattr(settings, 'OPENAQ_RATE_PER_SEC', 1.0),
+        getattr(settings, 'OPENAQ_RATE_BURST', 5),
+    )
+
+
+_DONE = object()
+
+
+def iter_pages(client: Any, bbox: Optional[Tuple[float, float, float, float]] = None, limit: int = PAGE_LIMIT,
+               workers: Optional[int] = None, bucket: Optional[TokenBucket] = None,
+               start_page: int = 1) -> Iterator[Tuple[int, List[Any]]]:
+    """
+    Yield (page number, locations) for every non-empty OpenAQ page.
+
+    Pages are fetched by a bounded pool of producer threads, each taking the next
+    page number and a rate-limit token before calling OpenAQ; results flow to the
+    caller (the single DB writer) through a bounded queue, so fetching overlaps
+    with writing. Once a page comes back empty no higher page numbers are handed
+    out, and claimed pages above the lowest empty one are dropped; claimed pages
+    below it are always fetched, so a slow worker cannot lose the last non-empty
+    page. Pages may arrive out of order. A fetch error stops all producers and is
+    re-raised to the caller.
+    """
+    workers = max(1, int(workers if workers is not None else getattr(settings, 'OPENAQ_INGEST_WORKERS', 4)))
+    bucket = bucket or default_bucket()
+    results: "queue.Queue" = queue.Queue(maxsize=workers * 2)
+    cancelled = threading.Event()  # consumer went away or a fetch failed: drop everything
+    counter_lock = threading.Lock()
+    next_page = [start_page]
+    first_empty: List[Optional[int]] = [None]  # lowest page seen empty (under counter_lock)
+
+    def beyond_end(page: int) -> bool:
+        with counter_lock:
+            return first_empty[0] is not None and page > first_empty[0]
+
+    def put(item) -> bool:
+        # Bounded put; data pages are abandoned only once the run is cancelled
+        while True:
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                if cancelled.is_set() and isinstance(item, tuple):
+                    return False
+
+    def produce():
+        try:
+            while not cancelled.is_set():
+                with counter_lock:
+                    if first_empty[0] is not None:
+                        break
+                    page = next_page[0]
+                    next_page[0] += 1
+                bucket.acquire()
+                if cancelled.is_set():
+                    break
+                if beyond_end(page):
+                    # Another worker already saw an earlier page empty
+                    break
+                kwargs = {'limit': limit, 'page': page}
+                if bbox is not None:
+                    kwargs['bbox'] = bbox
+                locations = page_results(client.locations.list(**kwargs))
+                if not locations:
+                    with counter_lock:
+                        if first_empty[0] is None or page < first_empty[0]:
+                            first_empty[0] = page
+                    break
+                if not put((page, locations)):
+                    break
+        except BaseException as e:
+            cancelled.set()
+            put(e)
+        finally:
+            put(_DONE)
+
+    threads = [threading.Thread(target=produce, name=f'openaq-page-{i}', daemon=True) for i in range(workers)]
+    for t in threads:
+        t.start()
+    try:
+        remaining = workers
+        while remaining:
+            item = results.get()
+            if item is _DONE:
+                remaining -= 1
+            elif isinstance(item, BaseException):
+                raise item
+            else:
+                yield item
+    finally:
+        cancelled.set()
+        # Unblock producers still waiting on a full queue
+        while any(t.is_alive() for t in threads):
+            try:
+                results.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for t in threads:
+            t.join()
+
+
+def seen_since(locations: List[Any], since: Optional[datetime]) -> List[Any]:
+    """Locations that reported after `since` (or carry no last-seen time, so can't be ruled out)."""
+    if since is None:
+        return list(locations)
+    kept = []
+    for loc in locations:
+        seen = extract_last_seen(loc)
+        if seen is None or seen > since:
+            kept.append(loc)
+    return kept
+
+
+def ingest_locations(client: Any, bbox: Optional[Tuple[float, float, float, float]] = None, limit: int = PAGE_LIMIT,
+                     workers: Optional[int] = None, bucket: Optional[TokenBucket] = None, start_page: int = 1,
+                     only_changed: bool = False, since: Optional[datetime] = None,
+                     on_page: Optional[Callable[[int, IngestStats], None]] = None) -> IngestStats:
+    """
+    Fetch OpenAQ location pages concurrently (optionally within bbox) and bulk-upsert each page.
+
+    since skips, without touching the DB, locations whose last-seen time is not
+    after it (the previous completed run's watermark); only_changed then skips
+    the remaining locations whose stored coordinates are already current;
+    on_page(page, stats) is called after each page is written (checkpointing).
+    """
+    stats = IngestStats()
+    started = time.perf_counter()
+    try:
+        for page, locations in iter_pages(client, bbox=bbox, limit=limit, workers=workers, bucket=bucket,
+                                          start_page=start_page):
+            for loc in locations:
+                seen = extract_last_seen(loc)
+                if seen is not None and (stats.watermark is None or seen > stats.watermark):
+                    stats.watermark = seen
+            fresh = seen_since(locations, since)
+            stats.skipped += len(locations) - len(fresh)
+            rows = normalize_page(fresh)
+            if only_changed:
+                changed = filter_changed(rows)
+                stats.skipped += len(rows) - len(changed)
+                rows = changed
+            stats.rows += upsert_locations(rows)
+            stats.pages += 1
+            if on_page is not None:
+                on_page(page, stats)
+    finally:
+        stats.seconds = time.perf_counter() - started
+        # bulk_create bypasses post_save, so drop the nearest-station index explicitly
+        spatial.invalidate()
+    return stats
+
+
+def bbox_scope(bbox: Optional[Tuple[float, float, float, float]]) -> str:
+    """Checkpoint scope key for a bbox (or the whole catalogue)."""
+    return 'all' if bbox is None else ','.join(f'{v:g}' for v in bbox)
+
+
+def ingest_locations_resumable(client: Any, bbox: Optional[Tuple[float, float, float, float]] = None,
+                               restart: bool = False, limit: int = PAGE_LIMIT,
+                               **kwargs) -> Tuple[IngestStats, IngestionCheckpoint]:
+    """
+    Checkpointed, incremental ingestion.
+
+    Resumes after the last contiguous completed page of an interrupted run.
+    Locations whose upstream last-seen time is not after the watermark of the
+    previous completed run are skipped without a DB read: that run already wrote
+    them as they were. The rest are only rewritten if their coordinates changed.
+    restart ignores both the checkpoint and the watermark (full refresh).
+
+    Pages complete out of order, so the checkpoint only advances over a gap-free
+    prefix; after a crash at most `workers` pages are fetched again. last_page
+    counts pages of `limit` locations, so resuming with a different limit raises
+    ValueError (use restart).
+
+    The new watermark is the latest last-seen time of the run, capped at its
+    start time, so a location that reports while the run is under way is
+    never skipped by the next one.
+    """
+    checkpoint, _ = IngestionCheckpoint.objects.get_or_create(source=LOCATIONS_SOURCE, scope=bbox_scope(bbox))
+    resuming = not (restart or checkpoint.completed or checkpoint.started_at is None)
+    if resuming and checkpoint.page_limit is not None and checkpoint.page_limit != limit:
+        raise ValueError(
+            f"Interrupted run used {checkpoint.page_limit} locations per page; resume with the same "
+            f"limit or restart"
+        )
+    if not resuming:
+        checkpoint.last_page = 0
+        checkpoint.completed = False
+        checkpoint.started_at = timezone.now()
+        checkpoint.page_limit = limit
+        checkpoint.save()
+
+    done = set()
+    previous_watermark = checkpoint.watermark
+
+    def on_page(page: int, stats: IngestStats):
+        done.add(page)
+        advanced = False
+        while checkpoint.last_page + 1 in done:
+            done.discard(checkpoint.last_page + 1)
+            checkpoint.last_page += 1
+            advanced = True
+        if advanced:
+            checkpoint.save(update_fields=['last_page', 'updated_at'])
+
+    stats = ingest_locations(client, bbox=bbox, limit=limit, start_page=checkpoint.last_page + 1, only_changed=True,
+                             since=None if restart else previous_watermark, on_page=on_page, **kwargs)
+    checkpoint.completed = True
+    if stats.watermark is not None:
+        watermark = min(stats.watermark, checkpoint.started_at)
+        if previous_watermark is None or watermark > previous_watermark:
+            checkpoint.watermark = watermark
+    checkpoint.save()
+    return stats, checkpoint
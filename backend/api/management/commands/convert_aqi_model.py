@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import aqi_model
+from api.numpy_model import convert_keras_h5
+
+
+class Command(BaseCommand):
+    help = "Convert the Keras AQI model (.h5) to NumPy weights (.npz) for the TensorFlow-free backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--input', default=None, help="Keras .h5 file (default: AQI_MODEL_PATH or Models/AQI_prediction_model.h5)")
+        parser.add_argument('--output', default=None, help="Output .npz (default: next to the input)")
+
+    def handle(self, *args, **options):
+        source = options['input'] or aqi_model.model_path()
+        target = options['output'] or aqi_model.weights_path(source)
+        try:
+            model = convert_keras_h5(source)
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f"Cannot convert {source}: {e}")
+        model.save(target)
+        layers = ", ".join(
+            f"{layer['type']}({layer.get('activation')})" if 'activation' in layer else layer['type']
+            for layer in model.spec
+        )
+        self.stdout.write(self.style.SUCCESS(f"Wrote {target}: {layers}"))
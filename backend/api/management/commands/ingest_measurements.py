@@ -0,0 +1,46 @@
+import decouple
+from django.core.management.base import BaseCommand, CommandError
+
+from api.measurements import ingest_measurements
+
+
+class Command(BaseCommand):
+    help = (
+        "Load per-station measurements into Measurement (COPY on PostgreSQL, "
+        "bulk_create elsewhere), deduplicated on (location, parameter, last_updated)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', choices=['openweather', 'openaq'], default='openweather')
+        parser.add_argument('--locations', type=int, nargs='*', default=None, help="Location ids (default: all)")
+        parser.add_argument('--hours', type=int, default=24,
+                            help="History window for stations with no stored readings (openweather)")
+        parser.add_argument('--workers', type=int, default=8, help="Concurrent upstream fetches")
+        parser.add_argument('--batch-size', type=int, default=None, help="Rows per COPY/bulk_create batch")
+
+    def handle(self, *args, **options):
+        kwargs = {}
+        if options['source'] == 'openweather':
+            api_key = decouple.config("OPENWEATHER_API", default=None) or decouple.config("OPENWHEATHER_API", default=None)
+            if not api_key:
+                raise CommandError("OPENWEATHER_API is not set in backend/.env")
+            kwargs['api_key'] = api_key
+        else:
+            from openaq import OpenAQ
+            api_key = decouple.config("OPENAQ_API", default=None)
+            if not api_key:
+                raise CommandError("OPENAQ_API is not set in backend/.env")
+            kwargs['client'] = OpenAQ(api_key)
+
+        stats, failures = ingest_measurements(
+            options['source'],
+            location_ids=options['locations'],
+            hours=options['hours'],
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            **kwargs,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {stats.rows} measurements in {stats.pages} batches "
+            f"({stats.seconds:.1f}s, {stats.rows_per_sec:.0f} rows/sec); {failures} stations failed"
+        ))
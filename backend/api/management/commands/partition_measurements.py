@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api import timeseries
+
+
+class Command(BaseCommand):
+    help = (
+        "PostgreSQL only: convert api_measurement to monthly range partitions on "
+        "last_updated (--convert), or pre-create upcoming monthly partitions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true',
+                            help="Rebuild api_measurement as a partitioned table (copies existing rows)")
+        parser.add_argument('--months-ahead', type=int, default=3, help="Future months to pre-create")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Measurement partitioning requires PostgreSQL")
+
+        if options['convert']:
+            if timeseries.is_partitioned(refresh=True):
+                self.stdout.write("api_measurement is already partitioned")
+            else:
+                moved = timeseries.convert_to_partitioned(options['months_ahead'])
+                self.stdout.write(self.style.SUCCESS(f"Converted api_measurement to monthly partitions ({moved} rows moved)"))
+                return
+
+        if not timeseries.is_partitioned(refresh=True):
+            raise CommandError("api_measurement is not partitioned; run with --convert first")
+        now = datetime.now(dt_timezone.utc)
+        count = timeseries.ensure_partitions(now, now + timedelta(days=31 * options['months_ahead']))
+        self.stdout.write(self.style.SUCCESS(f"Ensured {count} monthly partitions"))
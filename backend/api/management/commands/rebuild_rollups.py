@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api import rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute HourlyRollup/DailyRollup from Measurement (one-off backfill; loads keep them current)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--locations', type=int, nargs='*', default=None, help="Location ids (default: all)")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = rollups.rebuild(options['locations'])
+        self.stdout.write(self.style.SUCCESS(f"Rolled up {count} measurements"))
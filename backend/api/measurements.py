@@ -0,0 +1,319 @@
+"""
+Measurement ingestion: pull per-location readings and bulk-load them.
+
+Sources:
+  - "openweather": OpenWeather Air Pollution history at the station coordinates
+  - "openaq": the station's latest sensor readings from OpenAQ
+
+Rows are streamed into Measurement in large batches. On PostgreSQL each batch is
+COPY'd into a temporary staging table and moved over with a single
+``INSERT ... SELECT ... ON CONFLICT DO NOTHING``, so there is no per-row ORM
+overhead; elsewhere (SQLite) ``bulk_create(ignore_conflicts=True)`` is used.
+Either way rows are deduplicated on (location, parameter, last_updated), and the
+rows that were actually new are folded into the hourly/daily rollups
+(api/rollups.py) in the same transaction.
+"""
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import islice
+from typing import Any, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+
+from . import rollups, timeseries
+from .ingestion import IngestStats, TokenBucket, default_bucket, openaq_field, page_results, parse_openaq_datetime
+from .models import Location, Measurement
+from .upstream import UpstreamError, get_json
+
+HISTORY_ENDPOINT = 'https://api.openweathermap.org/data/2.5/air_pollution/history'
+
+# OpenWeather component keys (stored as-is)
+FEATURE_KEYS = ['co', 'no', 'no2', 'o3', 'so2', 'pm2_5', 'pm10', 'nh3']
+# OpenAQ readings keep their own namespace ("openaq.pm25", ...): their units and
+# timestamps differ from OpenWeather's, so they must not share dedup keys,
+# rollups or the predict_aqi history store with OpenWeather rows.
+OPENAQ_PREFIX = 'openaq.'
+OPENWEATHER_UNIT = 'μg/m³'
+AQI_PARAMETER = 'aqi'  # OpenWeather's 1-5 index, stored alongside the components
+
+# (location_id, parameter, value, unit, last_updated)
+MeasurementRow = Tuple[int, str, Optional[float], Optional[str], datetime]
+
+COLUMNS = ('location_id', 'parameter', 'value', 'unit', 'last_updated')
+
+
+def _batch_size() -> int:
+    return int(getattr(settings, 'MEASUREMENT_BATCH_SIZE', 50000))
+
+
+def _chunks(rows: Iterable[MeasurementRow], size: int) -> Iterator[List[MeasurementRow]]:
+    it = iter(rows)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# --- Loading ---
+
+_STAGE_SQL = """
+    CREATE TEMPORARY TABLE IF NOT EXISTS measurement_stage (
+        location_id integer,
+        parameter varchar(50),
+        value double precision,
+        unit varchar(20),
+        last_updated timestamptz
+    ) ON COMMIT DELETE ROWS
+"""
+
+# DISTINCT ON dedups within the batch (ON CONFLICT cannot touch a row twice);
+# the join drops readings for stations that are not in Location.
+_MERGE_SQL = """
+    INSERT INTO api_measurement (location_id, parameter, value, unit, last_updated)
+    SELECT DISTINCT ON (s.location_id, s.parameter, s.last_updated)
+           s.location_id, s.parameter, s.value, s.unit, s.last_updated
+    FROM measurement_stage s
+    JOIN api_location l ON l.location_id = s.location_id
+    ON CONFLICT (location_id, parameter, last_updated) DO NOTHING
+    RETURNING location_id, parameter, value, last_updated
+"""
+
+
+def _copy_batch(rows: List[MeasurementRow]) -> int:
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(_STAGE_SQL)
+        raw = cursor.cursor  # psycopg 3 cursor underneath Django's wrapper
+        with raw.copy(f"COPY measurement_stage ({', '.join(COLUMNS)}) FROM STDIN") as copy:
+            for row in rows:
+                copy.write_row(row)
+        cursor.execute(_MERGE_SQL)
+        # RETURNING yields only rows that were actually new, so rollups never double count
+        inserted = cursor.fetchall()
+        rollups.apply_rows(inserted)
+        return len(inserted)
+
+
+def _bulk_create_batch(rows: List[MeasurementRow]) -> int:
+    known = set(Location.objects.filter(
+        location_id__in={r[0] for r in rows}
+    ).values_list('location_id', flat=True))
+    # Dedup within the batch, then against what is already stored, so the
+    # rollups only see new readings (ignore_conflicts cannot report them)
+    fresh = {(r[0], r[1], r[4]): r for r in rows if r[0] in known}
+    if fresh:
+        existing = Measurement.objects.filter(
+            location_id__in={k[0] for k in fresh},
+            last_updated__gte=min(k[2] for k in fresh),
+            last_updated__lte=max(k[2] for k in fresh),
+        ).values_list('location_id', 'parameter', 'last_updated')
+        for key in existing:
+            fresh.pop(key, None)
+    objs = [
+        Measurement(location_id=loc_id, parameter=param, value=value, unit=unit, last_updated=ts)
+        for loc_id, param, value, unit, ts in fresh.values()
+    ]
+    with transaction.atomic():
+        Measurement.objects.bulk_create(objs, ignore_conflicts=True, batch_size=5000)
+        rollups.apply_rows((o.location_id, o.parameter, o.value, o.last_updated) for o in objs)
+    return len(objs)
+
+
+def load_measurements(rows: Iterable[MeasurementRow], batch_size: Optional[int] = None) -> IngestStats:
+    """Stream rows into Measurement in batches; rows without a timestamp are dropped."""
+    stats = IngestStats()
+    started = time.perf_counter()
+    use_copy = connection.vendor == 'postgresql'
+    valid = (r for r in rows if r[4] is not None and r[1])
+    for chunk in _chunks(valid, batch_size or _batch_size()):
+        if use_copy and timeseries.is_partitioned():
+            # Route rows into monthly partitions rather than the DEFAULT one
+            timeseries.ensure_partitions(min(r[4] for r in chunk), max(r[4] for r in chunk))
+        stats.rows += _copy_batch(chunk) if use_copy else _bulk_create_batch(chunk)
+        stats.pages += 1
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+
+# --- Sources ---
+
+def _from_unix(ts: Any) -> Optional[datetime]:
+    try:
+        return datetime.fromtimestamp(int(ts), tz=dt_timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None
+
+
+def rows_from_openweather(location_id: int, payload: dict) -> List[MeasurementRow]:
+    """Flatten an OpenWeather air_pollution(/history) payload into rows."""
+    rows: List[MeasurementRow] = []
+    for item in payload.get('list') or []:
+        ts = _from_unix(item.get('dt'))
+        if ts is None:
+            continue
+        comps = item.get('components') or {}
+        for key in FEATURE_KEYS:
+            if comps.get(key) is not None:
+                rows.append((location_id, key, float(comps[key]), OPENWEATHER_UNIT, ts))
+        aqi = (item.get('main') or {}).get('aqi')
+        if aqi is not None:
+            rows.append((location_id, AQI_PARAMETER, float(aqi), None, ts))
+    return rows
+
+
+def openweather_history_params(lat: float, lon: float, start: datetime, end: datetime, api_key: str) -> dict:
+    return {
+        'lat': lat,
+        'lon': lon,
+        'start': int(start.timestamp()),
+        'end': int(end.timestamp()),
+        'appid': api_key,
+    }
+
+
+def fetch_openweather_history(location_id: int, lat: float, lon: float, start: datetime, end: datetime,
+                              api_key: str) -> List[MeasurementRow]:
+    params = openweather_history_params(lat, lon, start, end, api_key)
+    payload = get_json(HISTORY_ENDPOINT, params, timeout=getattr(settings, 'UPSTREAM_HISTORY_TIMEOUT', 15))
+    return rows_from_openweather(location_id, payload)
+
+
+def fetch_openaq_latest(client: Any, location_id: int, bucket: Optional[TokenBucket] = None) -> List[MeasurementRow]:
+    """Latest reading of every sensor at an OpenAQ location (two rate-limited calls)."""
+    if bucket is not None:
+        bucket.acquire()
+    sensors = {}
+    for sensor in page_results(client.locations.sensors(location_id)):
+        parameter = openaq_field(sensor, 'parameter')
+        name = openaq_field(parameter, 'name') if parameter is not None else None
+        if name is None:
+            continue
+        name = str(name).lower()
+        sensors[openaq_field(sensor, 'id')] = (OPENAQ_PREFIX + name, openaq_field(parameter, 'units'))
+
+    if bucket is not None:
+        bucket.acquire()
+    rows: List[MeasurementRow] = []
+    for reading in page_results(client.locations.latest(location_id)):
+        meta = sensors.get(openaq_field(reading, 'sensors_id', 'sensorsId'))
+        ts = parse_openaq_datetime(openaq_field(reading, 'datetime'))
+        value = openaq_field(reading, 'value')
+        if meta is None or ts is None:
+            continue
+        rows.append((location_id, meta[0], float(value) if value is not None else None, meta[1], ts))
+    return rows
+
+
+# --- Pipeline ---
+
+def _station_coords(location_ids: Optional[Sequence[int]]) -> List[Tuple[int, float, float]]:
+    qs = Location.objects.all()
+    if location_ids:
+        qs = qs.filter(location_id__in=location_ids)
+    out = []
+    for loc_id, lat, lon, geom in qs.values_list('location_id', 'latitude', 'longitude', 'geom').iterator():
+        if geom is not None:
+            lat, lon = geom.y, geom.x
+        if lat is None or lon is None:
+            continue
+        out.append((loc_id, float(lat), float(lon)))
+    return out
+
+
+def _latest_per_location(location_ids: Sequence[int]) -> dict:
+    """Newest OpenWeather reading per station (OpenAQ rows run on their own clock)."""
+    return dict(
+        Measurement.objects.filter(location_id__in=location_ids, parameter__in=FEATURE_KEYS + [AQI_PARAMETER])
+        .values('location_id')
+        .annotate(latest=Max('last_updated'))
+        .values_list('location_id', 'latest')
+    )
+
+
+def ingest_measurements(source: str, location_ids: Optional[Sequence[int]] = None, hours: int = 24,
+                        end: Optional[datetime] = None, api_key: Optional[str] = None, client: Any = None,
+                        workers: int = 8, batch_size: Optional[int] = None) -> Tuple[IngestStats, int]:
+    """
+    Fetch measurements for stations concurrently and stream them into the loader.
+
+    For "openweather" each station's window starts just after its newest stored
+    OpenWeather reading (or `hours` back for new stations), so reruns only fetch
+    the tail; once loaded, the windows are recorded in the history_store ledger
+    so predict_aqi does not fetch them again.
+    At most ``2 * workers`` stations are in flight or waiting to be loaded, so
+    memory stays bounded however many stations there are.
+    Returns (load stats, number of stations whose fetch failed).
+    """
+    stations = _station_coords(location_ids)
+    end = end or datetime.now(dt_timezone.utc)
+
+    if source == 'openweather':
+        if not api_key:
+            raise ValueError("OpenWeather API key required")
+        latest = _latest_per_location([s[0] for s in stations])
+        default_start = end - timedelta(hours=hours)
+        fetched: List[Tuple[int, datetime]] = []
+
+        def fetch(station):
+            loc_id, lat, lon = station
+            start = latest.get(loc_id)
+            start = start + timedelta(seconds=1) if start is not None else default_start
+            if start >= end:
+                return []
+            try:
+                station_rows = fetch_openweather_history(loc_id, lat, lon, start, end, api_key)
+            except (UpstreamError, TypeError, ValueError, AttributeError):
+                return None
+            fetched.append((loc_id, start))
+            return station_rows
+    elif source == 'openaq':
+        if client is None:
+            raise ValueError("OpenAQ client required")
+        bucket = default_bucket()
+
+        def fetch(station):
+            try:
+                return fetch_openaq_latest(client, station[0], bucket)
+            except Exception:
+                return None
+    else:
+        raise ValueError(f"Unknown measurement source: {source}")
+
+    failures = 0
+
+    def rows() -> Iterator[MeasurementRow]:
+        nonlocal failures
+        pool_size = max(1, workers)
+        window = pool_size * 2
+        todo = iter(stations)
+        pending = set()
+        with ThreadPoolExecutor(max_workers=pool_size) as pool:
+            try:
+                while True:
+                    # Top the window up; pool.map would submit (and buffer) every station at once
+                    for station in islice(todo, window - len(pending)):
+                        pending.add(pool.submit(fetch, station))
+                    if not pending:
+                        return
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        station_rows = future.result()
+                        if station_rows is None:
+                            failures += 1
+                            continue
+                        yield from station_rows
+            finally:
+                # Loader failed or stopped early: don't start the rest
+                for future in pending:
+                    future.cancel()
+
+    stats = load_measurements(rows(), batch_size=batch_size)
+    if source == 'openweather':
+        from . import history_store  # imports this module
+        # Only now are the fetched windows stored in full
+        for loc_id, start in fetched:
+            history_store.record_fetched(loc_id, start, end)
+    return stats, failures
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-17 10:05
+
+from django.db import migrations
+
+# Nearest-station queries order by `geom::geography <-> point` so distances are
+# true metres; that needs a GiST index on the geography expression (the default
+# PointField index is on the geometry column). Rows that only carry lat/lon are
+# backfilled into geom so the KNN query can see them.
+FORWARD_SQL = [
+    """
+    UPDATE api_location
+    SET geom = ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)
+    WHERE geom IS NULL AND latitude IS NOT NULL AND longitude IS NOT NULL
+    """,
+    "CREATE INDEX IF NOT EXISTS api_location_geog_gist ON api_location USING GIST ((geom::geography))",
+]
+
+REVERSE_SQL = [
+    "DROP INDEX IF EXISTS api_location_geog_gist",
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        # PostGIS only; SQLite keeps using the in-process index (api/spatial.py)
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_geocodecache'),
+    ]
+
+    operations = [
+        migrations.RunPython(_run(FORWARD_SQL), _run(REVERSE_SQL)),
+    ]
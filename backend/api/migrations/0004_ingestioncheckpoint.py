@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-17 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_location_geom_knn_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=50)),
+                ('scope', models.CharField(default='all', max_length=100)),
+                ('last_page', models.IntegerField(default=0)),
+                ('completed', models.BooleanField(default=False)),
+                ('watermark', models.DateTimeField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('source', 'scope'), name='uniq_ingestion_checkpoint')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_ingestioncheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='measurement',
+            constraint=models.UniqueConstraint(fields=('location', 'parameter', 'last_updated'), name='uniq_measurement_point'),
+        ),
+    ]
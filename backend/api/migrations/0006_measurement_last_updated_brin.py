@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-17 13:10
+
+from django.db import migrations
+
+# Range scans by (location, parameter, last_updated) are served by the
+# uniq_measurement_point btree from 0005 (same column order). Time-window scans
+# across all stations get a BRIN index: last_updated grows with insertion order,
+# so BRIN stays tiny while still skipping almost every block.
+FORWARD_SQL = [
+    "CREATE INDEX IF NOT EXISTS api_measurement_last_updated_brin ON api_measurement USING BRIN (last_updated)",
+]
+
+REVERSE_SQL = [
+    "DROP INDEX IF EXISTS api_measurement_last_updated_brin",
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        # BRIN is PostgreSQL-only; SQLite relies on the btree indexes
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_measurement_uniq_measurement_point'),
+    ]
+
+    operations = [
+        migrations.RunPython(_run(FORWARD_SQL), _run(REVERSE_SQL)),
+    ]
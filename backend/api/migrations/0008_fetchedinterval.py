@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-17 15:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_hourlyrollup_dailyrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FetchedInterval',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=50)),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.location')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['location', 'source', 'start'], name='fetched_interval_lookup_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_fetchedinterval'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestioncheckpoint',
+            name='page_limit',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,171 @@
+"""
+Model artifact formats, detected from the file itself.
+
+  - "keras":  Keras HDF5 (``model_config`` root attribute + ``model_weights``)
+  - "joblib": the training notebook's format, a joblib-pickled estimator
+              (XGBRegressor in a TransformedTargetRegressor) stored as the
+              ``model_joblib`` dataset of an HDF5 file, with a JSON ``metadata``
+              attribute holding ``feature_columns``
+  - "numpy":  ``.npz`` weights from ``manage.py convert_aqi_model``
+
+:func:`register` adds a format (detector + loader); :func:`detect_format` and
+:func:`load` dispatch on it. Joblib artifacts are pickles: only load files you
+trust.
+"""
+import io
+import json
+import os
+from datetime import datetime, timezone as dt_timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .measurements import FEATURE_KEYS
+
+# name -> (detect(path, h5file or None) -> bool, load(path) -> model), in priority order
+FORMATS: Dict[str, Tuple[Callable[[str, Any], bool], Callable[[str], Any]]] = {}
+
+# One-hot training column prefix in the notebook's tabular features
+PARAMETER_PREFIX = 'parameter_'
+# OpenAQ parameter names that differ from our component keys
+OPENAQ_TO_COMPONENT = {'pm25': 'pm2_5'}
+
+
+def register(name: str, detect: Callable[[str, Any], bool]):
+    """Decorator registering ``load(path)`` for artifacts where ``detect(path, h5)`` is true."""
+    def decorator(load: Callable[[str], Any]):
+        FORMATS[name] = (detect, load)
+        return load
+    return decorator
+
+
+def detect_format(path: str) -> str:
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Model file not found at {path}")
+    h5 = None
+    if not path.endswith('.npz'):
+        import h5py
+        h5 = h5py.File(path, 'r')
+    try:
+        for name, (detect, _) in FORMATS.items():
+            if detect(path, h5):
+                return name
+    finally:
+        if h5 is not None:
+            h5.close()
+    raise ValueError(f"Unrecognised model format: {path}")
+
+
+def load(path: str, fmt: Optional[str] = None) -> Any:
+    fmt = fmt or detect_format(path)
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown model format: {fmt}")
+    return FORMATS[fmt][1](path)
+
+
+# --- Keras ---
+
+@register('keras', lambda path, h5: h5 is not None and 'model_config' in h5.attrs)
+def load_keras(path: str) -> Any:
+    # Lazy import TensorFlow/Keras
+    from tensorflow.keras.models import load_model  # type: ignore
+    return load_model(path)
+
+
+# --- NumPy (converted Keras) ---
+
+@register('numpy', lambda path, h5: h5 is None)
+def load_numpy(path: str) -> Any:
+    from .numpy_model import DenseModel
+    return DenseModel.load(path)
+
+
+# --- joblib-in-HDF5 (tabular XGBoost) ---
+
+class JoblibModel:
+    """
+    A tabular estimator trained on ``feature_columns`` (location_id, year,
+    month, day, hour, one-hot ``parameter_*``) that predicts one pollutant's
+    concentration per row.
+    """
+    format = 'joblib'
+
+    def __init__(self, estimator: Any, metadata: dict):
+        self.estimator = estimator
+        self.metadata = metadata
+        self.feature_columns: List[str] = list(metadata.get('feature_columns') or [])
+        if not self.feature_columns:
+            raise ValueError("joblib model metadata has no feature_columns")
+        self.n_features = len(self.feature_columns)
+        # component key -> one-hot column, for the parameters we report
+        self.parameters: Dict[str, str] = {}
+        for column in self.feature_columns:
+            if column.startswith(PARAMETER_PREFIX):
+                name = column[len(PARAMETER_PREFIX):]
+                key = OPENAQ_TO_COMPONENT.get(name, name)
+                if key in FEATURE_KEYS:
+                    self.parameters[key] = column
+
+    def predict(self, X, verbose: int = 0):
+        """Rows already in ``feature_columns`` order -> (n, 1) predictions."""
+        import numpy as np
+        return np.asarray(self.estimator.predict(np.asarray(X, dtype=float)), dtype=float).reshape(-1, 1)
+
+    def feature_rows(self, location_id: int, timestamps: List[Optional[int]]) -> Tuple[List[List[float]], List[Tuple[int, str]]]:
+        """One row per (timestamp, reported parameter) in stored column order, and its (row index, key)."""
+        rows: List[List[float]] = []
+        index: List[Tuple[int, str]] = []
+        for i, ts in enumerate(timestamps):
+            if ts is None:
+                continue
+            when = datetime.fromtimestamp(int(ts), tz=dt_timezone.utc)
+            base = {
+                'location_id': location_id,
+                'year': when.year,
+                'month': when.month,
+                'day': when.day,
+                'hour': when.hour,
+            }
+            for key, onehot in self.parameters.items():
+                values = dict(base)
+                values[onehot] = 1
+                rows.append([float(values.get(column, 0)) for column in self.feature_columns])
+                index.append((i, key))
+        return rows, index
+
+    def predict_components(self, location_id: int, timestamps: List[Optional[int]],
+                           predict: Optional[Callable[[Any], Any]] = None) -> List[List[Optional[float]]]:
+        """
+        Per timestamp, predicted concentrations in FEATURE_KEYS order (None where
+        not modelled). ``predict(rows)`` replaces ``self.predict`` (e.g. batching).
+        """
+        return self.predict_components_many([(location_id, timestamps)], predict)[0]
+
+    def predict_components_many(self, jobs: List[Tuple[int, List[Optional[int]]]],
+                                predict: Optional[Callable[[Any], Any]] = None) -> List[List[List[Optional[float]]]]:
+        """:meth:`predict_components` for several (location_id, timestamps) jobs in one predict call."""
+        import numpy as np
+        outs: List[List[List[Optional[float]]]] = []
+        rows: List[List[float]] = []
+        index: List[Tuple[int, int, str]] = []
+        for job, (location_id, timestamps) in enumerate(jobs):
+            outs.append([[None] * len(FEATURE_KEYS) for _ in timestamps])
+            job_rows, job_index = self.feature_rows(location_id, timestamps)
+            rows.extend(job_rows)
+            index.extend((job, i, key) for i, key in job_index)
+        if rows:
+            predictions = np.asarray((predict or self.predict)(rows)).reshape(-1).tolist()
+            for (job, i, key), value in zip(index, predictions):
+                outs[job][i][FEATURE_KEYS.index(key)] = value
+        return outs
+
+
+@register('joblib', lambda path, h5: h5 is not None and 'model_joblib' in h5)
+def load_joblib(path: str) -> JoblibModel:
+    import h5py
+    import joblib
+
+    with h5py.File(path, 'r') as f:
+        blob = f['model_joblib'][()]
+        raw_meta = f.attrs.get('metadata', '{}')
+    blob = blob.tobytes() if hasattr(blob, 'tobytes') else bytes(blob)
+    metadata = json.loads(raw_meta.decode('utf-8') if isinstance(raw_meta, bytes) else str(raw_meta))
+    return JoblibModel(joblib.load(io.BytesIO(blob)), metadata)
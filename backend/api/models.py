@@ -29,3 +29,97 @@ class Measurement(models.Model):
             # Add an index to speed up lookups by location foreign key
             models.Index(fields=["location"]),
         ]
+        constraints = [
+            # Ingestion dedup key (see api/measurements.py)
+            models.UniqueConstraint(fields=['location', 'parameter', 'last_updated'], name='uniq_measurement_point'),
+        ]
+
+
+class GeocodeCache(models.Model):
+    # Normalized city query (see api.geocoding.normalize_city)
+    query = models.CharField(max_length=200, primary_key=True)
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+    # False caches a "City not found" answer (expires after GEOCODE_NEGATIVE_TTL)
+    found = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.query} -> ({self.latitude}, {self.longitude})" if self.found else f"{self.query} -> not found"
+
+
+class IngestionCheckpoint(models.Model):
+    # e.g. "openaq.locations"; scope distinguishes runs (bbox or "all")
+    source = models.CharField(max_length=50)
+    scope = models.CharField(max_length=100, default='all')
+    # Highest page such that every page up to it has been written
+    last_page = models.IntegerField(default=0)
+    # Page size last_page is counted in; resuming with another size is refused
+    page_limit = models.IntegerField(blank=True, null=True)
+    completed = models.BooleanField(default=False)
+    # Latest upstream "last seen" timestamp observed for this source/scope
+    watermark = models.DateTimeField(blank=True, null=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        state = 'done' if self.completed else f'page {self.last_page}'
+        return f"{self.source}[{self.scope}] {state}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'scope'], name='uniq_ingestion_checkpoint'),
+        ]
+
+
+class MeasurementRollup(models.Model):
+    # Aggregates of Measurement per station, pollutant and time bucket, maintained
+    # incrementally by api/rollups.py as new readings are loaded.
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='+')
+    parameter = models.CharField(max_length=50)
+    bucket = models.DateTimeField()  # bucket start, UTC
+    count = models.IntegerField(default=0)
+    total = models.FloatField(default=0.0)  # sum of values; mean = total / count
+    minimum = models.FloatField(blank=True, null=True)
+    maximum = models.FloatField(blank=True, null=True)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def __str__(self):
+        return f"{self.parameter} @ {self.bucket}: mean={self.mean} n={self.count}"
+
+    class Meta:
+        abstract = True
+
+
+class HourlyRollup(MeasurementRollup):
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['location', 'parameter', 'bucket'], name='uniq_hourly_rollup'),
+        ]
+
+
+class DailyRollup(MeasurementRollup):
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['location', 'parameter', 'bucket'], name='uniq_daily_rollup'),
+        ]
+
+
+class FetchedInterval(models.Model):
+    # Time ranges already pulled from an upstream history API for a station, so
+    # only the missing sub-intervals are fetched again (see api/history_store.py).
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='+')
+    source = models.CharField(max_length=50)
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.source} {self.location_id}: {self.start} -> {self.end}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['location', 'source', 'start'], name='fetched_interval_lookup_idx'),
+        ]
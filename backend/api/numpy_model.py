@@ -0,0 +1,233 @@
+"""
+TensorFlow-free inference for dense Keras models.
+
+``manage.py convert_aqi_model`` reads a Keras ``.h5`` file with h5py only
+(model_config JSON + model_weights) and writes a compact ``.npz`` holding each
+layer's arrays and a JSON layer spec. :class:`DenseModel` replays the forward
+pass with NumPy: Dense, Activation/ReLU (incl. max_value, negative_slope and
+threshold)/LeakyReLU/Softmax, BatchNormalization,
+with Dropout/Flatten/InputLayer as no-ops for 2-D inputs. That covers the
+8-feature MLPs this project trains, without importing TensorFlow in workers.
+"""
+import json
+from typing import Dict, List, Optional
+
+import numpy as np
+
+SPEC_KEY = 'spec'
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def _softmax(x):
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+def _relu(x, max_value=None, negative_slope=0.0, threshold=0.0):
+    # Keras ReLU layer: negative_slope * (x - threshold) up to threshold, identity above, capped at max_value
+    out = np.where(x > threshold, x, negative_slope * (x - threshold))
+    if max_value is not None:
+        out = np.minimum(out, max_value)
+    return out
+
+
+def _elu(x, alpha=1.0):
+    return np.where(x > 0, x, alpha * (np.exp(np.minimum(x, 0)) - 1))
+
+
+def _selu(x):
+    return 1.0507009873554805 * _elu(x, 1.6732632423543772)
+
+
+def _gelu(x):
+    # Keras' default (approximate=False) uses erf; the tanh form is within 1e-3
+    return 0.5 * x * (1 + np.tanh(np.sqrt(2 / np.pi) * (x + 0.044715 * x ** 3)))
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    None: lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'relu6': lambda x: np.clip(x, 0, 6),
+    'sigmoid': _sigmoid,
+    'hard_sigmoid': lambda x: np.clip(0.2 * x + 0.5, 0, 1),
+    'tanh': np.tanh,
+    'softmax': _softmax,
+    'softplus': lambda x: np.logaddexp(0, x),
+    'softsign': lambda x: x / (1 + np.abs(x)),
+    'elu': _elu,
+    'selu': _selu,
+    'gelu': _gelu,
+    'swish': lambda x: x * _sigmoid(x),
+    'silu': lambda x: x * _sigmoid(x),
+    'exponential': np.exp,
+}
+
+
+class DenseModel:
+    """A chain of layers described by ``spec`` with their arrays in ``weights``."""
+    format = 'numpy'
+
+    def __init__(self, spec: List[dict], weights: List[Dict[str, np.ndarray]]):
+        self.spec = spec
+        self.weights = weights
+
+    @property
+    def n_features(self) -> Optional[int]:
+        for arrays in self.weights:
+            if 'kernel' in arrays:
+                return int(arrays['kernel'].shape[0])
+        return None
+
+    def predict(self, X, verbose: int = 0, batch_size: Optional[int] = None) -> np.ndarray:
+        """Keras-compatible ``predict`` (verbose/batch_size are accepted and ignored)."""
+        out = np.asarray(X, dtype=np.float32)
+        for layer, arrays in zip(self.spec, self.weights):
+            kind = layer['type']
+            if kind == 'dense':
+                out = out @ arrays['kernel']
+                if 'bias' in arrays:
+                    out = out + arrays['bias']
+                out = ACTIVATIONS[layer.get('activation')](out)
+            elif kind == 'activation':
+                out = ACTIVATIONS[layer.get('activation')](out)
+            elif kind == 'relu':
+                out = _relu(out, layer.get('max_value'), layer.get('negative_slope', 0.0), layer.get('threshold', 0.0))
+            elif kind == 'leaky_relu':
+                out = np.where(out >= 0, out, layer.get('alpha', 0.3) * out)
+            elif kind == 'batch_norm':
+                inv = 1.0 / np.sqrt(arrays['moving_variance'] + layer.get('epsilon', 1e-3))
+                if 'gamma' in arrays:
+                    inv = inv * arrays['gamma']
+                out = (out - arrays['moving_mean']) * inv
+                if 'beta' in arrays:
+                    out = out + arrays['beta']
+            else:
+                raise ValueError(f"Unsupported layer type: {kind}")
+        return out
+
+    # --- .npz persistence ---
+
+    def save(self, path: str) -> None:
+        arrays = {SPEC_KEY: np.array(json.dumps(self.spec))}
+        for i, layer_arrays in enumerate(self.weights):
+            for name, value in layer_arrays.items():
+                arrays[f"{i}/{name}"] = value.astype(np.float32)
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> 'DenseModel':
+        with np.load(path, allow_pickle=False) as data:
+            spec = json.loads(str(data[SPEC_KEY]))
+            weights: List[Dict[str, np.ndarray]] = [{} for _ in spec]
+            for key in data.files:
+                if key == SPEC_KEY:
+                    continue
+                index, name = key.split('/', 1)
+                weights[int(index)][name] = data[key]
+        return cls(spec, weights)
+
+
+# --- Keras .h5 conversion (h5py only) ---
+
+def _decode(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    if hasattr(value, 'tolist'):
+        return [_decode(v) for v in value.tolist()] if np.ndim(value) else _decode(value.tolist())
+    return value
+
+
+def _relu_spec(cfg: dict) -> dict:
+    max_value = cfg.get('max_value')
+    return {
+        'type': 'relu',
+        'max_value': None if max_value is None else float(max_value),
+        'negative_slope': float(cfg.get('negative_slope') or 0.0),
+        'threshold': float(cfg.get('threshold') or 0.0),
+    }
+
+
+def _activation_name(activation) -> Optional[str]:
+    if isinstance(activation, dict):
+        if activation.get('class_name') == 'ReLU' and _relu_spec(activation.get('config') or {}) != _relu_spec({}):
+            # Only the plain function form fits a Dense layer's activation name
+            raise ValueError(f"Unsupported activation: ReLU with {activation.get('config')}")
+        # Keras 3 serializes {"class_name": "ReLU", "config": {...}} or {"config": {"name": "relu"}}
+        activation = (activation.get('config') or {}).get('name') or activation.get('class_name')
+    if activation is None:
+        return None
+    name = str(activation).lower()
+    if name not in ACTIVATIONS:
+        raise ValueError(f"Unsupported activation: {activation}")
+    return name
+
+
+def _layer_list(model_config: dict) -> List[dict]:
+    config = model_config.get('config')
+    layers = config if isinstance(config, list) else (config or {}).get('layers') or []
+    if model_config.get('class_name') not in ('Sequential', 'Functional', 'Model'):
+        raise ValueError(f"Unsupported model class: {model_config.get('class_name')}")
+    for layer in layers:
+        inbound = layer.get('inbound_nodes') or []
+        if len(inbound) > 1 or (inbound and isinstance(inbound[0], list) and len(inbound[0]) > 1):
+            raise ValueError("Only single-chain (sequential) models can be converted")
+    return layers
+
+
+def _layer_arrays(weights_group, layer_name: str) -> Dict[str, np.ndarray]:
+    if layer_name not in weights_group:
+        return {}
+    group = weights_group[layer_name]
+    arrays = {}
+    for weight_name in _decode(group.attrs.get('weight_names', [])):
+        # "dense/kernel:0" (Keras 2) or "sequential/dense/kernel" (Keras 3 legacy h5)
+        short = weight_name.rsplit('/', 1)[-1].split(':', 1)[0]
+        arrays[short] = np.asarray(group[weight_name], dtype=np.float32)
+    return arrays
+
+
+def _convert_layer(kind: str, cfg: dict, arrays: Dict[str, np.ndarray]):
+    """(spec, arrays) for one Keras layer, or None for layers that are no-ops at inference."""
+    if kind in ('InputLayer', 'Dropout', 'GaussianNoise', 'GaussianDropout', 'AlphaDropout', 'Flatten'):
+        return None
+    if kind == 'Dense':
+        return {'type': 'dense', 'activation': _activation_name(cfg.get('activation'))}, \
+            {k: v for k, v in arrays.items() if k in ('kernel', 'bias')}
+    if kind == 'Activation':
+        return {'type': 'activation', 'activation': _activation_name(cfg.get('activation'))}, {}
+    if kind == 'ReLU':
+        return _relu_spec(cfg), {}
+    if kind == 'Softmax':
+        return {'type': 'activation', 'activation': 'softmax'}, {}
+    if kind == 'LeakyReLU':
+        alpha = cfg.get('negative_slope', cfg.get('alpha', 0.3))
+        return {'type': 'leaky_relu', 'alpha': float(alpha)}, {}
+    if kind == 'BatchNormalization':
+        return {'type': 'batch_norm', 'epsilon': float(cfg.get('epsilon', 1e-3))}, arrays
+    raise ValueError(f"Unsupported layer: {kind}")
+
+
+def convert_keras_h5(path: str) -> DenseModel:
+    """Build a DenseModel from a Keras .h5 file without importing TensorFlow."""
+    import h5py
+
+    with h5py.File(path, 'r') as f:
+        raw_config = f.attrs.get('model_config')
+        if raw_config is None:
+            raise ValueError(f"{path} is not a Keras model file (no model_config attribute)")
+        layers = _layer_list(json.loads(_decode(raw_config)))
+        weights_group = f['model_weights'] if 'model_weights' in f else f
+
+        spec: List[dict] = []
+        weights: List[Dict[str, np.ndarray]] = []
+        for layer in layers:
+            cfg = layer.get('config') or {}
+            converted = _convert_layer(layer.get('class_name'), cfg, _layer_arrays(weights_group, cfg.get('name', '')))
+            if converted is not None:
+                spec.append(converted[0])
+                weights.append(converted[1])
+    return DenseModel(spec, weights)
@@ -0,0 +1,64 @@
+"""
+Load shared read-only state once in a pre-fork server's master process.
+
+With gunicorn's ``preload_app`` (see backend/gunicorn.conf.py) Django is
+imported in the master; :func:`preload` then loads the AQI model and builds
+the location index there, so every worker forks with them already in memory.
+The pages are shared copy-on-write: NumPy weight buffers and the index arrays
+are only read, and ``gc.freeze()`` keeps the collector from touching (and so
+copying) the preloaded objects. Workers, including ones respawned later,
+serve the first request without loading anything.
+
+:func:`after_fork` runs in each worker and drops what must not be shared
+across processes: database connections and upstream HTTP pools. With
+INFERENCE_EXECUTOR=process it also starts the worker's inference pool, whose
+processes load the model while the worker begins serving.
+"""
+import gc
+import logging
+import time
+
+from django.db import connections
+
+from . import aqi_model, inference, spatial, upstream
+
+logger = logging.getLogger(__name__)
+
+
+def preload() -> dict:
+    """Load the model and location index in this (master) process. Returns timings."""
+    timings = {}
+    started = time.perf_counter()
+    if inference.get_executor().name == inference.INLINE:
+        # With the process executor the pool workers load the model themselves
+        timings['model_loaded'] = aqi_model.warmup()
+        timings['model_seconds'] = round(time.perf_counter() - started, 3)
+
+    started = time.perf_counter()
+    try:
+        if not spatial.use_postgis():
+            timings['locations'] = len(spatial.get_index())
+            timings['index_seconds'] = round(time.perf_counter() - started, 3)
+    except Exception as e:
+        # No DB yet (fresh deploy before migrate): workers build the index on first use
+        logger.warning("location index preload failed: %s", e)
+    finally:
+        # A connection opened here would be inherited by every worker
+        connections.close_all()
+
+    gc.collect()
+    gc.freeze()
+    logger.info("preloaded shared state: %s", timings)
+    return timings
+
+
+def after_fork() -> None:
+    """Per-worker reset of resources that cannot be shared with the master."""
+    for conn in connections.all(initialized_only=True):
+        # Forget the inherited socket without closing it under the master
+        conn.connection = None
+    upstream.reset_after_fork()
+    if inference.get_executor().name == inference.PROCESS:
+        # The pool is per worker and could not be started in the master; start it now
+        # rather than on the first request
+        inference.warmup_in_background()
@@ -0,0 +1,181 @@
+"""
+Grid-cell keyed cache for OpenWeather "latest" payloads.
+
+Nearby users share one upstream call: coordinates are snapped to a grid cell of
+RESPONSE_CACHE_GRID_DEG degrees, the upstream API is queried at the cell centre,
+and the raw JSON is cached under (kind, cell, units) in Django's cache.
+
+OpenWeather refreshes a point on a fixed cadence (air pollution hourly, current
+weather every ~10 minutes) and stamps each payload with `dt`, so an entry lives
+until the next expected refresh, ``dt + cadence``, clamped to
+[RESPONSE_CACHE_MIN_TTL, cadence].
+
+Stale-while-revalidate: expired entries are kept for RESPONSE_CACHE_STALE_TTL
+more seconds. A request that finds one gets the stale payload immediately
+(state STALE, surfaced as ``"stale": true``) while one background thread per
+cell refreshes it, so upstream slowness or an outage (see api/circuit.py) never
+sits on the request path once a cell has been seen.
+"""
+import asyncio
+import math
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional, Set, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+# kind -> upstream refresh cadence in seconds
+CADENCE = {
+    'air': 3600,
+    'weather': 600,
+}
+
+Cell = Tuple[int, int]
+
+# get_or_fetch states
+HIT = 'hit'
+MISS = 'miss'
+STALE = 'stale'
+
+_refreshing: Set[str] = set()
+_refreshing_lock = threading.Lock()
+# Strong refs to background refresh tasks of the async path (the loop keeps weak ones)
+_refresh_tasks: Set[asyncio.Task] = set()
+
+
+def _grid_deg(grid_deg: Optional[float] = None) -> float:
+    if grid_deg is None:
+        grid_deg = float(getattr(settings, 'RESPONSE_CACHE_GRID_DEG', 0.05))
+    if not grid_deg > 0:
+        raise ValueError(f"RESPONSE_CACHE_GRID_DEG must be positive, got {grid_deg}")
+    return grid_deg
+
+
+def grid_cell(lat: float, lon: float, grid_deg: Optional[float] = None) -> Cell:
+    grid_deg = _grid_deg(grid_deg)
+    return math.floor(lat / grid_deg), math.floor(lon / grid_deg)
+
+
+def cell_center(cell: Cell, grid_deg: Optional[float] = None) -> Tuple[float, float]:
+    grid_deg = _grid_deg(grid_deg)
+    # Round away float noise so the upstream URL (and its cache key) is stable
+    return round((cell[0] + 0.5) * grid_deg, 6), round((cell[1] + 0.5) * grid_deg, 6)
+
+
+def cache_key(kind: str, cell: Cell, units: Optional[str] = None) -> str:
+    return f"ow:{kind}:{_grid_deg():g}:{cell[0]}:{cell[1]}:{units or '-'}"
+
+
+def payload_dt(kind: str, payload: Any) -> Optional[int]:
+    """Upstream `dt` of a payload (air pollution nests it in list[0])."""
+    try:
+        if kind == 'air':
+            return int((payload.get('list') or [{}])[0].get('dt'))
+        return int(payload.get('dt'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def ttl_for(kind: str, dt: Optional[int], now: Optional[float] = None) -> int:
+    cadence = CADENCE.get(kind, 600)
+    min_ttl = int(getattr(settings, 'RESPONSE_CACHE_MIN_TTL', 60))
+    if dt is None:
+        return min_ttl
+    now = time.time() if now is None else now
+    return int(max(min_ttl, min(cadence, dt + cadence - now)))
+
+
+def _stale_ttl() -> int:
+    return int(getattr(settings, 'RESPONSE_CACHE_STALE_TTL', 3600))
+
+
+def _entry(kind: str, payload: Any) -> Tuple[dict, int]:
+    ttl = ttl_for(kind, payload_dt(kind, payload))
+    return {'payload': payload, 'fresh_until': time.time() + ttl}, ttl + _stale_ttl()
+
+
+def _store(kind: str, key: str, payload: Any) -> None:
+    cache.set(key, *_entry(kind, payload))
+
+
+def _refresh(kind: str, key: str, cell: Cell, fetch: Callable[[float, float], Any]) -> None:
+    try:
+        _store(kind, key, fetch(*cell_center(cell)))
+    except Exception:
+        # Keep serving the stale entry; the next stale read retries
+        pass
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(key)
+        cache.delete(f"{key}:refresh")
+
+
+def _refresh_in_background(kind: str, key: str, cell: Cell, fetch: Callable[[float, float], Any]) -> None:
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        # One refresher per cell across workers when the cache is shared
+        if not cache.add(f"{key}:refresh", 1, timeout=60):
+            return
+        _refreshing.add(key)
+    threading.Thread(target=_refresh, args=(kind, key, cell, fetch), daemon=True).start()
+
+
+def get_or_fetch(kind: str, lat: float, lon: float, fetch: Callable[[float, float], Any],
+                 units: Optional[str] = None) -> Tuple[Any, str]:
+    """
+    Cached upstream payload for the grid cell containing (lat, lon).
+
+    fetch(cell_lat, cell_lon) performs the upstream call. On a MISS its
+    exceptions propagate and nothing is cached; on a STALE read it runs in the
+    background. Returns (payload, HIT | MISS | STALE).
+    """
+    cell = grid_cell(lat, lon)
+    key = cache_key(kind, cell, units)
+    entry = cache.get(key)
+    if entry is not None:
+        if time.time() < entry['fresh_until']:
+            return entry['payload'], HIT
+        _refresh_in_background(kind, key, cell, fetch)
+        return entry['payload'], STALE
+    payload = fetch(*cell_center(cell))
+    _store(kind, key, payload)
+    return payload, MISS
+
+
+# --- Async path (api/async_views.py) ---
+
+async def _arefresh(kind: str, key: str, cell: Cell, fetch: Callable[[float, float], Awaitable[Any]]) -> None:
+    try:
+        await cache.aset(key, *_entry(kind, await fetch(*cell_center(cell))))
+    except Exception:
+        pass
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(key)
+        await cache.adelete(f"{key}:refresh")
+
+
+async def aget_or_fetch(kind: str, lat: float, lon: float, fetch: Callable[[float, float], Awaitable[Any]],
+                        units: Optional[str] = None) -> Tuple[Any, str]:
+    """Async :func:`get_or_fetch`; ``fetch`` is a coroutine function and refreshes run as tasks."""
+    cell = grid_cell(lat, lon)
+    key = cache_key(kind, cell, units)
+    entry = await cache.aget(key)
+    if entry is not None:
+        if time.time() < entry['fresh_until']:
+            return entry['payload'], HIT
+        with _refreshing_lock:
+            start = key not in _refreshing
+        # Never await while holding the thread lock; cache.add arbitrates races
+        if start and await cache.aadd(f"{key}:refresh", 1, timeout=60):
+            with _refreshing_lock:
+                _refreshing.add(key)
+            task = asyncio.create_task(_arefresh(kind, key, cell, fetch))
+            _refresh_tasks.add(task)
+            task.add_done_callback(_refresh_tasks.discard)
+        return entry['payload'], STALE
+    payload = await fetch(*cell_center(cell))
+    await cache.aset(key, *_entry(kind, payload))
+    return payload, MISS
@@ -0,0 +1,148 @@
+"""
+Hourly/daily rollups of Measurement, maintained incrementally.
+
+Whenever the loader (api/measurements.py) inserts new readings it passes exactly
+those rows to :func:`apply_rows`, which folds them into HourlyRollup and
+DailyRollup with one ``INSERT ... ON CONFLICT DO UPDATE`` per table: counts and
+sums add up, min/max widen. Nothing is ever recomputed from raw rows.
+
+:func:`series` serves a [start, end] window from the coarsest table whose bucket
+size still satisfies the requested resolution, so a year-long chart reads ~365
+daily rows instead of ~8760 hourly readings per pollutant.
+"""
+from datetime import datetime, timezone as dt_timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import connection
+
+from .models import DailyRollup, HourlyRollup, Measurement
+from .timeseries import measurement_series
+
+HOUR = 3600
+DAY = 86400
+
+REBUILD_BATCH = 50000
+
+# resolution name -> bucket seconds
+RESOLUTIONS = {'raw': 0, 'hour': HOUR, 'day': DAY}
+
+# (location_id, parameter, value, last_updated)
+RollupInput = Tuple[int, str, Optional[float], datetime]
+
+_UPSERT_SQL = """
+    INSERT INTO {table} (location_id, parameter, bucket, count, total, minimum, maximum)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT (location_id, parameter, bucket) DO UPDATE SET
+        count = {table}.count + excluded.count,
+        total = {table}.total + excluded.total,
+        minimum = {least}({table}.minimum, excluded.minimum),
+        maximum = {greatest}({table}.maximum, excluded.maximum)
+"""
+
+
+def _floor(ts: datetime, seconds: int) -> datetime:
+    epoch = int(ts.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % seconds, tz=dt_timezone.utc)
+
+
+def _aggregate(rows: Iterable[RollupInput], seconds: int) -> Dict[tuple, list]:
+    acc: Dict[tuple, list] = {}
+    for loc_id, parameter, value, ts in rows:
+        if value is None or ts is None:
+            continue
+        key = (loc_id, parameter, _floor(ts, seconds))
+        agg = acc.get(key)
+        if agg is None:
+            acc[key] = [1, value, value, value]
+        else:
+            agg[0] += 1
+            agg[1] += value
+            agg[2] = min(agg[2], value)
+            agg[3] = max(agg[3], value)
+    return acc
+
+
+def _upsert(table: str, acc: Dict[tuple, list]):
+    if not acc:
+        return
+    # SQLite spells LEAST/GREATEST as the multi-argument min()/max()
+    least, greatest = ('LEAST', 'GREATEST') if connection.vendor == 'postgresql' else ('min', 'max')
+    sql = _UPSERT_SQL.format(table=table, least=least, greatest=greatest)
+    params = [(loc_id, parameter, bucket, n, total, lo, hi) for (loc_id, parameter, bucket), (n, total, lo, hi) in acc.items()]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def apply_rows(rows: Iterable[RollupInput]) -> None:
+    """Fold newly inserted readings into both rollup tables (call inside the insert's transaction)."""
+    rows = list(rows)
+    _upsert(HourlyRollup._meta.db_table, _aggregate(rows, HOUR))
+    _upsert(DailyRollup._meta.db_table, _aggregate(rows, DAY))
+
+
+def rebuild(location_ids: Optional[List[int]] = None) -> int:
+    """Recompute rollups from Measurement (backfill after enabling rollups); returns rows read."""
+    for model in (HourlyRollup, DailyRollup):
+        qs = model.objects.all()
+        if location_ids:
+            qs = qs.filter(location_id__in=location_ids)
+        qs.delete()
+    qs = Measurement.objects.exclude(value=None).exclude(last_updated=None)
+    if location_ids:
+        qs = qs.filter(location_id__in=location_ids)
+    total = 0
+    batch: List[RollupInput] = []
+    for row in qs.values_list('location_id', 'parameter', 'value', 'last_updated').iterator(chunk_size=REBUILD_BATCH):
+        batch.append(row)
+        if len(batch) >= REBUILD_BATCH:
+            apply_rows(batch)
+            total += len(batch)
+            batch = []
+    apply_rows(batch)
+    return total + len(batch)
+
+
+def pick_resolution(resolution_seconds: int) -> str:
+    """Coarsest stored resolution whose bucket fits inside the requested one."""
+    if resolution_seconds >= DAY:
+        return 'day'
+    if resolution_seconds >= HOUR:
+        return 'hour'
+    return 'raw'
+
+
+def auto_resolution(span_seconds: int, max_points: int) -> str:
+    """Raw readings for short windows, else the finest rollup that stays within max_points buckets."""
+    if span_seconds <= 2 * DAY:
+        return 'raw'
+    if span_seconds / HOUR <= max_points:
+        return 'hour'
+    return 'day'
+
+
+def series(location_id: int, parameter: str, start: datetime, end: datetime, resolution_seconds: int = 0) -> Tuple[str, List[dict]]:
+    """
+    Points for one station/pollutant over [start, end] at >= resolution_seconds spacing.
+
+    Returns (resolution used, [{bucket, mean, min, max, count}, ...]).
+    """
+    resolution = pick_resolution(resolution_seconds)
+    if resolution == 'raw':
+        points = [
+            {'bucket': ts, 'mean': value, 'min': value, 'max': value, 'count': 1}
+            for ts, value in measurement_series(location_id, parameter, start, end)
+        ]
+        return resolution, points
+
+    model = DailyRollup if resolution == 'day' else HourlyRollup
+    qs = model.objects.filter(
+        location_id=location_id,
+        parameter=parameter,
+        bucket__gte=_floor(start, RESOLUTIONS[resolution]),
+        bucket__lte=end,
+    ).order_by('bucket').values_list('bucket', 'count', 'total', 'minimum', 'maximum')
+    points = [
+        {'bucket': bucket, 'mean': total / n if n else None, 'min': lo, 'max': hi, 'count': n}
+        for bucket, n, total, lo, hi in qs
+    ]
+    return resolution, points
@@ -38,6 +38,7 @@ class PredictAQIResponseSerializer(serializers.Serializer):
 	time_range = serializers.DictField()
 	feature_order = serializers.ListField(child=serializers.CharField())
 	model = serializers.DictField()
+	history = serializers.DictField(required=False)
 	count = serializers.IntegerField()
 	results = PredictAQIItemSerializer(many=True)
 	ai_summary = serializers.DictField(required=False)
@@ -75,3 +76,50 @@ class GenerateReportResponseSerializer(serializers.Serializer):
 	chat_session_id = serializers.CharField(required=False)
 	context = serializers.CharField(required=False)
 	error = serializers.CharField(required=False)
+
+
+class AQIHistoryQuerySerializer(PredictAQIQuerySerializer):
+	# Station id; if omitted the nearest station to lat/lon or city is used
+	location_id = serializers.IntegerField(required=False)
+	# Comma-separated pollutant keys (e.g. "pm2_5,pm10"); default: all stored
+	parameters = serializers.CharField(required=False)
+	# raw | hour | day | auto
+	resolution = serializers.ChoiceField(choices=['raw', 'hour', 'day', 'auto'], required=False, default='auto')
+
+
+class PredictAQIBatchLocationSerializer(serializers.Serializer):
+	# Same bounds as CoordinateSerializer
+	lat = serializers.FloatField(required=False, min_value=-90, max_value=90)
+	lon = serializers.FloatField(required=False, min_value=-180, max_value=180)
+	q = serializers.CharField(required=False)
+	city = serializers.CharField(required=False)
+
+	def validate(self, attrs):
+		has_coords = attrs.get('lat') is not None and attrs.get('lon') is not None
+		if (attrs.get('lat') is None) != (attrs.get('lon') is None):
+			raise serializers.ValidationError('Both lat and lon must be provided together')
+		if not has_coords and not (attrs.get('q') or attrs.get('city')):
+			raise serializers.ValidationError('Provide lat/lon or q/city')
+		return attrs
+
+
+class PredictAQIBatchRequestSerializer(serializers.Serializer):
+	# Capped by PREDICT_BATCH_MAX_LOCATIONS in the view
+	locations = PredictAQIBatchLocationSerializer(many=True, allow_empty=False)
+	# Shared time range, as for predict_aqi
+	start = serializers.CharField(required=False)
+	end = serializers.CharField(required=False)
+	hours = serializers.IntegerField(required=False, min_value=1)
+
+
+class CoordinateSerializer(serializers.Serializer):
+	lat = serializers.FloatField(min_value=-90, max_value=90)
+	lon = serializers.FloatField(min_value=-180, max_value=180)
+
+
+class NearestLocationsRequestSerializer(serializers.Serializer):
+	# [{"lat": .., "lon": ..}, ...]; length capped by NEAREST_BATCH_MAX_POINTS in the view
+	points = CoordinateSerializer(many=True, allow_empty=False)
+	k = serializers.IntegerField(required=False, default=1, min_value=1, max_value=50)
+	# Only stations within this many metres (at most k of them, nearest first)
+	radius_m = serializers.FloatField(required=False, min_value=0, max_value=20037509)
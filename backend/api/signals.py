@@ -0,0 +1,16 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import spatial
+from .models import Location
+
+
+@receiver(post_save, sender=Location)
+def update_location_index(sender, instance, **kwargs):
+    # Update just this station in the coordinate store
+    spatial.location_saved(instance.location_id, spatial.location_coords(instance.latitude, instance.longitude, instance.geom))
+
+
+@receiver(post_delete, sender=Location)
+def remove_from_location_index(sender, instance, **kwargs):
+    spatial.location_deleted(instance.location_id)
@@ -0,0 +1,176 @@
+"""
+Single-flight coalescing of identical upstream calls.
+
+When many requests ask for the same upstream URL at once (a burst of users
+opening TodayView for one city), only the first one actually calls OpenWeather;
+the others wait for it and receive the same result or the same error.
+
+Two levels:
+  - in-process: threads of one worker share an in-flight call via an Event
+  - cross-worker: when the default cache is shared (Redis, Memcached, DB), the
+    leader takes a short lock with ``cache.add`` and publishes its outcome under
+    a result key that other workers poll for up to UPSTREAM_COALESCE_WAIT
+    seconds. If the leader vanishes (crash, lock expiry) they fetch themselves.
+
+:func:`ado` is the asyncio flavour for the async views: callers on one event
+loop await a shared Future (in-process only; the loop never blocks on a poll).
+
+Keys are derived from the URL and params minus ``appid`` so the API key never
+lands in the cache.
+"""
+import asyncio
+import hashlib
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+
+SECRET_PARAMS = frozenset(['appid'])
+
+# Backends that are private to one process; coalescing through them is pointless
+_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+POLL_INTERVAL = 0.05
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+_inflight: Dict[str, _Call] = {}
+_lock = threading.Lock()
+
+# (event loop, key) -> Future of the in-flight call
+_async_inflight: Dict[tuple, asyncio.Future] = {}
+
+
+def request_key(url: str, params: Optional[dict] = None) -> str:
+    """Stable key for a GET request, ignoring secret params and param order."""
+    public = sorted((k, str(v)) for k, v in (params or {}).items() if k not in SECRET_PARAMS)
+    digest = hashlib.sha1(f"{url}?{urlencode(public)}".encode('utf-8')).hexdigest()
+    return f"sf:{digest}"
+
+
+def shared_enabled() -> bool:
+    if not getattr(settings, 'UPSTREAM_COALESCE_SHARED', True):
+        return False
+    backend = getattr(settings, 'CACHES', {}).get('default', {}).get('BACKEND', '')
+    return backend not in _LOCAL_BACKENDS
+
+
+# --- Cross-worker ---
+
+def _shared_call(key: str, fn: Callable[[], Any], share_errors: Tuple[Type[BaseException], ...]) -> Any:
+    wait = float(getattr(settings, 'UPSTREAM_COALESCE_WAIT', 15))
+    lock_key = f"{key}:lock"
+    token = uuid.uuid4().hex
+
+    # The lock outlives the wait so a slow leader is not duplicated mid-flight
+    if not cache.add(lock_key, token, timeout=int(wait) + 1):
+        # Results are keyed by the leader's token so a follower never picks up
+        # the outcome of an earlier burst
+        leader = cache.get(lock_key)
+        deadline = time.monotonic() + wait
+        while leader is not None and time.monotonic() < deadline:
+            # The leader publishes before unlocking, so read the lock first
+            still_running = cache.get(lock_key) == leader
+            outcome = cache.get(f"{key}:{leader}")
+            if outcome is not None:
+                if 'error' in outcome:
+                    raise outcome['error']
+                return outcome['result']
+            if not still_running:
+                break  # leader died or its lock expired without publishing
+            time.sleep(POLL_INTERVAL)
+        return fn()
+
+    result_key = f"{key}:{token}"
+    try:
+        try:
+            result = fn()
+        except share_errors as e:
+            cache.set(result_key, {'error': e}, timeout=int(wait))
+            raise
+        cache.set(result_key, {'result': result}, timeout=int(wait))
+        return result
+    finally:
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+# --- Public API ---
+
+def do(key: str, fn: Callable[[], Any], share_errors: Tuple[Type[BaseException], ...] = ()) -> Any:
+    """
+    Run ``fn()`` once per key among concurrent callers and share its outcome.
+
+    The first caller becomes the leader; every concurrent caller with the same
+    key gets the leader's return value or has the leader's exception re-raised.
+    Across workers only results and ``share_errors`` (which must pickle) are shared.
+    """
+    with _lock:
+        call = _inflight.get(key)
+        leader = call is None
+        if leader:
+            call = _inflight[key] = _Call()
+
+    if not leader:
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    try:
+        call.result = _shared_call(key, fn, share_errors) if shared_enabled() else fn()
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+        call.done.set()
+    return call.result
+
+
+async def ado(key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+    """Async :func:`do`: concurrent awaiters on the same loop share one ``await fn()``."""
+    loop = asyncio.get_running_loop()
+    slot = (loop, key)
+    future = _async_inflight.get(slot)
+    if future is not None:
+        try:
+            # shield: one cancelled waiter must not cancel the call for the others
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                raise  # this waiter itself was cancelled
+            return await fn()  # the leader was cancelled (client went away)
+
+    future = _async_inflight[slot] = loop.create_future()
+    try:
+        result = await fn()
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except BaseException as e:
+        future.set_exception(e)
+        # Mark retrieved so an error nobody else awaited is not logged as lost
+        future.exception()
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        _async_inflight.pop(slot, None)
@@ -0,0 +1,412 @@
+"""
+In-memory coordinate store over Location rows.
+
+Station ids and coordinates live in contiguous NumPy arrays (int64 ids,
+float64 lat/lon and unit-sphere x/y/z): 48 bytes per station, no model
+instances or GEOS points. Straight-line (chord) distance on the unit sphere is
+monotonic in great-circle distance, so nearest and radius queries are
+Euclidean queries on the x/y/z array, answered in O(log N) by a
+``scipy.spatial.cKDTree`` built over it (without SciPy, a linear scan), and
+chord lengths convert back to metres with ``2 * R * asin(chord / 2)``.
+
+The store is built from the DB once per process on first use. After that it is
+kept current row by row: saving or deleting a Location (api/signals.py) builds
+a new snapshot with just that row changed and swaps it in. That copies the
+arrays (O(N)) and the new snapshot builds its tree on its first query, which is
+fine for the occasional admin edit; bulk changes (ingestion's bulk_create) call
+:func:`invalidate` for a single full rebuild instead. Every change also bumps a version
+counter in the shared cache, and processes that see it move (at most every
+SPATIAL_VERSION_CHECK seconds) rebuild their own copy.
+
+On PostGIS, :func:`nearest_locations` / :func:`locations_within` push the query
+into the database instead and this store is only used on SQLite.
+"""
+import math
+import threading
+import time
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from . import distance
+from .models import Location
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # installed alongside scikit-learn; the linear scan still works without it
+    cKDTree = None
+
+EARTH_RADIUS_M = 6371000.0
+VERSION_KEY = 'spatial:locations:version'
+
+Neighbour = Tuple[int, float]  # (location_id, distance in metres)
+
+
+def to_unit_vector(lat: float, lon: float) -> Tuple[float, float, float]:
+    phi = math.radians(lat)
+    lam = math.radians(lon)
+    cos_phi = math.cos(phi)
+    return (cos_phi * math.cos(lam), cos_phi * math.sin(lam), math.sin(phi))
+
+
+def unit_vectors(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """Vectorized :func:`to_unit_vector`: (n,) degrees -> (n, 3)."""
+    phi = np.radians(lat)
+    lam = np.radians(lon)
+    cos_phi = np.cos(phi)
+    return np.column_stack((cos_phi * np.cos(lam), cos_phi * np.sin(lam), np.sin(phi)))
+
+
+def chord_to_meters(chord: float) -> float:
+    return 2.0 * EARTH_RADIUS_M * math.asin(min(1.0, chord / 2.0))
+
+
+def location_coords(lat, lon, geom) -> Optional[Tuple[float, float]]:
+    """(lat, lon) of a Location row, preferring geom; None when it has no usable coordinates."""
+    try:
+        if geom is not None:
+            # GeoDjango Point: x=lon, y=lat
+            return float(geom.y), float(geom.x)
+        if lat is not None and lon is not None:
+            return float(lat), float(lon)
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+class LocationIndex:
+    """
+    Station ids (sorted) and coordinates in parallel arrays.
+
+    Instances are immutable snapshots: request threads query them without a
+    lock, so row updates build a new index (:meth:`with_row`, :meth:`without`)
+    that replaces the shared one in a single assignment. The KD-tree is derived
+    from the x/y/z array on the first query of each snapshot.
+    """
+
+    def __init__(self, ids: Sequence[int], coords: Sequence[Tuple[float, float]]):
+        ids = np.asarray(ids, dtype=np.int64)
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        order = np.argsort(ids, kind='stable')
+        self._set(ids[order], coords[order, 0].copy(), coords[order, 1].copy(), None, 0)
+
+    def _set(self, ids: np.ndarray, lat: np.ndarray, lon: np.ndarray, xyz: Optional[np.ndarray], version: int) -> None:
+        self.ids = ids
+        self.lat = lat
+        self.lon = lon
+        self.xyz = unit_vectors(lat, lon) if xyz is None else xyz
+        self.version = version
+        self._tree = None
+        for array in (self.ids, self.lat, self.lon, self.xyz):
+            array.flags.writeable = False
+
+    @classmethod
+    def _from_arrays(cls, ids, lat, lon, xyz, version: int) -> "LocationIndex":
+        index = cls.__new__(cls)
+        index._set(ids, lat, lon, xyz, version)
+        return index
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        return self.ids.nbytes + self.lat.nbytes + self.lon.nbytes + self.xyz.nbytes
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[int, float, float, object]]) -> "LocationIndex":
+        ids: List[int] = []
+        coords: List[Tuple[float, float]] = []
+        for loc_id, lat, lon, geom in rows:
+            point = location_coords(lat, lon, geom)
+            if point is not None:
+                ids.append(loc_id)
+                coords.append(point)
+        return cls(ids, coords)
+
+    @classmethod
+    def from_db(cls) -> "LocationIndex":
+        return cls.from_rows(Location.objects.values_list('location_id', 'latitude', 'longitude', 'geom').iterator())
+
+    # --- Row updates (no DB reads, no rebuild; return a new snapshot) ---
+
+    def _row(self, loc_id: int) -> Tuple[int, bool]:
+        row = int(np.searchsorted(self.ids, loc_id))
+        return row, row < len(self.ids) and self.ids[row] == loc_id
+
+    def with_row(self, loc_id: int, coords: Optional[Tuple[float, float]]) -> "LocationIndex":
+        """A copy with one station set (or, with coords None, dropped)."""
+        if coords is None:
+            return self.without(loc_id)
+        row, found = self._row(loc_id)
+        lat, lon = coords
+        point = to_unit_vector(lat, lon)
+        if found:
+            ids = self.ids
+            lats, lons, xyz = self.lat.copy(), self.lon.copy(), self.xyz.copy()
+            lats[row], lons[row] = lat, lon
+            xyz[row] = point
+        else:
+            ids = np.insert(self.ids, row, loc_id)
+            lats = np.insert(self.lat, row, lat)
+            lons = np.insert(self.lon, row, lon)
+            xyz = np.insert(self.xyz, row, point, axis=0)
+        return self._from_arrays(ids, lats, lons, xyz, self.version + 1)
+
+    def without(self, loc_id: int) -> "LocationIndex":
+        """A copy without one station (self when it is not indexed)."""
+        row, found = self._row(loc_id)
+        if not found:
+            return self
+        return self._from_arrays(
+            np.delete(self.ids, row), np.delete(self.lat, row), np.delete(self.lon, row),
+            np.delete(self.xyz, row, axis=0), self.version + 1,
+        )
+
+    # --- Queries ---
+
+    def _neighbours(self, rows: np.ndarray, q: np.ndarray) -> List[Neighbour]:
+        # Exact chords from coordinate differences (1 - dot loses precision for close points)
+        chords = np.sqrt(((self.xyz[rows] - q) ** 2).sum(axis=1))
+        order = np.argsort(chords, kind='stable')
+        return [(int(self.ids[rows[i]]), chord_to_meters(float(chords[i]))) for i in order]
+
+    @property
+    def tree(self):
+        """cKDTree over the x/y/z rows (None without SciPy); built once per snapshot."""
+        if self._tree is None and cKDTree is not None and len(self.ids):
+            # Racing first queries may both build it; either result is the same tree
+            self._tree = cKDTree(self.xyz)
+        return self._tree
+
+    def nearest(self, lat: float, lon: float, k: int = 1) -> List[Neighbour]:
+        n = len(self.ids)
+        if n == 0 or k < 1:
+            return []
+        q = np.asarray(to_unit_vector(lat, lon))
+        k = min(k, n)
+        tree = self.tree
+        if tree is not None:
+            _, rows = tree.query(q, k=k)
+            rows = np.atleast_1d(rows)
+        else:
+            dots = self.xyz @ q
+            rows = np.argpartition(-dots, k - 1)[:k] if k < n else np.arange(n)
+        return self._neighbours(rows, q)
+
+    def nearest_many(self, points: Sequence[Tuple[float, float]], k: int = 1) -> List[List[Neighbour]]:
+        """:meth:`nearest` for many (lat, lon) points at once (one tree query, else chunked haversine)."""
+        if not points:
+            return []
+        query = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        k = max(0, min(k, len(self.ids)))
+        tree = self.tree
+        if tree is not None and k:
+            chords, rows = tree.query(unit_vectors(query[:, 0], query[:, 1]), k=k)
+            rows, chords = rows.reshape(len(query), k), chords.reshape(len(query), k)
+            dists = 2.0 * EARTH_RADIUS_M * np.arcsin(np.minimum(1.0, chords / 2.0))
+        else:
+            rows, dists = distance.nearest_k(query[:, 0], query[:, 1], self.lat, self.lon, k)
+        ids = self.ids[rows]
+        return [
+            [(int(loc_id), float(dist)) for loc_id, dist in zip(id_row, dist_row)]
+            for id_row, dist_row in zip(ids.tolist(), dists.tolist())
+        ]
+
+    def within(self, lat: float, lon: float, radius_m: float) -> List[Neighbour]:
+        if len(self.ids) == 0:
+            return []
+        chord = 2.0 * math.sin(min(math.pi, radius_m / EARTH_RADIUS_M) / 2.0)
+        q = np.asarray(to_unit_vector(lat, lon))
+        tree = self.tree
+        if tree is not None:
+            # Small slack; the exact check follows
+            rows = np.asarray(tree.query_ball_point(q, r=chord + 1e-9), dtype=np.int64)
+        else:
+            # |a - b|^2 = 2 - 2 a.b on the unit sphere
+            rows = np.flatnonzero(self.xyz @ q >= 1.0 - chord * chord / 2.0 - 1e-12)
+        return [(loc_id, dist) for loc_id, dist in self._neighbours(rows, q) if dist <= radius_m + 1e-6]
+
+
+_index: Optional[LocationIndex] = None
+_index_lock = threading.Lock()
+# Shared version this process's index reflects, and when it was last compared
+_synced_version: Optional[int] = None
+_checked_at = 0.0
+
+
+def _shared_version() -> Optional[int]:
+    try:
+        return cache.get(VERSION_KEY)
+    except Exception:
+        # Cache outage: keep serving the local copy
+        return None
+
+
+def _bump_shared_version() -> Optional[int]:
+    try:
+        cache.add(VERSION_KEY, 0, timeout=None)
+        return cache.incr(VERSION_KEY)
+    except Exception:
+        return None
+
+
+def _check_shared_version() -> None:
+    """Drop the local index if another process changed locations since it was built."""
+    global _index, _checked_at
+    now = time.monotonic()
+    if _index is None or now - _checked_at < float(getattr(settings, 'SPATIAL_VERSION_CHECK', 5)):
+        return
+    _checked_at = now
+    version = _shared_version()
+    if version is not None and version != _synced_version:
+        with _index_lock:
+            _index = None
+
+
+def get_index() -> LocationIndex:
+    """Return the process-wide index, building it on first use."""
+    global _index, _synced_version, _checked_at
+    _check_shared_version()
+    index = _index
+    if index is None:
+        with _index_lock:
+            if _index is None:
+                # Read before building: a change landing mid-build triggers another rebuild
+                _synced_version = _shared_version()
+                _checked_at = time.monotonic()
+                _index = LocationIndex.from_db()
+            index = _index
+    return index
+
+
+def _apply(change) -> None:
+    global _index, _synced_version
+    with _index_lock:
+        if _index is not None:
+            # Readers keep whichever snapshot they already hold
+            _index = change(_index)
+        version = _bump_shared_version()
+        if version is not None and _synced_version is not None and version == _synced_version + 1:
+            # Ours was the only change since the last sync
+            _synced_version = version
+        elif version is not None:
+            _index = None
+
+
+def location_saved(loc_id: int, coords: Optional[Tuple[float, float]]) -> None:
+    """Apply one saved Location row (coords None = no usable coordinates)."""
+    _apply(lambda index: index.with_row(loc_id, coords))
+
+
+def location_deleted(loc_id: int) -> None:
+    _apply(lambda index: index.without(loc_id))
+
+
+def invalidate() -> None:
+    """Drop the cached index everywhere (bulk changes); the next query rebuilds it from the DB."""
+    global _index
+    with _index_lock:
+        _index = None
+    _bump_shared_version()
+
+
+# --- PostGIS path ---
+# On PostGIS the DB answers nearest/radius queries itself: `<->` on geography is
+# an index-assisted KNN ordering by great-circle distance in metres (GiST expression index
+# from migration 0003), and ST_DWithin on geography uses the same index.
+
+_KNN_SQL = """
+    SELECT location_id,
+           geom::geography <-> ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography AS distance_m
+    FROM api_location
+    WHERE geom IS NOT NULL
+    ORDER BY geom::geography <-> ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography
+    LIMIT %s
+"""
+
+_KNN_MANY_SQL = """
+    SELECT q.i, nn.location_id, nn.distance_m
+    FROM (VALUES {values}) AS q(i, lon, lat)
+    CROSS JOIN LATERAL (
+        SELECT location_id,
+               geom::geography <-> ST_SetSRID(ST_MakePoint(q.lon, q.lat), 4326)::geography AS distance_m
+        FROM api_location
+        WHERE geom IS NOT NULL
+        ORDER BY geom::geography <-> ST_SetSRID(ST_MakePoint(q.lon, q.lat), 4326)::geography
+        LIMIT %s
+    ) AS nn
+    ORDER BY q.i, nn.distance_m
+"""
+
+_RADIUS_SQL = """
+    SELECT location_id,
+           ST_Distance(geom::geography, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography) AS distance_m
+    FROM api_location
+    WHERE geom IS NOT NULL
+      AND ST_DWithin(geom::geography, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography, %s)
+    ORDER BY distance_m
+"""
+
+
+def use_postgis() -> bool:
+    """The in-process index is only the fallback for SQLite (USE_SQLITE)."""
+    return not getattr(settings, 'USE_SQLITE', False) and connection.vendor == 'postgresql'
+
+
+def _postgis_nearest(lat: float, lon: float, k: int) -> List[Neighbour]:
+    with connection.cursor() as cursor:
+        cursor.execute(_KNN_SQL, [lon, lat, lon, lat, k])
+        return [(int(loc_id), float(dist)) for loc_id, dist in cursor.fetchall()]
+
+
+def _postgis_nearest_many(points: Sequence[Tuple[float, float]], k: int) -> List[List[Neighbour]]:
+    # One round trip: a KNN subquery per input row via LATERAL, each using the GiST index
+    values = ', '.join(['(%s, %s, %s)'] * len(points))
+    sql = _KNN_MANY_SQL.format(values=values)
+    params: List[float] = []
+    for i, (lat, lon) in enumerate(points):
+        params.extend([i, lon, lat])
+    params.append(k)
+    results: List[List[Neighbour]] = [[] for _ in points]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        for i, loc_id, dist in cursor.fetchall():
+            results[i].append((int(loc_id), float(dist)))
+    return results
+
+
+def _postgis_within(lat: float, lon: float, radius_m: float) -> List[Neighbour]:
+    with connection.cursor() as cursor:
+        cursor.execute(_RADIUS_SQL, [lon, lat, lon, lat, radius_m])
+        return [(int(loc_id), float(dist)) for loc_id, dist in cursor.fetchall()]
+
+
+def nearest_locations(lat: float, lon: float, k: int = 1) -> List[Neighbour]:
+    if use_postgis():
+        return _postgis_nearest(lat, lon, k)
+    return get_index().nearest(lat, lon, k)
+
+
+def nearest_locations_many(points: Sequence[Tuple[float, float]], k: int = 1) -> List[List[Neighbour]]:
+    """The k nearest stations for each (lat, lon) point, in one query / one vectorized pass."""
+    if not points:
+        return []
+    if use_postgis():
+        return _postgis_nearest_many(points, k)
+    return get_index().nearest_many(points, k)
+
+
+def locations_within(lat: float, lon: float, radius_m: float) -> List[Neighbour]:
+    """All stations within radius_m metres, nearest first."""
+    if use_postgis():
+        return _postgis_within(lat, lon, radius_m)
+    return get_index().within(lat, lon, radius_m)
+
+
+def nearest_location(lat: float, lon: float) -> Optional[Neighbour]:
+    hits = nearest_locations(lat, lon, 1)
+    return hits[0] if hits else None
@@ -1,3 +1,1642 @@
-from django.test import TestCase
+import importlib.util
+import os
+import random
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta, timezone as dt_timezone
+from types import SimpleNamespace
 
-# Create your tests here.
+from django.db import connection
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from . import measurements, response_cache, rollups, singleflight
+from .aqi_model import FAILED, READY, ModelManager
+from .circuit import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from .history_store import missing_intervals
+from .ingestion import LOCATIONS_SOURCE, TokenBucket, ingest_locations_resumable, iter_pages
+from .models import FetchedInterval, HourlyRollup, IngestionCheckpoint, Location, Measurement
+
+
+class FakeOpenAQClient:
+    """Serves `pages` pages of `per_page` locations locally, then empty pages."""
+
+    def __init__(self, pages, per_page=3, fail_on=None, latency=None, last_seen=None, lat=13.0):
+        self.locations = self
+        self.pages = pages
+        self.per_page = per_page
+        self.fail_on = fail_on
+        self.latency = latency  # page -> seconds
+        self.last_seen = last_seen  # page -> ISO datetimeLast
+        self.lat = lat
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def list(self, page, limit, bbox=None):
+        with self._lock:
+            self.calls.append(page)
+        if self.latency is not None:
+            time.sleep(self.latency(page))
+        if page == self.fail_on:
+            raise RuntimeError(f"page {page} failed")
+        if page > self.pages:
+            return SimpleNamespace(results=[])
+        return SimpleNamespace(results=[
+            {
+                'id': page * 1000 + i,
+                'coordinates': {'latitude': self.lat, 'longitude': 80.0},
+                'datetimeLast': self.last_seen(page) if self.last_seen else None,
+            }
+            for i in range(self.per_page)
+        ])
+
+
+class IterPagesTests(SimpleTestCase):
+
+    def test_yields_every_page_and_stops_on_empty(self):
+        client = FakeOpenAQClient(pages=23)
+        pages = sorted(page for page, _ in iter_pages(client, workers=4, bucket=TokenBucket(0)))
+        self.assertEqual(pages, list(range(1, 24)))
+        # At most one in-flight page per worker past the end
+        self.assertLessEqual(len(client.calls), 23 + 4)
+
+    def test_fetch_error_is_reraised(self):
+        client = FakeOpenAQClient(pages=50, fail_on=7)
+        with self.assertRaises(RuntimeError):
+            list(iter_pages(client, workers=4, bucket=TokenBucket(0)))
+
+    def test_slow_worker_below_the_end_is_not_dropped(self):
+        class JitterBucket(TokenBucket):
+            """Rate-limited, with the token wait varying per call so pages get their tokens out of claim order."""
+
+            def __init__(self):
+                super().__init__(rate=500, capacity=4)
+                self.rng = random.Random(7)
+                self.rng_lock = threading.Lock()
+
+            def acquire(self):
+                super().acquire()
+                with self.rng_lock:
+                    delay = self.rng.uniform(0, 0.02)
+                time.sleep(delay)
+
+        for pages in (1, 6, 13):
+            # Empty pages answer at once, real ones slowly
+            client = FakeOpenAQClient(pages=pages, latency=lambda page, n=pages: 0 if page > n else 0.01)
+            got = sorted(page for page, _ in iter_pages(client, workers=4, bucket=JitterBucket()))
+            self.assertEqual(got, list(range(1, pages + 1)))
+
+    def test_start_page(self):
+        client = FakeOpenAQClient(pages=5)
+        pages = sorted(page for page, _ in iter_pages(client, workers=2, bucket=TokenBucket(0), start_page=4))
+        self.assertEqual(pages, [4, 5])
+
+
+class ResumableIngestionTests(TestCase):
+    OLD = '2024-01-01T00:00:00Z'
+    NEW = '2024-06-01T00:00:00Z'
+
+    def _run(self, client, **kwargs):
+        return ingest_locations_resumable(client, bbox=None, workers=1, bucket=TokenBucket(0), limit=3, **kwargs)
+
+    def test_resumes_after_the_last_completed_page(self):
+        with self.assertRaises(RuntimeError):
+            self._run(FakeOpenAQClient(pages=8, fail_on=5))
+        checkpoint = IngestionCheckpoint.objects.get(source=LOCATIONS_SOURCE, scope='all')
+        self.assertEqual(checkpoint.last_page, 4)
+        self.assertFalse(checkpoint.completed)
+
+        client = FakeOpenAQClient(pages=8)
+        stats, checkpoint = self._run(client)
+        self.assertEqual(min(client.calls), 5)
+        self.assertEqual(stats.pages, 4)
+        self.assertTrue(checkpoint.completed)
+        self.assertEqual(Location.objects.count(), 8 * 3)
+
+    def test_resume_with_another_limit_is_refused(self):
+        with self.assertRaises(RuntimeError):
+            self._run(FakeOpenAQClient(pages=8, fail_on=3))
+        with self.assertRaises(ValueError):
+            ingest_locations_resumable(FakeOpenAQClient(pages=8), bbox=None, workers=1, bucket=TokenBucket(0), limit=5)
+
+    def test_watermark_skips_locations_not_seen_since_last_run(self):
+        _, checkpoint = self._run(FakeOpenAQClient(pages=2, last_seen=lambda page: self.OLD))
+        self.assertEqual(checkpoint.watermark.isoformat(), '2024-01-01T00:00:00+00:00')
+
+        # Every location moved, but only page 2 has reported since the watermark
+        moved = FakeOpenAQClient(pages=2, lat=14.0, last_seen=lambda page: self.NEW if page == 2 else self.OLD)
+        stats, checkpoint = self._run(moved)
+        self.assertEqual((stats.rows, stats.skipped), (3, 3))
+        self.assertEqual(set(Location.objects.filter(latitude=14.0).values_list('location_id', flat=True)),
+                         {2000, 2001, 2002})
+        self.assertEqual(checkpoint.watermark.isoformat(), '2024-06-01T00:00:00+00:00')
+
+        # restart ignores the watermark
+        stats, _ = self._run(moved, restart=True)
+        self.assertEqual(Location.objects.filter(latitude=14.0).count(), 6)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "exercises the bulk_create fallback loader")
+class MeasurementIngestTests(TestCase):
+    T0 = datetime(2024, 6, 1, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        Location.objects.bulk_create([Location(location_id=i, latitude=13.0 + i, longitude=80.0) for i in (1, 2, 3)])
+
+    def _ingest(self, failing=(), windows=None):
+        from unittest import mock
+
+        def history(loc_id, lat, lon, start, end, api_key):
+            if windows is not None:
+                windows[loc_id] = (start, end)
+            if loc_id in failing:
+                raise measurements.UpstreamError("upstream down")
+            rows = [(loc_id, 'pm2_5', float(h), 'μg/m³', self.T0 + timedelta(hours=h)) for h in range(4)]
+            # a repeated reading, and one for a station that is not in Location
+            return rows + [rows[0], (99, 'pm2_5', 1.0, None, self.T0)]
+
+        with mock.patch.object(measurements, 'fetch_openweather_history', history):
+            return measurements.ingest_measurements(
+                'openweather', api_key='k', end=self.T0 + timedelta(days=1), workers=2, batch_size=5,
+            )
+
+    def test_rows_are_deduplicated_across_batches_and_runs(self):
+        stats, failures = self._ingest(failing=(3,))
+        self.assertEqual(failures, 1)
+        self.assertEqual(stats.rows, 8)
+        self.assertEqual(Measurement.objects.count(), 8)
+
+        # rerun: stations 1 and 2 return the same readings, station 3 is new
+        stats, failures = self._ingest()
+        self.assertEqual(failures, 0)
+        self.assertEqual(stats.rows, 4)
+        self.assertEqual(Measurement.objects.count(), 12)
+        self.assertEqual(
+            Measurement.objects.values('location_id', 'parameter', 'last_updated').distinct().count(), 12,
+        )
+        # rollups only ever saw the new readings
+        self.assertEqual(HourlyRollup.objects.filter(location_id=1).aggregate(n=Sum('count'))['n'], 4)
+
+    def test_openaq_readings_do_not_move_the_openweather_window(self):
+        from .history_store import SOURCE as HISTORY_SOURCE
+
+        measurements.load_measurements([(1, 'openaq.pm25', 5.0, 'µg/m³', self.T0 + timedelta(hours=20))])
+        windows = {}
+        self._ingest(failing=(3,), windows=windows)
+        end = self.T0 + timedelta(days=1)
+        self.assertEqual(windows[1], (end - timedelta(hours=24), end))
+
+        # loaded windows land in the history_store ledger; the failed one does not
+        ledger = dict(FetchedInterval.objects.filter(source=HISTORY_SOURCE).values_list('location_id', 'end'))
+        self.assertEqual(sorted(ledger), [1, 2])
+        self.assertEqual(ledger[1], end)
+
+        # the next run starts after the newest OpenWeather reading
+        self._ingest(windows=windows)
+        self.assertEqual(windows[1][0], self.T0 + timedelta(hours=3, seconds=1))
+
+
+class NormalizeCityTests(SimpleTestCase):
+
+    def test_spacing_case_and_width_collapse(self):
+        from .geocoding import normalize_city
+
+        self.assertEqual(normalize_city('Chennai ,  IN'), 'chennai,in')
+        self.assertEqual(normalize_city('  New   York , US '), 'new york,us')
+        self.assertEqual(normalize_city('ＣＨＥＮＮＡＩ'), 'chennai')
+        self.assertEqual(normalize_city('Chennai,,'), 'chennai')
+        self.assertEqual(normalize_city(None), '')
+
+
+class GeocodeLRUTests(SimpleTestCase):
+
+    def test_least_recently_used_is_evicted(self):
+        from .geocoding import _LRU, _MISSING
+
+        lru = _LRU(2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        self.assertEqual(lru.get('a'), 1)  # a is now the most recent
+        lru.set('c', 3)
+        self.assertIs(lru.get('b'), _MISSING)
+        self.assertEqual((lru.get('a'), lru.get('c')), (1, 3))
+
+    def test_entries_expire(self):
+        from .geocoding import _LRU, _MISSING
+
+        lru = _LRU(4)
+        lru.set('gone', None, ttl=0.02)
+        lru.set('kept', (1.0, 2.0))
+        self.assertIsNone(lru.get('gone'))
+        time.sleep(0.03)
+        self.assertIs(lru.get('gone'), _MISSING)
+        self.assertEqual(lru.get('kept'), (1.0, 2.0))
+
+    def test_concurrent_use_respects_maxsize(self):
+        from .geocoding import _LRU, _MISSING
+
+        lru = _LRU(50)
+        errors = []
+
+        def worker(n):
+            try:
+                for i in range(500):
+                    lru.set(f'{n}:{i}', i)
+                    value = lru.get(f'{n}:{i // 2}')
+                    if value is not _MISSING and value != i // 2:
+                        errors.append(value)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(lru._data), 50)
+
+
+class GeocodeCityTests(TestCase):
+    CHENNAI = [{'name': 'Chennai', 'lat': 13.0827, 'lon': 80.2707}]
+
+    def setUp(self):
+        from . import geocoding
+        geocoding.clear_cache()
+        self.addCleanup(geocoding.clear_cache)
+
+    def _geocode(self, q, upstream):
+        from unittest import mock
+
+        from . import geocoding
+
+        with mock.patch.object(geocoding, 'get_json', upstream):
+            return geocoding.geocode_city(q, 'key')
+
+    def test_hits_come_from_memory_then_the_table(self):
+        from unittest import mock
+
+        from . import geocoding
+        from .models import GeocodeCache
+
+        upstream = mock.Mock(return_value=self.CHENNAI)
+        self.assertEqual(self._geocode('Chennai, IN', upstream), (13.0827, 80.2707))
+        self.assertEqual(self._geocode('chennai,in', upstream), (13.0827, 80.2707))
+        self.assertEqual(upstream.call_count, 1)
+
+        # another worker (empty LRU) reads the shared table
+        geocoding.clear_cache()
+        self.assertEqual(self._geocode(' CHENNAI , in', upstream), (13.0827, 80.2707))
+        self.assertEqual(upstream.call_count, 1)
+        self.assertTrue(GeocodeCache.objects.get(query='chennai,in').found)
+
+    def test_not_found_is_cached_until_the_negative_ttl(self):
+        from unittest import mock
+
+        from django.utils import timezone
+
+        from . import geocoding
+        from .models import GeocodeCache
+
+        upstream = mock.Mock(return_value=[])
+        self.assertIsNone(self._geocode('Atlantis', upstream))
+        geocoding.clear_cache()
+        self.assertIsNone(self._geocode('atlantis', upstream))
+        self.assertEqual(upstream.call_count, 1)
+
+        with override_settings(GEOCODE_NEGATIVE_TTL=3600):
+            GeocodeCache.objects.filter(query='atlantis').update(updated_at=timezone.now() - timedelta(hours=2))
+            geocoding.clear_cache()
+            self.assertIsNone(self._geocode('Atlantis', upstream))
+        self.assertEqual(upstream.call_count, 2)
+
+    def test_upstream_errors_are_not_cached(self):
+        from unittest import mock
+
+        from .models import GeocodeCache
+        from .upstream import UpstreamConnectionError
+
+        with self.assertRaises(UpstreamConnectionError):
+            self._geocode('Chennai', mock.Mock(side_effect=UpstreamConnectionError('timed out')))
+        self.assertFalse(GeocodeCache.objects.exists())
+        upstream = mock.Mock(return_value=self.CHENNAI)
+        self.assertEqual(self._geocode('Chennai', upstream), (13.0827, 80.2707))
+        self.assertEqual(upstream.call_count, 1)
+
+    async def test_async_twin_shares_both_levels(self):
+        from unittest import mock
+
+        from . import geocoding
+        from .models import GeocodeCache
+
+        upstream = mock.AsyncMock(return_value=self.CHENNAI)
+        with mock.patch.object(geocoding, 'aget_json', upstream):
+            self.assertEqual(await geocoding.ageocode_city('Chennai', 'key'), (13.0827, 80.2707))
+            self.assertEqual(await geocoding.ageocode_city('chennai', 'key'), (13.0827, 80.2707))
+            geocoding.clear_cache()
+            self.assertEqual(await geocoding.ageocode_city('CHENNAI', 'key'), (13.0827, 80.2707))
+        self.assertEqual(upstream.await_count, 1)
+        self.assertTrue(await GeocodeCache.objects.filter(query='chennai', found=True).aexists())
+
+
+class MeasurementSeriesTests(TestCase):
+    T0 = datetime(2024, 6, 1, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        Location.objects.bulk_create([Location(location_id=i, latitude=13.0, longitude=80.0) for i in (1, 2)])
+        at = lambda h: self.T0 + timedelta(hours=h)  # noqa: E731
+        Measurement.objects.bulk_create([
+            Measurement(location_id=1, parameter='pm2_5', value=3.0, last_updated=at(3)),
+            Measurement(location_id=1, parameter='pm2_5', value=1.0, last_updated=at(1)),
+            Measurement(location_id=1, parameter='pm2_5', value=None, last_updated=at(2)),
+            Measurement(location_id=1, parameter='pm2_5', value=9.0, last_updated=at(9)),
+            Measurement(location_id=1, parameter='pm10', value=5.0, last_updated=at(1)),
+            Measurement(location_id=2, parameter='pm2_5', value=7.0, last_updated=at(1)),
+        ])
+
+    def test_one_station_and_parameter_in_order_with_inclusive_bounds(self):
+        from .timeseries import measurement_series
+
+        at = lambda h: self.T0 + timedelta(hours=h)  # noqa: E731
+        self.assertEqual(
+            measurement_series(1, 'pm2_5', at(1), at(3)),
+            [(at(1), 1.0), (at(2), None), (at(3), 3.0)],
+        )
+        self.assertEqual(measurement_series(1, 'pm2_5', at(4), at(8)), [])
+        self.assertEqual(measurement_series(2, 'pm10', at(0), at(9)), [])
+
+
+class PartitionHelperTests(SimpleTestCase):
+
+    def test_month_arithmetic_and_names(self):
+        from . import timeseries
+
+        self.assertEqual(timeseries._next_month(datetime(2024, 12, 1, tzinfo=dt_timezone.utc)),
+                         datetime(2025, 1, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(timeseries._month_start(datetime(2024, 2, 29, 23, 59, tzinfo=dt_timezone.utc)),
+                         datetime(2024, 2, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(timeseries.partition_name(datetime(2024, 3, 1)), 'api_measurement_p2024_03')
+
+    @unittest.skipIf(connection.vendor == 'postgresql', "checks the non-PostgreSQL no-op")
+    def test_partitioning_is_postgresql_only(self):
+        from . import timeseries
+
+        self.assertFalse(timeseries.is_partitioned())
+        self.assertEqual(timeseries.ensure_partitions(datetime(2024, 1, 1, tzinfo=dt_timezone.utc),
+                                                      datetime(2024, 6, 1, tzinfo=dt_timezone.utc)), 0)
+        with self.assertRaises(RuntimeError):
+            timeseries.convert_to_partitioned()
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "partitioning is PostgreSQL-only")
+class PartitionConversionTests(TestCase):
+
+    def setUp(self):
+        from . import timeseries
+        timeseries._partitioned = None
+        self.addCleanup(setattr, timeseries, '_partitioned', None)
+        Location.objects.create(location_id=1, latitude=13.0, longitude=80.0)
+        self.rows = [
+            Measurement.objects.create(location_id=1, parameter='pm2_5', value=float(i),
+                                       last_updated=datetime(2024, month, 15, tzinfo=dt_timezone.utc))
+            for i, month in enumerate((1, 2, 3))
+        ]
+        Measurement.objects.create(location_id=1, parameter='pm2_5', value=0.0, last_updated=None)
+        with connection.cursor() as cursor:
+            # Fire the deferred FK checks now: ALTER TABLE refuses tables with pending trigger events
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+    def _partitions(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = %s",
+                ['api_measurement'],
+            )
+            return {name for (name,) in cursor.fetchall()}
+
+    def test_convert_moves_timestamped_rows_and_keeps_constraints(self):
+        from django.db import IntegrityError, transaction
+
+        from . import timeseries
+
+        self.assertEqual(timeseries.convert_to_partitioned(months_ahead=1), 3)
+        self.assertTrue(timeseries.is_partitioned(refresh=True))
+        # rows without a timestamp cannot be placed in a partition and are dropped
+        self.assertEqual(Measurement.objects.count(), 3)
+        self.assertEqual(
+            sorted(Measurement.objects.values_list('id', flat=True)), sorted(m.id for m in self.rows),
+        )
+        partitions = self._partitions()
+        for month in (1, 2, 3):
+            self.assertIn(timeseries.partition_name(datetime(2024, month, 1)), partitions)
+        self.assertIn('api_measurement_default', partitions)
+
+        # the dedup key and the id sequence survive the rebuild
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Measurement.objects.create(location_id=1, parameter='pm2_5', value=1.0,
+                                       last_updated=datetime(2024, 1, 15, tzinfo=dt_timezone.utc))
+        new = Measurement.objects.create(location_id=1, parameter='pm2_5', value=1.0,
+                                         last_updated=datetime(2024, 1, 16, tzinfo=dt_timezone.utc))
+        self.assertGreater(new.id, max(m.id for m in self.rows))
+        self.assertEqual(timeseries.measurement_series(1, 'pm2_5', datetime(2024, 1, 1, tzinfo=dt_timezone.utc),
+                                                       datetime(2024, 1, 31, tzinfo=dt_timezone.utc))[-1][1], 1.0)
+
+        # already partitioned: a no-op
+        self.assertEqual(timeseries.convert_to_partitioned(), 0)
+
+    def test_ensure_partitions_creates_missing_months(self):
+        from . import timeseries
+
+        timeseries.convert_to_partitioned(months_ahead=0)
+        far = datetime(2031, 5, 20, tzinfo=dt_timezone.utc)
+        self.assertEqual(timeseries.ensure_partitions(far, far + timedelta(days=40)), 2)
+        partitions = self._partitions()
+        self.assertIn('api_measurement_p2031_05', partitions)
+        self.assertIn('api_measurement_p2031_06', partitions)
+        # idempotent
+        self.assertEqual(timeseries.ensure_partitions(far, far), 1)
+        Measurement.objects.create(location_id=1, parameter='pm10', value=2.0, last_updated=far)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM "api_measurement_p2031_05"')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+
+class TokenBucketTests(SimpleTestCase):
+
+    def test_rate_is_enforced_after_burst(self):
+        bucket = TokenBucket(rate=50, capacity=1)
+        started = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+        # first token is free, the next five need 5 / 50 s
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+
+class SingleFlightTests(SimpleTestCase):
+
+    def _burst(self, fn, n=8):
+        barrier = threading.Barrier(n)
+        outcomes = []
+
+        def worker():
+            barrier.wait()
+            try:
+                outcomes.append(singleflight.do('k', fn))
+            except Exception as e:
+                outcomes.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(n)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return outcomes
+
+    def test_concurrent_calls_share_one_fetch(self):
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.1)
+            return {'ok': True}
+
+        outcomes = self._burst(fetch)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(outcomes, [{'ok': True}] * 8)
+
+    def test_error_is_shared(self):
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.1)
+            raise RuntimeError("upstream down")
+
+        outcomes = self._burst(fetch)
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(isinstance(o, RuntimeError) for o in outcomes))
+
+    def test_async_awaiters_share_one_call(self):
+        import asyncio
+
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {'ok': True}
+
+        async def run():
+            return await asyncio.gather(*(singleflight.ado('async-k', fetch) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(run()), [{'ok': True}] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_cancelled_async_leader_does_not_cancel_followers(self):
+        import asyncio
+
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 'fresh'
+
+        async def run():
+            leader = asyncio.ensure_future(singleflight.ado('async-leader', fetch))
+            await asyncio.sleep(0)
+            followers = [asyncio.ensure_future(singleflight.ado('async-leader', fetch)) for _ in range(3)]
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            return await asyncio.gather(*followers)
+
+        # Followers fall back to their own call instead of inheriting the cancellation
+        self.assertEqual(asyncio.run(run()), ['fresh'] * 3)
+        self.assertEqual(len(calls), 4)
+        self.assertFalse(any(key == 'async-leader' for _, key in singleflight._async_inflight))
+
+    def test_key_ignores_appid_and_param_order(self):
+        a = singleflight.request_key('https://x', {'lat': 1, 'lon': 2, 'appid': 'a'})
+        b = singleflight.request_key('https://x', {'appid': 'b', 'lon': 2, 'lat': 1})
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, singleflight.request_key('https://x', {'lat': 1, 'lon': 3}))
+
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def test_opens_after_threshold_and_half_opens_after_cooldown(self):
+        breaker = CircuitBreaker(threshold=3, cooldown=0.05)
+        for _ in range(2):
+            breaker.record_failure()
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow())
+
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # only one trial call
+
+    def test_failed_trial_reopens_and_success_closes(self):
+        breaker = CircuitBreaker(threshold=1, cooldown=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertTrue(breaker.allow())
+
+    def test_cancelled_trial_frees_the_slot(self):
+        import asyncio
+        from unittest import mock
+
+        from . import circuit, upstream
+
+        url = 'https://example.test/cancelled'
+        breaker = circuit.get_breaker(url)
+        breaker.record_failure()
+        breaker.opened_at = time.monotonic() - breaker.cooldown - 1  # half-open now
+        started = asyncio.Event()
+
+        async def hang(*args):
+            started.set()
+            await asyncio.sleep(60)
+
+        async def run():
+            task = asyncio.ensure_future(upstream._afetch_json(url, None, None))
+            await started.wait()
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        try:
+            with mock.patch.object(upstream, '_arequest_json', hang):
+                asyncio.run(run())
+            self.assertEqual(breaker.state, HALF_OPEN)
+            self.assertTrue(breaker.allow())
+        finally:
+            circuit.reset()
+
+
+@override_settings(UPSTREAM_COALESCE=False, UPSTREAM_TIMEOUT=10)
+class UpstreamClientTests(SimpleTestCase):
+    URL = 'https://example.test/data'
+
+    def tearDown(self):
+        from . import circuit, upstream
+        circuit.reset()
+        upstream.reset_pool()
+
+    def _get(self, outcome, **kwargs):
+        from unittest import mock
+
+        from . import upstream
+
+        requests = []
+
+        def request(method, url, timeout=None):
+            requests.append((method, url, timeout))
+            if isinstance(outcome, Exception):
+                raise outcome
+            status, body = outcome
+            return SimpleNamespace(status=status, data=body, reason='Reason')
+
+        with mock.patch.object(upstream, 'get_pool', return_value=SimpleNamespace(request=request)):
+            try:
+                return upstream.get_json(self.URL, {'q': 'x'}, **kwargs), requests
+            except upstream.UpstreamError as e:
+                return e, requests
+
+    def test_json_body_and_timeouts(self):
+        result, requests = self._get((200, b'{"ok": 1}'), timeout=3)
+        self.assertEqual(result, {'ok': 1})
+        method, url, timeout = requests[0]
+        self.assertEqual((method, url), ('GET', self.URL + '?q=x'))
+        self.assertEqual(timeout.read_timeout, 3.0)
+        self.assertEqual(self._get((200, b'{}'))[1][0][2].read_timeout, 10.0)
+
+    def test_error_statuses(self):
+        from .upstream import UpstreamHTTPError
+
+        error, _ = self._get((404, b'{"message": "city not found"}'))
+        self.assertIsInstance(error, UpstreamHTTPError)
+        self.assertEqual((error.status, error.details), (404, {'message': 'city not found'}))
+
+        error, _ = self._get((503, b'<html>down</html>'))
+        self.assertEqual(error.status, 503)
+        self.assertEqual(error.details, {'message': 'HTTP Error 503: Reason'})
+
+    def test_invalid_json(self):
+        from .upstream import UpstreamDecodeError
+
+        error, _ = self._get((200, b'not json'))
+        self.assertIsInstance(error, UpstreamDecodeError)
+
+    def test_transport_failures(self):
+        import urllib3
+
+        from .upstream import UpstreamConnectionError
+
+        timeout = urllib3.exceptions.ReadTimeoutError(None, self.URL, "Read timed out.")
+        error, _ = self._get(timeout)
+        self.assertIsInstance(error, UpstreamConnectionError)
+        self.assertIn("Read timed out", error.reason)
+
+        exhausted = urllib3.exceptions.MaxRetryError(None, self.URL, reason=urllib3.exceptions.ProtocolError("reset"))
+        error, _ = self._get(exhausted)
+        self.assertIsInstance(error, UpstreamConnectionError)
+        self.assertEqual(error.reason, "reset")
+
+    @override_settings(UPSTREAM_RETRIES=4, UPSTREAM_BACKOFF=0.5)
+    def test_retry_policy(self):
+        from . import upstream
+
+        retry = upstream._build_retry()
+        self.assertEqual((retry.total, retry.connect, retry.read, retry.status), (4, 4, 4, 4))
+        self.assertEqual(retry.backoff_factor, 0.5)
+        self.assertEqual(set(retry.status_forcelist), {429, 500, 502, 503, 504})
+        self.assertEqual(retry.allowed_methods, frozenset(['GET']))
+        self.assertFalse(retry.raise_on_status)
+
+    def _serve(self, statuses):
+        import json
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        hits = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status = statuses[min(len(hits), len(statuses) - 1)]
+                hits.append(status)
+                body = json.dumps({'status': status}).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f'http://127.0.0.1:{server.server_address[1]}/data', hits
+
+    @override_settings(UPSTREAM_RETRIES=2, UPSTREAM_BACKOFF=0)
+    def test_transient_statuses_are_retried(self):
+        from . import upstream
+
+        upstream.reset_pool()
+        url, hits = self._serve([503, 502, 200])
+        self.assertEqual(upstream.get_json(url), {'status': 200})
+        self.assertEqual(hits, [503, 502, 200])
+
+        upstream.reset_pool()
+        url, hits = self._serve([503])
+        with self.assertRaises(upstream.UpstreamHTTPError) as ctx:
+            upstream.get_json(url)
+        self.assertEqual(ctx.exception.status, 503)
+        self.assertEqual(len(hits), 3)  # first try + UPSTREAM_RETRIES
+
+        upstream.reset_pool()
+        url, hits = self._serve([404])
+        with self.assertRaises(upstream.UpstreamHTTPError):
+            upstream.get_json(url)
+        self.assertEqual(len(hits), 1)
+
+
+class AsyncFetchTests(SimpleTestCase):
+    URL = 'https://example.test/async'
+
+    def tearDown(self):
+        from . import circuit
+        circuit.reset()
+
+    def _fetch(self, outcome):
+        import asyncio
+        from unittest import mock
+
+        from . import upstream
+
+        calls = []
+
+        async def request(*args):
+            calls.append(args)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        with mock.patch.object(upstream, '_arequest_json', request):
+            try:
+                return asyncio.run(upstream._afetch_json(self.URL, None, None)), calls
+            except Exception as e:
+                return e, calls
+
+    @override_settings(UPSTREAM_BREAKER_THRESHOLD=2, UPSTREAM_BREAKER_COOLDOWN=60)
+    def test_breaker_sees_async_outcomes(self):
+        from . import circuit, upstream
+
+        self.assertEqual(self._fetch({'ok': 1}), ({'ok': 1}, [(self.URL, None, None)]))
+
+        # a 4xx means upstream is healthy
+        error, _ = self._fetch(upstream.UpstreamHTTPError(404, {}))
+        self.assertIsInstance(error, upstream.UpstreamHTTPError)
+        self.assertEqual(circuit.get_breaker(self.URL).state, CLOSED)
+
+        for outcome in (upstream.UpstreamHTTPError(503, {}), upstream.UpstreamConnectionError('reset')):
+            self._fetch(outcome)
+        self.assertEqual(circuit.get_breaker(self.URL).state, OPEN)
+
+        error, calls = self._fetch({'ok': 1})
+        self.assertIsInstance(error, upstream.UpstreamUnavailableError)
+        self.assertEqual(calls, [])
+
+
+class ModelManagerTests(SimpleTestCase):
+
+    def test_concurrent_first_calls_load_once(self):
+        loads = []
+
+        def loader(path):
+            loads.append(path)
+            time.sleep(0.05)
+            return object()
+
+        manager = ModelManager(path=__file__, loader=loader)
+        barrier = threading.Barrier(8)
+        models = []
+
+        def worker():
+            barrier.wait()
+            models.append(manager.get()[0])
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(loads), 1)
+        self.assertEqual(len(set(map(id, models))), 1)
+        self.assertEqual(manager.state, READY)
+
+    @override_settings(MODEL_RETRY_BACKOFF=0.05, MODEL_RETRY_BACKOFF_MAX=1)
+    def test_failure_is_cached_until_backoff(self):
+        calls = []
+
+        def loader(path):
+            calls.append(path)
+            raise ImportError("No module named 'tensorflow'")
+
+        manager = ModelManager(path=__file__, loader=loader)
+        self.assertEqual(manager.get(), (None, "No module named 'tensorflow'"))
+        manager.get()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(manager.state, FAILED)
+
+        time.sleep(0.06)
+        manager.get()
+        self.assertEqual(len(calls), 2)
+
+    @override_settings(AQI_MODEL_BACKEND='auto')
+    def test_unconverted_keras_file_falls_back_to_tensorflow(self):
+        from unittest import mock
+
+        from . import aqi_model
+
+        with tempfile.TemporaryDirectory() as tmp:
+            h5 = os.path.join(tmp, 'model.h5')
+            with mock.patch.object(aqi_model.model_formats, 'detect_format', return_value='keras'), \
+                    mock.patch.object(aqi_model.model_formats, 'load', return_value='model') as load:
+                with mock.patch.object(aqi_model, '_tensorflow_available', return_value=True):
+                    self.assertEqual(aqi_model.load_model(h5), 'model')
+                load.assert_called_once_with(h5, 'keras')
+
+                # without TensorFlow the missing .npz is the error to report
+                with mock.patch.object(aqi_model, '_tensorflow_available', return_value=False):
+                    with self.assertRaisesRegex(FileNotFoundError, 'convert_aqi_model'):
+                        aqi_model.load_model(h5)
+
+                # once converted, the .npz wins even with TensorFlow installed
+                open(aqi_model.weights_path(h5), 'wb').close()
+                load.reset_mock()
+                with mock.patch.object(aqi_model, '_tensorflow_available', return_value=True):
+                    aqi_model.load_model(h5)
+                load.assert_called_once_with(aqi_model.weights_path(h5), 'numpy')
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'response-cache-tests'}},
+    RESPONSE_CACHE_GRID_DEG=0.05,
+    RESPONSE_CACHE_MIN_TTL=60,
+)
+class ResponseCacheTests(SimpleTestCase):
+
+    def test_grid_cell_and_center(self):
+        self.assertEqual(response_cache.grid_cell(13.08, 80.27), (261, 1605))
+        self.assertEqual(response_cache.grid_cell(-0.01, -0.01), (-1, -1))
+        self.assertEqual(response_cache.grid_cell(13.08, 80.27, grid_deg=1.0), (13, 80))
+        self.assertEqual(response_cache.cell_center((261, 1605)), (13.075, 80.275))
+
+    def test_non_positive_grid_is_rejected(self):
+        for grid_deg in (0, -0.05):
+            with self.assertRaises(ValueError):
+                response_cache.grid_cell(13.08, 80.27, grid_deg=grid_deg)
+            with self.assertRaises(ValueError):
+                response_cache.cell_center((0, 0), grid_deg=grid_deg)
+        with override_settings(RESPONSE_CACHE_GRID_DEG=0):
+            with self.assertRaises(ValueError):
+                response_cache.grid_cell(13.08, 80.27)
+
+    def test_ttl_runs_to_the_next_upstream_refresh(self):
+        now = 100000.0
+        self.assertEqual(response_cache.ttl_for('air', int(now) - 100, now=now), 3500)
+        self.assertEqual(response_cache.ttl_for('weather', int(now) - 100, now=now), 500)
+        # overdue, missing or future dt
+        self.assertEqual(response_cache.ttl_for('air', int(now) - 7200, now=now), 60)
+        self.assertEqual(response_cache.ttl_for('air', None, now=now), 60)
+        self.assertEqual(response_cache.ttl_for('air', int(now) + 600, now=now), 3600)
+
+    def test_miss_hit_then_stale_with_background_refresh(self):
+        from django.core.cache import cache
+
+        calls = []
+
+        def fetch(lat, lon):
+            calls.append((lat, lon))
+            return {'list': [{'dt': int(time.time())}], 'n': len(calls)}
+
+        payload, state = response_cache.get_or_fetch('air', 13.08, 80.27, fetch)
+        self.assertEqual((payload['n'], state), (1, response_cache.MISS))
+        self.assertEqual(calls, [(13.075, 80.275)])
+
+        payload, state = response_cache.get_or_fetch('air', 13.09, 80.26, fetch)
+        self.assertEqual((payload['n'], state), (1, response_cache.HIT))
+        self.assertEqual(len(calls), 1)
+
+        key = response_cache.cache_key('air', (261, 1605))
+        cache.set(key, {**cache.get(key), 'fresh_until': 0})
+        payload, state = response_cache.get_or_fetch('air', 13.08, 80.27, fetch)
+        self.assertEqual((payload['n'], state), (1, response_cache.STALE))
+
+        deadline = time.monotonic() + 2
+        while key in response_cache._refreshing and time.monotonic() < deadline:
+            time.sleep(0.01)
+        payload, state = response_cache.get_or_fetch('air', 13.08, 80.27, fetch)
+        self.assertEqual((payload['n'], state), (2, response_cache.HIT))
+
+
+class RollupTests(SimpleTestCase):
+
+    def test_aggregate_merges_readings_per_bucket(self):
+        def at(hour, minute):
+            return datetime(2024, 6, 1, hour, minute, tzinfo=dt_timezone.utc)
+
+        rows = [
+            (1, 'pm2_5', 10.0, at(8, 5)),
+            (1, 'pm2_5', 30.0, at(8, 40)),
+            (1, 'pm2_5', 20.0, at(8, 59)),
+            (1, 'pm2_5', 99.0, at(9, 0)),
+            (1, 'pm10', 5.0, at(8, 10)),
+            (2, 'pm2_5', 7.0, at(8, 10)),
+            (1, 'pm2_5', None, at(8, 20)),
+        ]
+        hourly = rollups._aggregate(rows, rollups.HOUR)
+        self.assertEqual(hourly[(1, 'pm2_5', at(8, 0))], [3, 60.0, 10.0, 30.0])
+        self.assertEqual(hourly[(1, 'pm2_5', at(9, 0))], [1, 99.0, 99.0, 99.0])
+        self.assertEqual(hourly[(1, 'pm10', at(8, 0))], [1, 5.0, 5.0, 5.0])
+        self.assertEqual(hourly[(2, 'pm2_5', at(8, 0))], [1, 7.0, 7.0, 7.0])
+        self.assertEqual(len(hourly), 4)
+
+        daily = rollups._aggregate(rows, rollups.DAY)
+        self.assertEqual(daily[(1, 'pm2_5', at(0, 0))], [4, 159.0, 10.0, 99.0])
+
+    def test_auto_resolution(self):
+        day, hour = rollups.DAY, rollups.HOUR
+        self.assertEqual(rollups.auto_resolution(2 * day, 1000), 'raw')
+        self.assertEqual(rollups.auto_resolution(2 * day + 1, 1000), 'hour')
+        self.assertEqual(rollups.auto_resolution(1000 * hour, 1000), 'hour')
+        self.assertEqual(rollups.auto_resolution(1000 * hour + 1, 1000), 'day')
+        self.assertEqual(rollups.auto_resolution(365 * day, 1000), 'day')
+
+
+class MissingIntervalsTests(SimpleTestCase):
+
+    @staticmethod
+    def h(hour):
+        return datetime(2024, 6, 1, tzinfo=dt_timezone.utc) + timedelta(hours=hour)
+
+    def gaps(self, covered, start, end):
+        h = self.h
+        return [(a.hour, b.hour) for a, b in missing_intervals([(h(a), h(b)) for a, b in covered], h(start), h(end))]
+
+    def test_nothing_covered(self):
+        self.assertEqual(self.gaps([], 2, 10), [(2, 10)])
+
+    def test_fully_covered(self):
+        self.assertEqual(self.gaps([(0, 12)], 2, 10), [])
+        self.assertEqual(self.gaps([(2, 10)], 2, 10), [])
+
+    def test_overlapping_and_adjacent_intervals_merge(self):
+        self.assertEqual(self.gaps([(5, 8), (2, 4), (4, 6)], 2, 10), [(8, 10)])
+        self.assertEqual(self.gaps([(2, 5), (5, 10)], 2, 10), [])
+
+    def test_gaps_at_head_middle_and_tail(self):
+        self.assertEqual(self.gaps([(4, 6)], 2, 10), [(2, 4), (6, 10)])
+        self.assertEqual(self.gaps([(0, 3), (5, 7)], 2, 10), [(3, 5), (7, 10)])
+        self.assertEqual(self.gaps([(1, 3), (8, 12)], 2, 10), [(3, 8)])
+
+    def test_intervals_outside_the_window_are_ignored(self):
+        self.assertEqual(self.gaps([(0, 1), (11, 12)], 2, 10), [(2, 10)])
+
+
+@unittest.skipUnless(importlib.util.find_spec('numpy'), "needs numpy")
+class MicroBatcherTests(SimpleTestCase):
+
+    class SumModel:
+        def __init__(self):
+            self.calls = []
+
+        def predict(self, X, verbose=0):
+            self.calls.append(len(X))
+            time.sleep(0.01)
+            return X.sum(axis=1, keepdims=True)
+
+    def test_concurrent_requests_share_a_predict(self):
+        import numpy as np
+
+        from .batching import MicroBatcher
+
+        batcher = MicroBatcher(max_rows=1000, max_wait=0.05)
+        model = self.SumModel()
+        results = {}
+
+        def worker(i):
+            results[i] = batcher.predict(model, np.full((i + 1, 3), i, dtype=float))
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertLess(len(model.calls), 8)
+        self.assertEqual(sum(model.calls), sum(range(1, 9)))
+        for i in range(8):
+            np.testing.assert_array_equal(results[i], np.full((i + 1, 1), 3 * i))
+
+    def test_errors_reach_every_caller(self):
+        from .batching import MicroBatcher
+
+        def fail(X, verbose=0):
+            raise ValueError("bad input")
+
+        batcher = MicroBatcher(max_rows=10, max_wait=0)
+        with self.assertRaises(ValueError):
+            batcher.predict(SimpleNamespace(predict=fail), [[1.0, 2.0]])
+
+    def test_worker_survives_base_exceptions(self):
+        from .batching import MicroBatcher
+
+        calls = []
+
+        def flaky(X, verbose=0):
+            calls.append(1)
+            if len(calls) == 1:
+                raise SystemExit("native crash")
+            return X.sum(axis=1, keepdims=True)
+
+        batcher = MicroBatcher(max_rows=10, max_wait=0, timeout=5)
+        model = SimpleNamespace(predict=flaky)
+        with self.assertRaises(SystemExit):
+            batcher.predict(model, [[1.0, 2.0]])
+        worker = batcher._thread
+        self.assertEqual(batcher.predict(model, [[1.0, 2.0]]).tolist(), [[3.0]])
+        self.assertIs(batcher._thread, worker)
+
+    def test_caller_gives_up_after_the_timeout(self):
+        from concurrent.futures import TimeoutError as FutureTimeout
+
+        from .batching import MicroBatcher
+
+        def slow(X, verbose=0):
+            time.sleep(0.3)
+            return X
+
+        batcher = MicroBatcher(max_rows=10, max_wait=0, timeout=0.05)
+        started = time.monotonic()
+        with self.assertRaises(FutureTimeout):
+            batcher.predict(SimpleNamespace(predict=slow), [[1.0]])
+        self.assertLess(time.monotonic() - started, 0.25)
+
+
+@unittest.skipUnless(importlib.util.find_spec('numpy'), "needs numpy")
+class LocationIndexTests(SimpleTestCase):
+    STATIONS = {1: (13.08, 80.27), 2: (12.97, 77.59), 3: (28.61, 77.21), 4: (19.07, 72.88), 5: (-33.87, 151.21)}
+
+    @staticmethod
+    def haversine(a, b):
+        import math
+        lat1, lon1, lat2, lon2 = map(math.radians, (*a, *b))
+        h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+        return 2 * 6371000.0 * math.asin(math.sqrt(h))
+
+    def _index(self):
+        from .spatial import LocationIndex
+        return LocationIndex(list(self.STATIONS), list(self.STATIONS.values()))
+
+    def test_nearest_matches_haversine(self):
+        q = (13.0, 80.0)
+        expected = sorted((self.haversine(q, c), i) for i, c in self.STATIONS.items())[:3]
+        got = self._index().nearest(*q, k=3)
+        self.assertEqual([i for i, _ in got], [i for _, i in expected])
+        for (_, dist), (exp, _) in zip(got, expected):
+            self.assertAlmostEqual(dist, exp, delta=1.0)
+
+    @unittest.skipUnless(importlib.util.find_spec('scipy'), "needs scipy")
+    def test_tree_matches_linear_scan(self):
+        from unittest import mock
+
+        from . import spatial
+
+        rng = random.Random(7)
+        stations = {i: (rng.uniform(-80, 80), rng.uniform(-180, 180)) for i in range(1, 400)}
+        points = [(rng.uniform(-80, 80), rng.uniform(-180, 180)) for _ in range(20)]
+
+        def answers():
+            index = spatial.LocationIndex(list(stations), list(stations.values()))
+            return (
+                [index.nearest(*p, k=3) for p in points],
+                index.nearest_many(points, k=3),
+                [index.within(*p, 800000) for p in points],
+            )
+
+        tree = answers()
+        self.assertIsNotNone(spatial.LocationIndex([1], [(0.0, 0.0)]).tree)
+        with mock.patch.object(spatial, 'cKDTree', None):
+            scan = answers()
+        for got, expected in zip(tree, scan):
+            for a, b in zip(got, expected):
+                self.assertEqual([i for i, _ in a], [i for i, _ in b])
+                for (_, x), (_, y) in zip(a, b):
+                    self.assertAlmostEqual(x, y, delta=1.0)
+
+    def test_nearest_many_matches_single_queries(self):
+        index = self._index()
+        points = [(13.0, 80.0), (28.0, 77.0), (-30.0, 150.0)]
+        many = index.nearest_many(points, k=2)
+        for point, hits in zip(points, many):
+            single = index.nearest(*point, k=2)
+            self.assertEqual([i for i, _ in hits], [i for i, _ in single])
+            for (_, a), (_, b) in zip(hits, single):
+                self.assertAlmostEqual(a, b, delta=1.0)
+
+    def test_distance_chunks_agree(self):
+        from .distance import haversine, nearest_k
+
+        lats, lons = zip(*self.STATIONS.values())
+        full_idx, full_dist = nearest_k(lats, lons, lats, lons, k=3)
+        idx, dist = nearest_k(lats, lons, lats, lons, k=3, max_elements=7)
+        self.assertEqual(idx.tolist(), full_idx.tolist())
+        self.assertTrue((abs(dist - full_dist) < 1e-6).all())
+        self.assertEqual(list(idx[:, 0]), list(range(5)))
+        self.assertTrue((dist[:, 0] < 1e-6).all())
+        self.assertAlmostEqual(dist[0, 1], float(haversine(lats[0], lons[0], lats[idx[0, 1]], lons[idx[0, 1]])), delta=1e-6)
+
+    def test_within_radius(self):
+        hits = self._index().within(13.0, 80.0, 400000)
+        self.assertEqual([i for i, _ in hits], [1, 2])
+
+    def test_row_updates(self):
+        original = self._index()
+        index = original.with_row(6, (13.01, 80.01))
+        self.assertEqual(index.nearest(13.0, 80.0)[0][0], 6)
+        index = index.with_row(6, (0.0, 0.0))
+        self.assertEqual(index.nearest(13.0, 80.0)[0][0], 1)
+        index = index.without(1).with_row(2, None)
+        self.assertEqual(len(index), 4)
+        self.assertEqual(list(index.ids), [3, 4, 5, 6])
+        self.assertEqual(index.nbytes, 4 * 48)
+        # Snapshots held by readers never change
+        self.assertEqual(list(original.ids), [1, 2, 3, 4, 5])
+        self.assertEqual(original.nearest(13.0, 80.0)[0][0], 1)
+
+
+@unittest.skipUnless(importlib.util.find_spec('numpy'), "needs numpy")
+@override_settings(INFERENCE_BATCHING=False)
+class NearestLocationsViewTests(SimpleTestCase):
+    URL = '/api/locations/nearest/'
+
+    def _post(self, body, exists=True):
+        from unittest import mock
+
+        from . import views
+
+        hits = {(13.08, 80.27): [(1, 10.0), (2, 250.0), (3, 900.0)], (28.6, 77.2): []}
+
+        def within(lat, lon, radius_m):
+            return [hit for hit in hits[(lat, lon)] if hit[1] <= radius_m]
+
+        with mock.patch.object(views.spatial, 'locations_within', side_effect=within) as locations_within, \
+                mock.patch.object(views.spatial, 'nearest_locations_many') as nearest_many, \
+                mock.patch.object(views.Location.objects, 'exists', return_value=exists):
+            response = self.client.post(self.URL, body, content_type='application/json')
+        nearest_many.assert_not_called()
+        self.assertEqual(locations_within.call_count, len(body['points']))
+        return response
+
+    def test_radius_limits_each_point(self):
+        body = {'points': [{'lat': 13.08, 'lon': 80.27}, {'lat': 28.6, 'lon': 77.2}], 'k': 1, 'radius_m': 500}
+        response = self._post(body)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['radius_m'], 500)
+        near, far = data['results']
+        self.assertEqual(near['nearest'], [{'location_id': 1, 'distance_m': 10.0}])
+        self.assertEqual(far['nearest'], [])
+
+        body['k'] = 5
+        self.assertEqual([h['location_id'] for h in self._post(body).json()['results'][0]['nearest']], [1, 2])
+
+    def test_nothing_in_range_is_not_a_missing_table(self):
+        body = {'points': [{'lat': 28.6, 'lon': 77.2}], 'radius_m': 1000}
+        self.assertEqual(self._post(body).status_code, 200)
+        self.assertEqual(self._post(body, exists=False).status_code, 404)
+
+
+class DashboardViewTests(SimpleTestCase):
+    URL = '/api/dashboard/?lat=13.08&lon=80.27'
+
+    def _get(self, air, weather):
+        from unittest import mock
+
+        from . import views
+
+        def outcome(result):
+            def run(*args):
+                if isinstance(result, Exception):
+                    raise result
+                return result
+            return run
+
+        with mock.patch.object(views.decouple, 'config', return_value='key'), \
+                mock.patch.object(views, '_air_quality_payload', outcome(air)), \
+                mock.patch.object(views, '_weather_payload', outcome(weather)):
+            return self.client.get(self.URL)
+
+    def test_both_sections(self):
+        response = self._get({'aqi': 2}, ({'location': {'name': 'Chennai'}}, 'miss'))
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['air'], {'aqi': 2})
+        self.assertEqual(body['weather']['result'], {'location': {'name': 'Chennai'}})
+        self.assertFalse(body['weather']['cached'])
+        self.assertNotIn('errors', body)
+
+    def test_one_failing_section_degrades_only_that_section(self):
+        from .upstream import UpstreamConnectionError
+
+        response = self._get(KeyError('list'), ({'location': {}}, 'hit'))
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertIsNone(body['air'])
+        self.assertIn('air', body['errors'])
+        self.assertTrue(body['weather']['cached'])
+
+        response = self._get({'aqi': 3}, UpstreamConnectionError('timed out'))
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['air'], {'aqi': 3})
+        self.assertIsNone(body['weather'])
+        self.assertIn('timed out', body['errors']['weather']['error'])
+
+    def test_both_failing_is_an_error(self):
+        from .upstream import UpstreamConnectionError
+
+        response = self._get(UpstreamConnectionError('reset'), TypeError('bad payload'))
+        # the worse of the two section statuses (502 from upstream, 500 from the section)
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(set(response.json()['errors']), {'air', 'weather'})
+
+
+class BatchPredictionTests(SimpleTestCase):
+
+    def test_jobs_share_one_predict_call(self):
+        from unittest import mock
+
+        from . import views
+
+        calls = []
+
+        def predict(X, verbose=0):
+            calls.append(len(X))
+            return X[:, :1] * 2
+
+        jobs = [
+            ([[1.0] * 8, [2.0] * 8], [{'dt': 1}, {'dt': 2}], 1),
+            ([], [], 2),
+            ([[3.0] * 8], [{'dt': 1}], 3),
+        ]
+        with mock.patch.object(views.inference, 'get_model', return_value=(SimpleNamespace(predict=predict), None)):
+            out = views._run_aqi_models(jobs)
+        self.assertEqual(calls, [3])
+        self.assertEqual(out[0]['scalar'], [2.0, 4.0])
+        self.assertFalse(out[1]['loaded'])
+        self.assertEqual(out[2]['scalar'], [6.0])
+
+
+class PredictBatchViewTests(SimpleTestCase):
+    URL = '/api/aqi/predict/batch/'
+    ITEMS = [{'dt': 1717200000, 'components': {k: 1.0 for k in ('co', 'no', 'no2', 'o3', 'so2', 'pm2_5', 'pm10', 'nh3')},
+              'main': {'aqi': 2}}]
+
+    def _post(self, body, history, nearest=None, geocoded=None):
+        from unittest import mock
+
+        from . import views
+
+        if nearest is None:
+            def nearest(points, k):
+                return [[(100 + i, 500.0)] for i, _ in enumerate(points)]
+
+        with mock.patch.object(views.decouple, 'config', return_value='key'), \
+                mock.patch.object(views, 'geocode_city', return_value=geocoded), \
+                mock.patch.object(views.spatial, 'nearest_locations_many', side_effect=nearest), \
+                mock.patch.object(views, '_prediction_history', side_effect=history), \
+                mock.patch.object(views.inference, 'get_model', return_value=(None, 'no model')):
+            return self.client.post(self.URL, body, content_type='application/json')
+
+    def test_failures_stay_with_their_location(self):
+        from .upstream import UpstreamConnectionError
+
+        def history(lat, lon, loc_id, dist, start, end, api_key):
+            if lat == 28.6:
+                raise UpstreamConnectionError('timed out')
+            return self.ITEMS, {'source': 'upstream'}
+
+        body = {'locations': [{'lat': 13.08, 'lon': 80.27}, {'lat': 28.6, 'lon': 77.2}, {'q': 'Atlantis'}], 'hours': 24}
+        response = self._post(body, history)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['count'], data['failed']), (3, 2))
+        ok, upstream_down, unknown_city = data['results']
+        self.assertEqual(ok['location']['nearest_location_id'], 100)
+        self.assertEqual(ok['count'], 1)
+        self.assertFalse(ok['model']['loaded'])
+        self.assertEqual(upstream_down['status'], 502)
+        self.assertEqual(unknown_city['status'], 404)
+
+    def test_all_failed_returns_the_worst_status(self):
+        from .upstream import UpstreamHTTPError
+
+        def history(*args):
+            raise UpstreamHTTPError(503, {'message': 'busy'})
+
+        body = {'locations': [{'lat': 13.08, 'lon': 80.27}, {'q': 'Atlantis'}], 'hours': 24}
+        response = self._post(body, history)
+        self.assertEqual(response.status_code, 503)
+        data = response.json()
+        self.assertEqual(data['failed'], 2)
+        self.assertEqual([r['status'] for r in data['results']], [503, 404])
+
+    def test_out_of_range_coordinates_are_rejected(self):
+        from unittest import mock
+
+        history = mock.Mock()
+        for point in ({'lat': 91, 'lon': 0}, {'lat': 0, 'lon': -180.5}):
+            response = self._post({'locations': [{'lat': 13.08, 'lon': 80.27}, point]}, history)
+            self.assertEqual(response.status_code, 400)
+        history.assert_not_called()
+
+
+@unittest.skipUnless(importlib.util.find_spec('adrf'), "needs adrf")
+class AsyncViewTests(SimpleTestCase):
+    ITEMS = PredictBatchViewTests.ITEMS
+
+    def _call(self, view_name, params, patches):
+        import asyncio
+        from contextlib import ExitStack
+        from unittest import mock
+
+        from django.test import RequestFactory
+
+        from . import async_views
+
+        with ExitStack() as stack:
+            stack.enter_context(mock.patch.object(async_views.decouple, 'config', return_value='key'))
+            for target, name, value in patches:
+                stack.enter_context(mock.patch.object(target, name, value))
+            request = RequestFactory().get('/api/', params)
+            return asyncio.run(getattr(async_views, view_name)(request))
+
+    def test_latest_measurements(self):
+        from unittest import mock
+
+        from . import async_views
+        from .upstream import UpstreamConnectionError
+
+        async def aget_or_fetch(kind, lat, lon, fetch, **kwargs):
+            return await fetch(13.075, 80.275), response_cache.MISS
+
+        air = {'list': [{'dt': 1717200000, 'main': {'aqi': 2}, 'components': {'pm2_5': 12.5}}]}
+        for outcome, status in ((mock.AsyncMock(return_value=air), 200),
+                                (mock.AsyncMock(side_effect=UpstreamConnectionError('timed out')), 502)):
+            response = self._call('latest_measurements', {'lat': 13.08, 'lon': 80.27}, [
+                (async_views.response_cache, 'aget_or_fetch', aget_or_fetch),
+                (async_views, 'aget_json', outcome),
+            ])
+            self.assertEqual(response.status_code, status)
+            outcome.assert_awaited_once_with(async_views.AIR_POLLUTION_ENDPOINT, {'lat': 13.075, 'lon': 80.275, 'appid': 'key'})
+        self.assertEqual(response.data['error'], 'Failed to reach OpenWeather: timed out')
+
+    def _predict(self, station, patches):
+        from unittest import mock
+
+        from . import async_views, views
+
+        return self._call('predict_aqi', {'lat': 13.08, 'lon': 80.27, 'hours': 24}, [
+            (async_views.spatial, 'nearest_location', mock.Mock(return_value=(100, 500.0))),
+            (views.history_store, 'station_coords', mock.Mock(return_value=station)),
+            (views.inference, 'get_model', mock.Mock(return_value=(None, 'no model'))),
+            *patches,
+        ])
+
+    def test_predict_aqi_from_the_store(self):
+        from unittest import mock
+
+        from . import async_views
+
+        aget_history = mock.AsyncMock(return_value=(self.ITEMS, {'gaps_fetched': 1, 'rows_loaded': 1}))
+        aget_json = mock.AsyncMock()
+        response = self._predict((13.0, 80.2), [
+            (async_views.history_store, 'aget_history', aget_history),
+            (async_views, 'aget_json', aget_json),
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['history'], {'source': 'store', 'gaps_fetched': 1, 'rows_loaded': 1})
+        self.assertEqual(response.data['location']['nearest_location_id'], 100)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(aget_history.await_args.args[:3], (100, 13.0, 80.2))
+        aget_json.assert_not_awaited()
+
+    def test_predict_aqi_from_upstream(self):
+        from unittest import mock
+
+        from . import async_views
+        from .upstream import UpstreamHTTPError
+
+        aget_json = mock.AsyncMock(return_value={'list': self.ITEMS})
+        response = self._predict(None, [(async_views, 'aget_json', aget_json)])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['history'], {'source': 'upstream'})
+        self.assertFalse(response.data['model']['loaded'])
+        url, params = aget_json.await_args.args
+        self.assertEqual(url, async_views.HISTORY_ENDPOINT)
+        self.assertEqual((params['lat'], params['lon'], params['appid']), (13.08, 80.27, 'key'))
+
+        response = self._predict(None, [(async_views, 'aget_json', mock.AsyncMock(side_effect=UpstreamHTTPError(503, {})))])
+        self.assertEqual(response.status_code, 503)
+
+
+class PreloadTests(SimpleTestCase):
+
+    def _after_fork(self, backend):
+        from unittest import mock
+
+        from . import preload
+
+        conn = SimpleNamespace(connection=object())
+        with mock.patch.object(preload.connections, 'all', return_value=[conn]) as all_connections, \
+                mock.patch.object(preload.upstream, 'reset_after_fork') as reset_upstream, \
+                mock.patch.object(preload.inference, 'get_executor', return_value=SimpleNamespace(name=backend)), \
+                mock.patch.object(preload.inference, 'warmup_in_background') as warmup:
+            preload.after_fork()
+        all_connections.assert_called_once_with(initialized_only=True)
+        self.assertIsNone(conn.connection)
+        reset_upstream.assert_called_once_with()
+        return warmup
+
+    def test_after_fork_resets_shared_resources(self):
+        from . import inference
+
+        self.assertEqual(self._after_fork(inference.INLINE).call_count, 0)
+
+    def test_after_fork_starts_the_pool_for_the_process_backend(self):
+        from . import inference
+
+        self.assertEqual(self._after_fork(inference.PROCESS).call_count, 1)
+
+    def test_preload_warms_inline_model_and_freezes_gc(self):
+        import gc
+        from unittest import mock
+
+        from . import inference, preload
+
+        self.addCleanup(gc.unfreeze)
+        for backend, warmed in ((inference.INLINE, 1), (inference.PROCESS, 0)):
+            with mock.patch.object(preload.inference, 'get_executor', return_value=SimpleNamespace(name=backend)), \
+                    mock.patch.object(preload.aqi_model, 'warmup', return_value=True) as warmup, \
+                    mock.patch.object(preload.spatial, 'use_postgis', return_value=True), \
+                    mock.patch.object(preload.connections, 'close_all') as close_all:
+                timings = preload.preload()
+            self.assertEqual(warmup.call_count, warmed)
+            self.assertEqual('model_loaded' in timings, bool(warmed))
+            close_all.assert_called_once_with()
+            self.assertGreater(gc.get_freeze_count(), 0)
+
+
+class InferenceExecutorTests(SimpleTestCase):
+
+    @override_settings(INFERENCE_EXECUTOR='inline')
+    def test_inline_backend_uses_the_process_model(self):
+        from . import inference
+
+        executor = inference.get_executor()
+        self.assertIsInstance(executor, inference.InlineExecutor)
+        self.assertEqual(inference.stats(), {'backend': 'inline'})
+
+    @override_settings(INFERENCE_EXECUTOR='gpu')
+    def test_unknown_backend(self):
+        from . import inference
+
+        with self.assertRaises(ValueError):
+            inference.get_executor()
+
+    def test_timed_out_pool_is_replaced(self):
+        from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+        from . import inference
+
+        class StuckPool:
+            _processes = {}
+
+            def __init__(self):
+                self.shut_down = False
+
+            def submit(self, fn, *args):
+                return Future()
+
+            def shutdown(self, wait=True, cancel_futures=False):
+                self.shut_down = True
+
+        executor = inference.PoolExecutor(workers=1, timeout=0.01)
+        pool = executor._pool = StuckPool()
+        with self.assertRaises(FutureTimeout):
+            executor._submit(inference._describe)
+        self.assertIsNone(executor._pool)
+        self.assertTrue(pool.shut_down)
+        self.assertEqual(executor.restarts, 1)
+
+    def test_pool_workers_are_not_server_processes(self):
+        from unittest import mock
+
+        from . import inference
+        from .apps import _is_server_process
+
+        with mock.patch('sys.argv', ['gunicorn']), mock.patch.dict(os.environ):
+            os.environ.pop(inference.WORKER_ENV, None)
+            self.assertTrue(_is_server_process())
+            os.environ[inference.WORKER_ENV] = '1'
+            self.assertFalse(_is_server_process())
+
+
+@unittest.skipUnless(
+    importlib.util.find_spec('tensorflow') and importlib.util.find_spec('h5py'),
+    "parity check needs TensorFlow and h5py",
+)
+class NumpyModelParityTests(SimpleTestCase):
+
+    def test_matches_keras_predict(self):
+        import numpy as np
+        from tensorflow import keras
+
+        from .numpy_model import DenseModel, convert_keras_h5
+
+        model = keras.Sequential([
+            keras.Input(shape=(8,)),
+            keras.layers.Dense(32, activation='relu'),
+            keras.layers.BatchNormalization(),
+            keras.layers.Dropout(0.2),
+            keras.layers.Dense(16, activation='tanh'),
+            keras.layers.Dense(1),
+        ])
+        X = np.random.default_rng(0).uniform(0, 300, size=(64, 8)).astype('float32')
+        # Move BatchNormalization statistics away from their identity defaults
+        model.compile(optimizer='adam', loss='mse')
+        model.fit(X, X.sum(axis=1, keepdims=True), epochs=2, verbose=0)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            h5 = os.path.join(tmp, 'model.h5')
+            npz = os.path.join(tmp, 'model.npz')
+            model.save(h5)
+            convert_keras_h5(h5).save(npz)
+            converted = DenseModel.load(npz)
+
+        expected = model.predict(X, verbose=0)
+        np.testing.assert_allclose(converted.predict(X), expected, rtol=1e-4, atol=1e-3)
+
+
+@unittest.skipUnless(importlib.util.find_spec('numpy'), "needs numpy")
+class NumpyConverterTests(SimpleTestCase):
+
+    def test_relu_layer_options_are_honoured(self):
+        import numpy as np
+
+        from .numpy_model import DenseModel, _convert_layer
+
+        spec, arrays = _convert_layer('ReLU', {'max_value': 6.0, 'negative_slope': 0.1, 'threshold': 1.0}, {})
+        self.assertEqual(arrays, {})
+        x = np.array([[-4.0, 0.5, 1.0, 3.0, 10.0]], dtype=np.float32)
+        np.testing.assert_allclose(DenseModel([spec], [arrays]).predict(x), [[-0.5, -0.05, 0.0, 3.0, 6.0]], rtol=1e-6)
+
+        plain, _ = _convert_layer('ReLU', {'name': 're_lu', 'max_value': None}, {})
+        np.testing.assert_allclose(DenseModel([plain], [{}]).predict(x), [[0.0, 0.5, 1.0, 3.0, 10.0]])
+
+    def test_dense_activation_with_relu_options_is_rejected(self):
+        from .numpy_model import _convert_layer
+
+        relu6 = {'class_name': 'ReLU', 'config': {'name': 'relu', 'max_value': 6.0}}
+        with self.assertRaisesRegex(ValueError, 'ReLU'):
+            _convert_layer('Dense', {'activation': relu6}, {})
+        spec, _ = _convert_layer('Dense', {'activation': {'class_name': 'ReLU', 'config': {'name': 'relu'}}}, {})
+        self.assertEqual(spec['activation'], 'relu')
+        self.assertIsNone(_convert_layer('Dropout', {'rate': 0.2}, {}))
+
+
+@unittest.skipUnless(importlib.util.find_spec('numpy'), "needs numpy")
+class JoblibModelTests(SimpleTestCase):
+    COLUMNS = ['location_id', 'year', 'month', 'day', 'hour', 'parameter_no2', 'parameter_pm25', 'parameter_temperature']
+
+    def _model(self, estimator=None):
+        from .model_formats import JoblibModel
+        return JoblibModel(estimator, {'feature_columns': self.COLUMNS})
+
+    def test_rows_follow_stored_column_order(self):
+        model = self._model()
+        # 2024-03-05 07:00 UTC
+        rows, index = model.feature_rows(42, [1709622000])
+        self.assertEqual(index, [(0, 'no2'), (0, 'pm2_5')])
+        self.assertEqual(rows[0], [42, 2024, 3, 5, 7, 1, 0, 0])
+        self.assertEqual(rows[1], [42, 2024, 3, 5, 7, 0, 1, 0])
+
+    def test_unmodelled_components_are_none(self):
+        from .measurements import FEATURE_KEYS
+
+        # Predicts the one-hot position of the parameter, so each output is traceable
+        estimator = SimpleNamespace(predict=lambda X: X[:, 5] * 10 + X[:, 6] * 20)
+        out = self._model(estimator).predict_components(42, [1709622000, None])
+        self.assertEqual(out[0][FEATURE_KEYS.index('no2')], 10)
+        self.assertEqual(out[0][FEATURE_KEYS.index('pm2_5')], 20)
+        self.assertIsNone(out[0][FEATURE_KEYS.index('co')])
+        self.assertEqual(out[1], [None] * len(FEATURE_KEYS))
@@ -0,0 +1,151 @@
+"""
+Time-series access to Measurement.
+
+Range reads go through :func:`measurement_series`, which filters on
+(location, parameter, last_updated) so PostgreSQL can answer from the
+``uniq_measurement_point`` btree (same column order) and, when the table is
+partitioned, prune to the months covering [start, end].
+
+Monthly range partitioning is optional and PostgreSQL-only: run
+``manage.py partition_measurements --convert`` once to turn api_measurement into
+a table partitioned by last_updated; afterwards the loader creates the monthly
+partitions it needs on the fly (:func:`ensure_partitions`).
+"""
+from datetime import datetime, timezone as dt_timezone
+from typing import List, Optional, Tuple
+
+from django.db import connection, transaction
+
+from .models import Measurement
+
+TABLE = 'api_measurement'
+
+_partitioned: Optional[bool] = None
+
+
+def measurement_series(location_id: int, parameter: str, start: datetime, end: datetime) -> List[Tuple[datetime, Optional[float]]]:
+    """(last_updated, value) pairs for one station/pollutant in [start, end], oldest first."""
+    return list(
+        Measurement.objects.filter(
+            location_id=location_id,
+            parameter=parameter,
+            last_updated__gte=start,
+            last_updated__lte=end,
+        ).order_by('last_updated').values_list('last_updated', 'value')
+    )
+
+
+# --- Partitioning (PostgreSQL only) ---
+
+def _month_start(dt: datetime) -> datetime:
+    return datetime(dt.year, dt.month, 1, tzinfo=dt_timezone.utc)
+
+
+def _next_month(dt: datetime) -> datetime:
+    return datetime(dt.year + (dt.month == 12), dt.month % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{TABLE}_p{month.year:04d}_{month.month:02d}"
+
+
+def is_partitioned(refresh: bool = False) -> bool:
+    global _partitioned
+    if connection.vendor != 'postgresql':
+        return False
+    if _partitioned is None or refresh:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s)",
+                [TABLE],
+            )
+            _partitioned = bool(cursor.fetchone()[0])
+    return _partitioned
+
+
+def ensure_partitions(start: datetime, end: datetime) -> int:
+    """Create any missing monthly partitions covering [start, end]; returns how many were checked."""
+    if not is_partitioned():
+        return 0
+    month = _month_start(start.astimezone(dt_timezone.utc))
+    last = _month_start(end.astimezone(dt_timezone.utc))
+    count = 0
+    with connection.cursor() as cursor:
+        while month <= last:
+            nxt = _next_month(month)
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS "{partition_name(month)}" PARTITION OF "{TABLE}" '
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{nxt.isoformat()}')"
+            )
+            month = nxt
+            count += 1
+    return count
+
+
+def convert_to_partitioned(months_ahead: int = 3) -> int:
+    """
+    Rebuild api_measurement as a table range-partitioned by month on last_updated.
+
+    Existing rows are copied across. Partition keys must be part of every unique
+    constraint, so the primary key becomes (id, last_updated) and last_updated
+    becomes NOT NULL (the loader already drops rows without a timestamp).
+    Returns the number of rows moved.
+    """
+    global _partitioned
+    if connection.vendor != 'postgresql':
+        raise RuntimeError("Partitioning is only supported on PostgreSQL")
+    if is_partitioned(refresh=True):
+        return 0
+
+    try:
+        return _convert(months_ahead)
+    except Exception:
+        _partitioned = None
+        raise
+
+
+def _convert(months_ahead: int) -> int:
+    global _partitioned
+    legacy = f"{TABLE}_legacy"
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE "{TABLE}" RENAME TO "{legacy}"')
+        cursor.execute(
+            f'CREATE TABLE "{TABLE}" (LIKE "{legacy}" INCLUDING DEFAULTS INCLUDING IDENTITY) '
+            f'PARTITION BY RANGE (last_updated)'
+        )
+        cursor.execute(f'SELECT min(last_updated), max(last_updated), max(id) FROM "{legacy}"')
+        lo, hi, max_id = cursor.fetchone()
+        now = datetime.now(dt_timezone.utc)
+        lo = lo or now
+        hi = max(hi or now, now)
+        ahead = _month_start(hi)
+        for _ in range(months_ahead):
+            ahead = _next_month(ahead)
+        _partitioned = True
+        ensure_partitions(lo, ahead)
+        cursor.execute(f'CREATE TABLE "{TABLE}_default" PARTITION OF "{TABLE}" DEFAULT')
+
+        cursor.execute(
+            f'INSERT INTO "{TABLE}" (id, location_id, parameter, value, unit, last_updated) '
+            f'SELECT id, location_id, parameter, value, unit, last_updated FROM "{legacy}" '
+            f'WHERE last_updated IS NOT NULL'
+        )
+        moved = cursor.rowcount
+        cursor.execute(f'DROP TABLE "{legacy}" CASCADE')
+
+        # Recreate keys/indexes after the bulk copy (faster), keeping Django's names
+        cursor.execute(f'ALTER TABLE "{TABLE}" ALTER COLUMN last_updated SET NOT NULL')
+        cursor.execute(f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "{TABLE}_pkey" PRIMARY KEY (id, last_updated)')
+        cursor.execute(
+            f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "uniq_measurement_point" '
+            f'UNIQUE (location_id, parameter, last_updated)'
+        )
+        cursor.execute(
+            f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "{TABLE}_location_id_fk" FOREIGN KEY (location_id) '
+            f'REFERENCES api_location (location_id) DEFERRABLE INITIALLY DEFERRED'
+        )
+        cursor.execute(f'CREATE INDEX "api_measure_locatio_9feeb6_idx" ON "{TABLE}" (location_id)')
+        cursor.execute(f'CREATE INDEX "api_measurement_last_updated_brin" ON "{TABLE}" USING BRIN (last_updated)')
+        if max_id is not None:
+            cursor.execute(f'ALTER TABLE "{TABLE}" ALTER COLUMN id RESTART WITH {int(max_id) + 1}')
+    return moved
@@ -0,0 +1,306 @@
+"""
+Shared HTTP client for upstream APIs (OpenWeather).
+
+Every view goes through :func:`get_json` so that connection pooling, keep-alive,
+timeouts and the retry policy are configured in one place instead of building a
+fresh ``urllib.request.Request`` (and paying a new TCP+TLS handshake) per call.
+
+Concurrent identical calls are coalesced into one (api/singleflight.py), and a
+per-endpoint circuit breaker (api/circuit.py) fails fast while upstream is down.
+
+:func:`aget_json` is the non-blocking twin used by the async views
+(api/async_views.py): same timeouts, retry statuses, breakers and coalescing,
+on a shared ``httpx.AsyncClient`` per event loop.
+
+Tuning lives in settings (``UPSTREAM_*``); see ``myapp/settings.py``.
+"""
+import asyncio
+import json
+import threading
+from typing import Any, Optional
+from urllib.parse import urlencode
+
+import httpx
+import urllib3
+from django.conf import settings
+
+from . import circuit, singleflight
+
+USER_AGENT = "AirQualityChecker/1.0"
+
+# Transient upstream statuses worth retrying (429 honours Retry-After)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Statuses that count against the circuit breaker (other 4xx mean upstream is healthy)
+BREAKER_STATUSES = frozenset(RETRY_STATUSES)
+
+
+class UpstreamError(Exception):
+    """Base class for failures talking to an upstream API."""
+
+
+class UpstreamHTTPError(UpstreamError):
+    """Upstream answered with a 4xx/5xx status."""
+
+    def __init__(self, status: int, details: Any):
+        super().__init__(f"HTTP Error {status}")
+        self.status = status
+        self.details = details
+
+    def __reduce__(self):
+        return type(self), (self.status, self.details)
+
+
+class UpstreamConnectionError(UpstreamError):
+    """Upstream could not be reached (DNS, connect/read timeout, reset...)."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+    def __reduce__(self):
+        return type(self), (self.reason,)
+
+
+class UpstreamUnavailableError(UpstreamConnectionError):
+    """The endpoint's circuit breaker is open; no request was made."""
+
+
+class UpstreamDecodeError(UpstreamError):
+    """Upstream answered 2xx but the body was not valid JSON."""
+
+
+_pool: Optional[urllib3.PoolManager] = None
+_pool_lock = threading.Lock()
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def _build_retry() -> urllib3.Retry:
+    retries = int(_setting('UPSTREAM_RETRIES', 2))
+    return urllib3.Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=float(_setting('UPSTREAM_BACKOFF', 0.3)),
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(['GET']),
+        respect_retry_after_header=True,
+        # Hand the final error response back to us instead of raising MaxRetryError
+        raise_on_status=False,
+    )
+
+
+def _build_timeout(read: Optional[float] = None) -> urllib3.Timeout:
+    return urllib3.Timeout(
+        connect=float(_setting('UPSTREAM_CONNECT_TIMEOUT', 5)),
+        read=float(read if read is not None else _setting('UPSTREAM_TIMEOUT', 10)),
+    )
+
+
+def get_pool() -> urllib3.PoolManager:
+    """Return the process-wide pool manager (one keep-alive pool per host)."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = urllib3.PoolManager(
+                    num_pools=int(_setting('UPSTREAM_NUM_POOLS', 10)),
+                    maxsize=int(_setting('UPSTREAM_POOL_MAXSIZE', 10)),
+                    # Never block request threads waiting for a pooled connection;
+                    # overflow connections are opened and discarded instead.
+                    block=False,
+                    retries=_build_retry(),
+                    timeout=_build_timeout(),
+                    headers={"User-Agent": USER_AGENT},
+                )
+    return _pool
+
+
+def reset_pool() -> None:
+    """Drop all pooled connections (e.g. after changing settings or forking)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.clear()
+        _pool = None
+
+
+def reset_after_fork() -> None:
+    """In a forked child: forget the parent's pools (its sockets are not ours to reuse or close)."""
+    global _pool, _pool_lock
+    _pool_lock = threading.Lock()
+    _pool = None
+    _async_clients.clear()
+
+
+def get_json(url: str, params: Optional[dict] = None, timeout: Optional[float] = None) -> Any:
+    """
+    GET ``url`` with ``params`` and return the decoded JSON body.
+
+    Concurrent calls for the same URL and params (ignoring ``appid``) share one
+    upstream request and its outcome unless UPSTREAM_COALESCE is off.
+
+    Raises UpstreamHTTPError, UpstreamConnectionError or UpstreamDecodeError;
+    views translate these into their own error responses.
+    """
+    if not _setting('UPSTREAM_COALESCE', True):
+        return _fetch_json(url, params, timeout)
+    return singleflight.do(
+        singleflight.request_key(url, params),
+        lambda: _fetch_json(url, params, timeout),
+        share_errors=(UpstreamError,),
+    )
+
+
+def _fetch_json(url: str, params: Optional[dict], timeout: Optional[float]) -> Any:
+    breaker = circuit.get_breaker(url)
+    if not breaker.allow():
+        raise UpstreamUnavailableError(
+            f"{circuit.endpoint_key(url)} unavailable, retrying in {breaker.retry_after():.0f}s"
+        )
+    try:
+        result = _request_json(url, params, timeout)
+    except UpstreamHTTPError as e:
+        if e.status in BREAKER_STATUSES:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        raise
+    except Exception:
+        breaker.record_failure()
+        raise
+    except BaseException:
+        # Cancelled (client disconnect, cancelled leader): no verdict, but free the trial slot
+        breaker.release_trial()
+        raise
+    breaker.record_success()
+    return result
+
+
+def _request_json(url: str, params: Optional[dict], timeout: Optional[float]) -> Any:
+    full_url = f"{url}?{urlencode(params)}" if params else url
+    try:
+        resp = get_pool().request('GET', full_url, timeout=_build_timeout(timeout))
+    except urllib3.exceptions.MaxRetryError as e:
+        raise UpstreamConnectionError(str(e.reason or e)) from e
+    except urllib3.exceptions.HTTPError as e:
+        raise UpstreamConnectionError(str(e)) from e
+
+    if resp.status >= 400:
+        try:
+            details = json.loads(resp.data.decode('utf-8'))
+        except Exception:
+            details = {"message": f"HTTP Error {resp.status}: {resp.reason}"}
+        raise UpstreamHTTPError(resp.status, details)
+
+    try:
+        return json.loads(resp.data.decode('utf-8'))
+    except Exception as e:
+        raise UpstreamDecodeError(str(e)) from e
+
+
+# --- Async client ---
+
+_async_clients = {}
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    """The AsyncClient bound to the running event loop (clients cannot cross loops)."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        for other in [l for l in _async_clients if l.is_closed()]:
+            del _async_clients[other]
+        client = _async_clients[loop] = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=None,
+                max_keepalive_connections=int(_setting('UPSTREAM_POOL_MAXSIZE', 10)),
+            ),
+            # Connection-level retries (DNS, refused, reset); status retries are ours
+            transport=httpx.AsyncHTTPTransport(retries=int(_setting('UPSTREAM_RETRIES', 2))),
+            headers={"User-Agent": USER_AGENT},
+        )
+    return client
+
+
+def _async_timeout(read: Optional[float] = None) -> httpx.Timeout:
+    return httpx.Timeout(
+        float(read if read is not None else _setting('UPSTREAM_TIMEOUT', 10)),
+        connect=float(_setting('UPSTREAM_CONNECT_TIMEOUT', 5)),
+    )
+
+
+def _retry_delay(resp: httpx.Response, attempt: int) -> float:
+    retry_after = resp.headers.get('Retry-After')
+    if retry_after is not None:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+    return float(_setting('UPSTREAM_BACKOFF', 0.3)) * (2 ** attempt)
+
+
+async def _arequest_json(url: str, params: Optional[dict], timeout: Optional[float]) -> Any:
+    client = _get_async_client()
+    retries = int(_setting('UPSTREAM_RETRIES', 2))
+    attempt = 0
+    while True:
+        try:
+            resp = await client.get(url, params=params, timeout=_async_timeout(timeout))
+        except httpx.HTTPError as e:
+            raise UpstreamConnectionError(str(e) or type(e).__name__) from e
+        if resp.status_code in RETRY_STATUSES and attempt < retries:
+            await asyncio.sleep(_retry_delay(resp, attempt))
+            attempt += 1
+            continue
+        break
+
+    if resp.status_code >= 400:
+        try:
+            details = resp.json()
+        except Exception:
+            details = {"message": f"HTTP Error {resp.status_code}: {resp.reason_phrase}"}
+        raise UpstreamHTTPError(resp.status_code, details)
+
+    try:
+        return resp.json()
+    except Exception as e:
+        raise UpstreamDecodeError(str(e)) from e
+
+
+async def _afetch_json(url: str, params: Optional[dict], timeout: Optional[float]) -> Any:
+    breaker = circuit.get_breaker(url)
+    if not breaker.allow():
+        raise UpstreamUnavailableError(
+            f"{circuit.endpoint_key(url)} unavailable, retrying in {breaker.retry_after():.0f}s"
+        )
+    try:
+        result = await _arequest_json(url, params, timeout)
+    except UpstreamHTTPError as e:
+        if e.status in BREAKER_STATUSES:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        raise
+    except Exception:
+        breaker.record_failure()
+        raise
+    except BaseException:
+        # Cancelled (client disconnect, cancelled leader): no verdict, but free the trial slot
+        breaker.release_trial()
+        raise
+    breaker.record_success()
+    return result
+
+
+async def aget_json(url: str, params: Optional[dict] = None, timeout: Optional[float] = None) -> Any:
+    """Async :func:`get_json`: same errors, breakers and coalescing, without blocking a thread."""
+    if not _setting('UPSTREAM_COALESCE', True):
+        return await _afetch_json(url, params, timeout)
+    return await singleflight.ado(
+        singleflight.request_key(url, params),
+        lambda: _afetch_json(url, params, timeout),
+    )
@@ -1,15 +1,27 @@
 
+from django.conf import settings
 from django.urls import path
 
 from . import views
 
+# Upstream-bound views have ASGI-native twins (api/async_views.py)
+if settings.ASYNC_VIEWS:
+    from . import async_views as io_views
+else:
+    io_views = views
+
 urlpatterns = [
-    path('aqi/latest/', views.latest_measurements, name='latest_measurements'),
+    path('aqi/latest/', io_views.latest_measurements, name='latest_measurements'),
     path('aqi/insert/', views.instert_data, name='insert_data'),
-    path('weather/latest/', views.latest_weather, name='latest_weather'),
-    path('aqi/predict/', views.predict_aqi, name='predict_aqi'),
-    path('generate-report/', views.generate_report, name='generate_report'),
-    path('prediction-followup/', views.prediction_followup, name='prediction_followup'),
+    path('weather/latest/', io_views.latest_weather, name='latest_weather'),
+    path('dashboard/', views.dashboard, name='dashboard'),
+    path('aqi/predict/', io_views.predict_aqi, name='predict_aqi'),
+    path('aqi/predict/batch/', views.predict_aqi_batch, name='predict_aqi_batch'),
+    path('aqi/history/', views.aqi_history, name='aqi_history'),
+    path('locations/nearest/', views.nearest_locations, name='nearest_locations'),
+    path('model/status/', views.model_status, name='model_status'),
+    path('generate-report/', io_views.generate_report, name='generate_report'),
+    path('prediction-followup/', io_views.prediction_followup, name='prediction_followup'),
 ]
 
 # myapp.urls +/+ api.urls
\ No newline at end of file
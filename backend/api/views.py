@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.db import connections
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from openaq import OpenAQ
@@ -9,124 +11,116 @@ from .serializers import (
     PredictAQIResponseSerializer,
     GenerateReportRequestSerializer,
     GenerateReportResponseSerializer,
+    AQIHistoryQuerySerializer,
+    NearestLocationsRequestSerializer,
+    PredictAQIBatchRequestSerializer,
 )
-from django.contrib.gis.geos import Point
-import json
-from urllib.request import urlopen, Request
-from urllib.parse import urlencode
-from urllib.error import URLError, HTTPError
+from . import aqi_model, batching, history_store, inference, response_cache, rollups, spatial
+from .geocoding import geocode_city
+from .ingestion import DEFAULT_BBOX, ingest_locations
+from .measurements import AQI_PARAMETER, FEATURE_KEYS, HISTORY_ENDPOINT
+from .upstream import (
+    UpstreamError,
+    UpstreamHTTPError,
+    UpstreamConnectionError,
+    get_json,
+)
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 import math
 from typing import Optional, Tuple, List
-import os
-
 
 
-# --- Optional TensorFlow model cache ---
-_aqi_model = None
-_aqi_model_path = None
-_aqi_model_error = None
-
-def _get_aqi_model():
-    global _aqi_model, _aqi_model_path, _aqi_model_error
-    if _aqi_model is not None:
-        return _aqi_model, None
-    try:
-        # Lazy import TensorFlow/Keras
-        from tensorflow.keras.models import load_model  # type: ignore
-        # Model path relative to backend directory (../Models/AQI_prediction_model.h5)
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # backend/
-        model_path = os.path.abspath(os.path.join(base_dir, '..', 'Models', 'AQI_prediction_model.h5'))
-        _aqi_model_path = model_path
-        if not os.path.exists(model_path):
-            raise FileNotFoundError(f"Model file not found at {model_path}")
-        _aqi_model = load_model(model_path)
-        return _aqi_model, None
-    except Exception as e:
-        _aqi_model_error = str(e)
-        return None, _aqi_model_error
+def _upstream_error_response(exc: UpstreamError, error: str, unreachable: str, invalid: str, include_status: bool = False):
+    """Translate an upstream client failure into the API's error response."""
+    if isinstance(exc, UpstreamHTTPError):
+        payload = {"error": error}
+        if include_status:
+            payload["status_code"] = exc.status
+        payload["details"] = exc.details
+        return Response(payload, status=exc.status if 400 <= exc.status < 600 else 502)
+    if isinstance(exc, UpstreamConnectionError):
+        return Response({"error": f"{unreachable}: {exc.reason}"}, status=502)
+    return Response({"error": invalid}, status=502)
 
-# Create your views here.
 
-@api_view(['GET'])
-def latest_measurements(request):
-    # Use OpenWeather Air Pollution API instead of OpenAQ
-    api_key = decouple.config("OPENWEATHER_API", default=None) or decouple.config("OPENWHEATHER_API", default=None)
-    if not api_key:
-        return Response({"error": "OpenWeather API key missing. Set OPENWEATHER_API in backend/.env"}, status=500)
+DEFAULT_COORDS = (13.0827, 80.2707)  # Chennai, IN fallback
 
-    # Accept lat/lon or city query; default to Chennai, IN
-    # Validate query params via serializer
-    query_serializer = PredictAQIQuerySerializer(data=request.query_params)
-    if not query_serializer.is_valid():
-        return Response({'error': 'Invalid query parameters', 'details': query_serializer.errors}, status=400)
 
-    q_city = query_serializer.validated_data.get('q') or query_serializer.validated_data.get('city')
-    lat_param = query_serializer.validated_data.get('lat')
-    lon_param = query_serializer.validated_data.get('lon')
-    default_lat, default_lon = 13.0827, 80.2707
+def _resolve_coordinates(validated: dict, api_key: str):
+    """
+    Resolve (lat, lon) from validated query params: lat/lon > city (geocoded) > default.
 
-    # Resolve coordinates
-    lat_val = None
-    lon_val = None
+    Returns ((lat, lon), None) or (None, error Response).
+    """
+    q_city = validated.get('q') or validated.get('city')
+    lat_param = validated.get('lat')
+    lon_param = validated.get('lon')
     try:
         if lat_param is not None and lon_param is not None:
-            lat_val = float(lat_param)
-            lon_val = float(lon_param)
-        elif q_city:
-            # Geocode city to coordinates
-            geo_endpoint = 'https://api.openweathermap.org/geo/1.0/direct'
-            geo_params = {'q': q_city, 'limit': 1, 'appid': api_key}
-            geo_url = f"{geo_endpoint}?{urlencode(geo_params)}"
-            try:
-                req = Request(geo_url, headers={"User-Agent": "AirQualityChecker/1.0"})
-                with urlopen(req, timeout=10) as resp:
-                    geo_body = resp.read().decode('utf-8')
-                geo_data = json.loads(geo_body)
-            except HTTPError as e:
-                try:
-                    err_json = json.loads(e.read().decode('utf-8'))
-                except Exception:
-                    err_json = {"message": str(e)}
-                return Response({"error": "Geocoding failed", "details": err_json}, status=e.code if 400 <= e.code < 600 else 502)
-            except URLError as e:
-                return Response({"error": f"Failed to reach OpenWeather Geocoding: {e.reason}"}, status=502)
-            except Exception:
-                return Response({"error": "Invalid Geocoding response"}, status=502)
-
-            if not geo_data:
-                return Response({"error": "City not found"}, status=404)
-            lat_val = float(geo_data[0].get('lat'))
-            lon_val = float(geo_data[0].get('lon'))
-        else:
-            lat_val = default_lat
-            lon_val = default_lon
+            return (float(lat_param), float(lon_param)), None
     except ValueError:
-        return Response({"error": "lat and lon must be valid numbers"}, status=400)
-
-    # Fetch air pollution data
-    air_endpoint = 'https://api.openweathermap.org/data/2.5/air_pollution'
-    air_params = {'lat': lat_val, 'lon': lon_val, 'appid': api_key}
-    air_url = f"{air_endpoint}?{urlencode(air_params)}"
+        return None, Response({"error": "lat and lon must be valid numbers"}, status=400)
+    if not q_city:
+        return DEFAULT_COORDS, None
 
+    # Geocode city to coordinates
     try:
-        req = Request(air_url, headers={"User-Agent": "AirQualityChecker/1.0"})
-        with urlopen(req, timeout=10) as resp:
-            body = resp.read().decode('utf-8')
-    except HTTPError as e:
-        try:
-            err_json = json.loads(e.read().decode('utf-8'))
-        except Exception:
-            err_json = {"message": str(e)}
-        return Response({"error": "OpenWeather Air Pollution API error", "details": err_json}, status=e.code if 400 <= e.code < 600 else 502)
-    except URLError as e:
-        return Response({"error": f"Failed to reach OpenWeather: {e.reason}"}, status=502)
-
+        coords = geocode_city(q_city, api_key)
+    except UpstreamError as e:
+        return None, _upstream_error_response(e, "Geocoding failed", "Failed to reach OpenWeather Geocoding", "Invalid Geocoding response")
+    except (TypeError, ValueError, AttributeError):
+        return None, Response({"error": "Invalid Geocoding response"}, status=502)
+    if coords is None:
+        return None, Response({"error": "City not found"}, status=404)
+    return coords, None
+
+
+def _parse_ts(val: Optional[str]) -> Optional[int]:
+    if not val:
+        return None
+    # Accept Unix seconds or ISO-8601 (UTC)
     try:
-        data = json.loads(body)
+        # numeric seconds
+        return int(float(val))
+    except ValueError:
+        pass
+    try:
+        dt = datetime.fromisoformat(val.replace('Z', '+00:00'))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return int(dt.timestamp())
     except Exception:
-        return Response({"error": "Invalid JSON from OpenWeather"}, status=502)
+        return None
+
+
+def _resolve_time_range(validated: dict) -> Tuple[int, int]:
+    """(start, end) Unix seconds from start/end, else `hours` (default 24) back from now."""
+    start_ts = _parse_ts(validated.get('start'))
+    end_ts = _parse_ts(validated.get('end'))
+    if start_ts is None or end_ts is None:
+        now_utc = datetime.now(timezone.utc)
+        hours_q = validated.get('hours')
+        lookback_h = int(hours_q) if hours_q is not None else 24
+        end_ts = int(now_utc.timestamp())
+        start_ts = int((now_utc - timedelta(hours=lookback_h)).timestamp())
+    return start_ts, end_ts
+
+AIR_POLLUTION_ENDPOINT = 'https://api.openweathermap.org/data/2.5/air_pollution'
+WEATHER_ENDPOINT = 'https://api.openweathermap.org/data/2.5/weather'
 
+
+def _air_quality_payload(api_key: str, lat_val: float, lon_val: float) -> dict:
+    """Body of /api/aqi/latest/ for resolved coordinates; raises UpstreamError."""
+    # Shared per grid cell, see api/response_cache.py
+    def fetch_air(cell_lat, cell_lon):
+        return get_json(AIR_POLLUTION_ENDPOINT, {'lat': cell_lat, 'lon': cell_lon, 'appid': api_key})
+
+    data, cache_state = response_cache.get_or_fetch('air', lat_val, lon_val, fetch_air)
+    return _air_quality_body(data, cache_state, lat_val, lon_val)
+
+
+def _air_quality_body(data: dict, cache_state: str, lat_val: float, lon_val: float) -> dict:
     lst = data.get('list') or []
     first = lst[0] if lst else {}
     main = first.get('main', {}) or {}
@@ -156,161 +150,29 @@ def latest_measurements(request):
 
     count = sum(1 for r in results if r['value'] is not None)
 
-    return Response({
+    return {
         'message': 'Latest air pollution from OpenWeather',
         'coordinates': {'lat': lat_val, 'lon': lon_val},
         'aqi': main.get('aqi'),
         'timestamp_utc': dt,
         'count': count,
         'results': results,
-    })
-
-
-@api_view(['GET'])
-def instert_data(request):
-    OPENAQ_API = decouple.config("OPENAQ_API")
-    client = OpenAQ(OPENAQ_API)
-    page = 1
-    limit = 100
-    inserted_count = 0
-
-    while True:
-        response = client.locations.list(
-            bbox=(76.1667, 7.9119, 80.8167, 13.6453),
-            limit=limit,
-            page=page
-        )
-        # OpenAQ SDK may return a list, or an object with a .results list
-        locations = getattr(response, 'results', None)
-        if locations is None:
-            locations = response if isinstance(response, list) else []
-        if not locations:
-            break
-
-        for loc in locations:
-            # Safely extract attributes since OpenAQ SDK objects may vary by version
-            loc_id = getattr(loc, 'id', None)
-            if loc_id is None and isinstance(loc, dict):
-                loc_id = loc.get('id') or loc.get('locationId') or loc.get('location_id')
-            if loc_id is None:
-                # If we can't determine an ID, skip this record to avoid integrity errors
-                continue
-
-            # Coordinates can be nested or flat depending on SDK
-            latitude = None
-            longitude = None
-            coords = getattr(loc, 'coordinates', None) or getattr(loc, 'coord', None)
-            if coords is not None:
-                if isinstance(coords, dict):
-                    latitude = coords.get('latitude') or coords.get('lat')
-                    longitude = coords.get('longitude') or coords.get('lon')
-                else:
-                    latitude = getattr(coords, 'latitude', None)
-                    if latitude is None:
-                        latitude = getattr(coords, 'lat', None)
-                    longitude = getattr(coords, 'longitude', None)
-                    if longitude is None:
-                        longitude = getattr(coords, 'lon', None)
-            else:
-                # Fallback if lat/lon are top-level
-                if isinstance(loc, dict):
-                    latitude = loc.get('latitude') or loc.get('lat')
-                    longitude = loc.get('longitude') or loc.get('lon')
-                else:
-                    latitude = getattr(loc, 'latitude', getattr(loc, 'lat', None))
-                    longitude = getattr(loc, 'longitude', getattr(loc, 'lon', None))
-
-            # Build geometry point if lat/lon available (x=lon, y=lat)
-            geom = None
-            if latitude is not None and longitude is not None:
-                try:
-                    geom = Point(float(longitude), float(latitude), srid=4326)
-                except Exception:
-                    geom = None
-
-            Location.objects.update_or_create(
-                location_id=loc_id,
-                defaults={
-                    # Model stores geometry in two PointFields named 'latitude' and 'longitude'
-                    # (schema could be improved later to a single 'location' field)
-                    'latitude': geom,
-                    'longitude': geom,
-                }
-            )
-            inserted_count += 1
-
-        page += 1
-
-    return Response({"message": f"Inserted/Updated {inserted_count} locations successfully"})
-
-@api_view(['GET'])
-def latest_weather(request):
-    # Get API key from env; accept either OPENWEATHER_API (correct) or OPENWHEATHER_API (legacy)
-    api_key = decouple.config("OPENWEATHER_API", default=None)
-    if not api_key:
-        # Backward-compat: typo variant in .env
-        api_key = decouple.config("OPENWHEATHER_API", default=None)
-
-    if not api_key:
-        return Response({
-            "error": "OpenWeather API key missing. Set OPENWEATHER_API in backend/.env",
-        }, status=500)
-
-    # Parse query params
-    q_city = request.query_params.get('q') or request.query_params.get('city')
-    lat = request.query_params.get('lat')
-    lon = request.query_params.get('lon')
-    units = request.query_params.get('units', 'metric')
-
-    # Default to Chennai, IN if no coords/city provided
-    default_lat, default_lon = 13.0827, 80.2707
-
-    params = {
-        'appid': api_key,
-        'units': units if units in ('standard', 'metric', 'imperial') else 'metric',
+        'cached': cache_state != response_cache.MISS,
+        'stale': cache_state == response_cache.STALE,
     }
 
-    endpoint = 'https://api.openweathermap.org/data/2.5/weather'
 
-    # Build request params based on precedence: lat/lon > city > default
-    try:
-        if lat is not None and lon is not None:
-            params['lat'] = float(lat)
-            params['lon'] = float(lon)
-        elif q_city:
-            params['q'] = q_city
-        else:
-            params['lat'] = default_lat
-            params['lon'] = default_lon
-    except ValueError:
-        return Response({"error": "lat and lon must be valid numbers"}, status=400)
+def _weather_payload(api_key: str, lat: float, lon: float, units: str) -> Tuple[dict, str]:
+    """Curated current weather for resolved coordinates and its cache state; raises UpstreamError."""
+    def fetch_weather(cell_lat, cell_lon):
+        return get_json(WEATHER_ENDPOINT, {'lat': cell_lat, 'lon': cell_lon, 'units': units, 'appid': api_key})
 
-    url = f"{endpoint}?{urlencode(params)}"
-    try:
-        req = Request(url, headers={"User-Agent": "AirQualityChecker/1.0"})
-        with urlopen(req, timeout=10) as resp:
-            status = getattr(resp, 'status', 200)
-            body = resp.read().decode('utf-8')
-    except HTTPError as e:
-        # Attempt to read error body json
-        try:
-            err_body = e.read().decode('utf-8')
-            err_json = json.loads(err_body)
-        except Exception:
-            err_json = {"message": str(e)}
-        return Response({
-            "error": "OpenWeather API error",
-            "status_code": e.code,
-            "details": err_json,
-        }, status=e.code if 400 <= e.code < 600 else 502)
-    except URLError as e:
-        return Response({"error": f"Failed to reach OpenWeather: {e.reason}"}, status=502)
+    # Shared per grid cell and units (see api/response_cache.py)
+    data, cache_state = response_cache.get_or_fetch('weather', lat, lon, fetch_weather, units=units)
+    return _curate_weather(data, units), cache_state
 
-    try:
-        data = json.loads(body)
-    except Exception:
-        return Response({"error": "Invalid JSON from OpenWeather"}, status=502)
 
+def _curate_weather(data: dict, units: str) -> dict:
     # Curate a compact, frontend-friendly payload
     coord = data.get('coord', {}) or {}
     main = data.get('main', {}) or {}
@@ -338,7 +200,7 @@ def latest_weather(request):
             'feels_like': main.get('feels_like'),
             'min': main.get('temp_min'),
             'max': main.get('temp_max'),
-            'units': params['units'],
+            'units': units,
         },
         'atmosphere': {
             'pressure_hpa': main.get('pressure'),
@@ -355,236 +217,155 @@ def latest_weather(request):
         'sunset_utc': sys.get('sunset'),
         'raw': data,  # Keep raw for debugging/extended use; remove if not needed
     }
+    return curated
 
-    return Response({
-        "message": "Latest current weather from OpenWeather",
-        "query": {k: v for k, v in params.items() if k != 'appid'},
-        "result": curated,
-    })
-
-@api_view(['GET'])
-def predict_aqi(request):
-    """
-    Predict AQI for a specified period at a given coordinate/city.
-
-    Query params:
-      - lat, lon: coordinates (preferred)
-      - q or city: city name to geocode via OpenWeather
-      - start, end: Unix seconds or ISO-8601 timestamps in UTC (e.g. 2025-10-04T00:00:00Z)
-      - hours: integer hours lookback if start/end not provided (default: 24)
-    Behavior:
-      - Chooses nearest Location.location_id from DB to the resolved lat/lon
-      - Fetches OpenWeather Air Pollution history for [start,end]
-      - If TensorFlow model Models/AQI_prediction_model.h5 is available, outputs model predictions
-      - Always returns OpenWeather components and their AQI as baseline
-    """
 
-    # 1) Resolve coordinates from lat/lon or city query
-    api_key = decouple.config("OPENWEATHER_API", default=None) or decouple.config("OPENWHEATHER_API", default=None)
-    if not api_key:
-        return Response({"error": "OpenWeather API key missing. Set OPENWEATHER_API in backend/.env"}, status=500)
+# --- predict_aqi steps (shared with api/async_views.py) ---
 
-    # Validate query params via serializer
-    query_serializer = PredictAQIQuerySerializer(data=request.query_params)
-    if not query_serializer.is_valid():
-        return Response({'error': 'Invalid query parameters', 'details': query_serializer.errors}, status=400)
+# Feature order assumption (match training):
+PREDICTION_FEATURE_KEYS = ['co', 'no', 'no2', 'o3', 'so2', 'pm2_5', 'pm10', 'nh3']
 
-    q_city = query_serializer.validated_data.get('q') or query_serializer.validated_data.get('city')
-    lat_param = query_serializer.validated_data.get('lat')
-    lon_param = query_serializer.validated_data.get('lon')
-    default_lat, default_lon = 13.0827, 80.2707  # Chennai fallback
 
-    try:
-        if lat_param is not None and lon_param is not None:
-            lat_val = float(lat_param)
-            lon_val = float(lon_param)
-        elif q_city:
-            # Geocode city
-            geo_endpoint = 'https://api.openweathermap.org/geo/1.0/direct'
-            geo_params = {'q': q_city, 'limit': 1, 'appid': api_key}
-            geo_url = f"{geo_endpoint}?{urlencode(geo_params)}"
-            try:
-                req = Request(geo_url, headers={"User-Agent": "AirQualityChecker/1.0"})
-                with urlopen(req, timeout=10) as resp:
-                    geo_body = resp.read().decode('utf-8')
-                geo_data = json.loads(geo_body)
-                if not geo_data:
-                    return Response({"error": "City not found"}, status=404)
-                lat_val = float(geo_data[0].get('lat'))
-                lon_val = float(geo_data[0].get('lon'))
-            except HTTPError as e:
-                try:
-                    err_json = json.loads(e.read().decode('utf-8'))
-                except Exception:
-                    err_json = {"message": str(e)}
-                return Response({"error": "Geocoding failed", "details": err_json}, status=e.code if 400 <= e.code < 600 else 502)
-            except URLError as e:
-                return Response({"error": f"Failed to reach OpenWeather Geocoding: {e.reason}"}, status=502)
+def _prediction_features(items: List[dict]) -> Tuple[List[List[float]], List[dict]]:
+    """Model input rows for complete history items, plus per-item metadata for the timeline."""
+    feature_keys = PREDICTION_FEATURE_KEYS
+    X: List[List[float]] = []
+    rows_meta: List[dict] = []
+    for it in items:
+        comps = it.get('components', {}) or {}
+        row = [float(comps.get(k)) if comps.get(k) is not None else float('nan') for k in feature_keys]
+        # Skip rows with missing components for prediction; still include in output with predicted_aqi=None
+        if all(not math.isnan(v) for v in row):
+            X.append(row)
+            rows_meta.append({'dt': it.get('dt'), 'components': comps, 'aqi': (it.get('main') or {}).get('aqi')})
         else:
-            lat_val = default_lat
-            lon_val = default_lon
-    except ValueError:
-        return Response({"error": "lat and lon must be valid numbers"}, status=400)
-
-    # 2) Parse time range
-    def parse_ts(val: Optional[str]) -> Optional[int]:
-        if not val:
-            return None
-        # Accept Unix seconds or ISO-8601 (UTC)
-        try:
-            # numeric seconds
-            return int(float(val))
-        except ValueError:
-            pass
-        try:
-            dt = datetime.fromisoformat(val.replace('Z', '+00:00'))
-            if dt.tzinfo is None:
-                dt = dt.replace(tzinfo=timezone.utc)
-            return int(dt.timestamp())
-        except Exception:
-            return None
-
-    now_utc = datetime.now(timezone.utc)
-    start_q = query_serializer.validated_data.get('start')
-    end_q = query_serializer.validated_data.get('end')
-    hours_q = query_serializer.validated_data.get('hours')
-
-    start_ts = parse_ts(start_q)
-    end_ts = parse_ts(end_q)
-
-    if start_ts is None or end_ts is None:
-        try:
-            lookback_h = int(hours_q) if hours_q is not None else 24
-        except ValueError:
-            lookback_h = 24
-        end_ts = int(now_utc.timestamp())
-        start_ts = int((now_utc - timedelta(hours=lookback_h)).timestamp())
+            rows_meta.append({'dt': it.get('dt'), 'components': comps, 'aqi': (it.get('main') or {}).get('aqi'), 'skip': True})
+    return X, rows_meta
 
-    if end_ts <= start_ts:
-        return Response({"error": "end must be greater than start"}, status=400)
 
-    # 3) Choose nearest Location from DB
-    def haversine(lat1, lon1, lat2, lon2):
-        R = 6371000.0  # meters
-        phi1, phi2 = math.radians(lat1), math.radians(lat2)
-        dphi = math.radians(lat2 - lat1)
-        dlambda = math.radians(lon2 - lon1)
-        a = math.sin(dphi/2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda/2)**2
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-        return R * c
-
-    # Fallback to Python-side distance to avoid requiring PostGIS features at runtime
-    locations = list(Location.objects.all().only('location_id', 'latitude', 'longitude', 'geom'))
-    if not locations:
-        return Response({"error": "No locations found. Load locations first via /api/aqi/insert/."}, status=404)
+def _history_station(nearest_loc_id: int, nearest_dist: float):
+    """(lat, lon) of the nearest station when it is close enough to stand in for the point, else None."""
+    if nearest_dist > settings.HISTORY_STORE_MAX_DISTANCE_M:
+        return None
+    return history_store.station_coords(nearest_loc_id)
 
-    nearest_loc_id: Optional[int] = None
-    nearest_dist: float = float('inf')
-    for loc in locations:
-        lat2 = None
-        lon2 = None
-        try:
-            if getattr(loc, 'geom', None):
-                # GeoDjango Point: x=lon, y=lat
-                lon2 = float(loc.geom.x)
-                lat2 = float(loc.geom.y)
-            else:
-                lat2 = float(loc.latitude) if loc.latitude is not None else None
-                lon2 = float(loc.longitude) if loc.longitude is not None else None
-        except Exception:
-            lat2 = lon2 = None
-        if lat2 is None or lon2 is None:
-            continue
-        d = haversine(lat_val, lon_val, lat2, lon2)
-        if d < nearest_dist:
-            nearest_dist = d
-            nearest_loc_id = loc.location_id
-
-    if nearest_loc_id is None:
-        return Response({"error": "Could not resolve nearest location from DB coordinates."}, status=404)
 
-    # 4) Fetch Air Pollution history from OpenWeather
-    hist_endpoint = 'https://api.openweathermap.org/data/2.5/air_pollution/history'
-    hist_params = {
+def _upstream_history_params(lat_val: float, lon_val: float, start_ts: int, end_ts: int, api_key: str) -> dict:
+    return {
         'lat': lat_val,
         'lon': lon_val,
         'start': start_ts,
         'end': end_ts,
         'appid': api_key,
     }
-    hist_url = f"{hist_endpoint}?{urlencode(hist_params)}"
-    try:
-        req = Request(hist_url, headers={"User-Agent": "AirQualityChecker/1.0"})
-        with urlopen(req, timeout=15) as resp:
-            body = resp.read().decode('utf-8')
-    except HTTPError as e:
-        try:
-            err_json = json.loads(e.read().decode('utf-8'))
-        except Exception:
-            err_json = {"message": str(e)}
-        return Response({"error": "OpenWeather Air Pollution history error", "details": err_json}, status=e.code if 400 <= e.code < 600 else 502)
-    except URLError as e:
-        return Response({"error": f"Failed to reach OpenWeather: {e.reason}"}, status=502)
 
-    try:
-        hist = json.loads(body)
-    except Exception:
-        return Response({"error": "Invalid JSON from OpenWeather history"}, status=502)
 
-    items = hist.get('list') or []
+def _store_history(items: List[dict], store_stats: dict) -> Tuple[List[dict], dict]:
+    return items, {'source': 'store', **store_stats}
 
-    # 5) Prepare features and optionally run model predictions
-    # Feature order assumption (match training):
-    feature_keys = ['co', 'no', 'no2', 'o3', 'so2', 'pm2_5', 'pm10', 'nh3']
 
-    X: List[List[float]] = []
-    rows_meta: List[dict] = []
-    for it in items:
-        comps = it.get('components', {}) or {}
-        row = [float(comps.get(k)) if comps.get(k) is not None else float('nan') for k in feature_keys]
-        # Skip rows with missing components for prediction; still include in output with predicted_aqi=None
-        if all(not math.isnan(v) for v in row):
-            X.append(row)
-            rows_meta.append({'dt': it.get('dt'), 'components': comps, 'aqi': (it.get('main') or {}).get('aqi')})
+def _upstream_history(hist: dict) -> Tuple[List[dict], dict]:
+    return hist.get('list') or [], {'source': 'upstream'}
+
+
+def _prediction_history(lat_val: float, lon_val: float, nearest_loc_id: int, nearest_dist: float,
+                        start_ts: int, end_ts: int, api_key: str) -> Tuple[List[dict], dict]:
+    """
+    Air Pollution history items for [start, end] and where they came from; raises UpstreamError.
+
+    From the local store (fetching only missing gaps upstream) when the station
+    is close enough to stand in for the point, otherwise straight from
+    OpenWeather at the requested coordinates. The helpers above are shared with
+    the async twin in api/async_views.py, which awaits only the I/O.
+    """
+    station = _history_station(nearest_loc_id, nearest_dist)
+    if station is not None:
+        return _store_history(*history_store.get_history(nearest_loc_id, station[0], station[1], start_ts, end_ts, api_key))
+    hist_params = _upstream_history_params(lat_val, lon_val, start_ts, end_ts, api_key)
+    return _upstream_history(get_json(HISTORY_ENDPOINT, hist_params, timeout=settings.UPSTREAM_HISTORY_TIMEOUT))
+
+
+def _history_error_response(e: UpstreamError) -> Response:
+    return _upstream_error_response(e, "OpenWeather Air Pollution history error", "Failed to reach OpenWeather", "Invalid JSON from OpenWeather history")
+
+
+def _prediction_outputs(y_pred) -> Tuple[list, list]:
+    """(scalar, vector) predictions from one model output."""
+    import numpy as np
+    feature_keys = PREDICTION_FEATURE_KEYS
+    # Handle shapes: (n,1) -> scalar AQI; (n,k) -> per-pollutant vectors
+    if hasattr(y_pred, 'shape') and len(y_pred.shape) == 2:
+        n, m = y_pred.shape[0], y_pred.shape[1]
+        if m == 1:
+            return y_pred.reshape(-1).tolist(), [None] * n
+        if m == len(feature_keys):
+            return [None] * n, y_pred.tolist()
+        # Unknown output size: return raw values as vector
+        return [None] * n, y_pred.tolist()
+    # Fallback: attempt to flatten
+    return np.array(y_pred).reshape(-1).tolist(), []
+
+
+def _run_aqi_models(jobs: List[Tuple[List[List[float]], List[dict], int]]) -> List[dict]:
+    """
+    Run the AQI model for several (X, rows_meta, location_id) jobs with a single
+    predict call: their rows are stacked into one matrix and the output split back.
+
+    Component models (Keras/NumPy) take X; tabular models (joblib/XGBoost)
+    build their own rows from the station and timestamps in their stored
+    feature order and predict per-pollutant concentrations.
+    Returns per job {'scalar', 'vector', 'loaded', 'error'}: single-output
+    predictions (AQI), multi-output predictions (per pollutant), and the model
+    status. Jobs with no rows are a no-op.
+    """
+    results = [{'scalar': [], 'vector': [], 'loaded': False, 'error': None} for _ in jobs]
+    active = [i for i, (X, _, _) in enumerate(jobs) if X]
+    if not active:
+        return results
+    # In-process, or a proxy into the inference process pool (api/inference.py)
+    model, model_err = inference.get_model()
+    if model is None:
+        for i in active:
+            results[i]['error'] = model_err
+        return results
+    try:
+        import numpy as np
+        if hasattr(model, 'predict_components'):
+            # Kept as lists: components the model does not cover stay None (not NaN)
+            vectors = model.predict_components_many(
+                [(jobs[i][2], [meta.get('dt') for meta in jobs[i][1] if not meta.get('skip')]) for i in active],
+                predict=lambda rows: batching.predict(model, rows),
+            )
+            outputs = [([None] * len(vector), vector) for vector in vectors]
         else:
-            rows_meta.append({'dt': it.get('dt'), 'components': comps, 'aqi': (it.get('main') or {}).get('aqi'), 'skip': True})
+            # Shares one predict call with concurrent requests (api/batching.py)
+            y_pred = batching.predict(model, np.array([row for i in active for row in jobs[i][0]], dtype=float))
+            outputs = []
+            offset = 0
+            for i in active:
+                size = len(jobs[i][0])
+                outputs.append(_prediction_outputs(y_pred[offset:offset + size]))
+                offset += size
+    except Exception as e:
+        for i in active:
+            results[i]['error'] = str(e)
+        return results
+    for i, (scalar, vector) in zip(active, outputs):
+        results[i] = {'scalar': scalar, 'vector': vector, 'loaded': True, 'error': None}
+    return results
 
-    predictions_scalar: List[Optional[float]] = []  # For single-output (AQI)
-    predictions_vector: List[Optional[List[float]]] = []  # For multi-output (per pollutant)
-    model_loaded = False
-    model_err: Optional[str] = None
-    if X:
-        model, model_err = _get_aqi_model()
-        if model is not None:
-            try:
-                import numpy as np
-                X_np = np.array(X, dtype=float)
-                y_pred = model.predict(X_np, verbose=0)
-                model_loaded = True
-                # Handle shapes: (n,1) -> scalar AQI; (n,k) -> per-pollutant vectors
-                if hasattr(y_pred, 'shape') and len(y_pred.shape) == 2:
-                    n, m = y_pred.shape[0], y_pred.shape[1]
-                    if m == 1:
-                        predictions_scalar = y_pred.reshape(-1).tolist()
-                        predictions_vector = [None] * n
-                    elif m == len(feature_keys):
-                        predictions_vector = y_pred.tolist()
-                        predictions_scalar = [None] * n
-                    else:
-                        # Unknown output size: return raw values as vector
-                        predictions_vector = y_pred.tolist()
-                        predictions_scalar = [None] * y_pred.shape[0]
-                else:
-                    # Fallback: attempt to flatten
-                    y_flat = np.array(y_pred).reshape(-1).tolist()
-                    predictions_scalar = y_flat
-                    predictions_vector = []
-            except Exception as e:
-                model_err = str(e)
-                predictions_scalar = []
-                predictions_vector = []
 
-    # 6) Build response aligning predictions back to timeline
+def _run_aqi_model(X: List[List[float]], rows_meta: List[dict], location_id: int) -> dict:
+    """Run the AQI model on X (no-op if empty); see :func:`_run_aqi_models`."""
+    return _run_aqi_models([(X, rows_meta, location_id)])[0]
+
+
+def _prediction_results(rows_meta: List[dict], prediction: dict) -> List[dict]:
+    """Align predictions back onto the history timeline."""
+    feature_keys = PREDICTION_FEATURE_KEYS
+    model_loaded = prediction['loaded']
+    predictions_scalar = prediction['scalar']
+    predictions_vector = prediction['vector']
     pred_scalar_iter = iter(predictions_scalar)
     pred_vector_iter = iter(predictions_vector)
     results = []
@@ -617,58 +398,57 @@ def predict_aqi(request):
             else:
                 item['prediction_raw'] = pred_vec
         results.append(item)
+    return results
+
 
-    response_payload = {
+def _prediction_payload(lat_val: float, lon_val: float, nearest_loc_id: int, nearest_dist: float, start_ts: int, end_ts: int,
+                        history_info: dict, rows_meta: List[dict], prediction: dict) -> dict:
+    results = _prediction_results(rows_meta, prediction)
+    return {
         'message': 'AQI predictions',
         'coordinates': {'lat': lat_val, 'lon': lon_val},
         'location': {'nearest_location_id': nearest_loc_id, 'distance_m': None if math.isinf(nearest_dist) else round(nearest_dist, 2)},
         'time_range': {'start_utc': start_ts, 'end_utc': end_ts},
-        'feature_order': feature_keys,
-        'model': {'loaded': model_loaded, 'error': model_err},
+        'feature_order': PREDICTION_FEATURE_KEYS,
+        'model': {'loaded': prediction['loaded'], 'error': prediction['error']},
+        'history': history_info,
         'count': len(results),
         'results': results,
     }
-    
-    # Generate AI summary if requested
-    generate_summary = request.query_params.get('generate_summary', '').lower() == 'true'
-    print(f"Generate summary requested: {generate_summary}, Results count: {len(results)}")
-    if generate_summary and results:
-        try:
-            # Calculate average predicted AQI (fallback to openweather_aqi if model predictions not available)
-            predicted_aqis = [
-                r.get('predicted_aqi') or r.get('openweather_aqi') 
-                for r in results 
-                if (r.get('predicted_aqi') is not None or r.get('openweather_aqi') is not None)
-            ]
-            avg_aqi = sum(predicted_aqis) / len(predicted_aqis) if predicted_aqis else None
-            print(f"Calculated average AQI: {avg_aqi}, from {len(predicted_aqis)} data points")
-            
-            # Calculate average pollutants
-            avg_pollutants = {}
-            for key in feature_keys:
-                values = [r['components'].get(key) for r in results if r['components'].get(key) is not None]
-                if values:
-                    avg_pollutants[key] = sum(values) / len(values)
-            
-            # Determine time period description
-            time_diff_hours = (end_ts - start_ts) / 3600
-            if time_diff_hours <= 24:
-                period_desc = "next 24 hours"
-            elif time_diff_hours <= 168:  # 7 days
-                period_desc = f"next {int(time_diff_hours / 24)} days"
-            else:
-                period_desc = f"next {int(time_diff_hours / 168)} weeks"
-            
-            # Generate AI summary for predictions
-            genai.configure(api_key=decouple.config("GEMINI_API_KEY", default=""))
-            model = genai.GenerativeModel('gemini-2.0-flash-exp')
-            
-            pollutant_info = ", ".join([f"{k}: {v:.2f} μg/m³" for k, v in avg_pollutants.items()])
-            
-            # Format AQI value properly
-            aqi_display = f"{avg_aqi:.1f}" if avg_aqi is not None else "N/A"
-            
-            prompt = f"""Based on air quality predictions for the {period_desc}:
+
+
+def _prediction_summary_prompt(results: List[dict], start_ts: int, end_ts: int, lat_val: float, lon_val: float) -> Tuple[str, dict]:
+    """Gemini prompt for a prediction summary, plus the averages reported alongside it."""
+    # Calculate average predicted AQI (fallback to openweather_aqi if model predictions not available)
+    predicted_aqis = [
+        r.get('predicted_aqi') or r.get('openweather_aqi')
+        for r in results
+        if (r.get('predicted_aqi') is not None or r.get('openweather_aqi') is not None)
+    ]
+    avg_aqi = sum(predicted_aqis) / len(predicted_aqis) if predicted_aqis else None
+
+    # Calculate average pollutants
+    avg_pollutants = {}
+    for key in PREDICTION_FEATURE_KEYS:
+        values = [r['components'].get(key) for r in results if r['components'].get(key) is not None]
+        if values:
+            avg_pollutants[key] = sum(values) / len(values)
+
+    # Determine time period description
+    time_diff_hours = (end_ts - start_ts) / 3600
+    if time_diff_hours <= 24:
+        period_desc = "next 24 hours"
+    elif time_diff_hours <= 168:  # 7 days
+        period_desc = f"next {int(time_diff_hours / 24)} days"
+    else:
+        period_desc = f"next {int(time_diff_hours / 168)} weeks"
+
+    pollutant_info = ", ".join([f"{k}: {v:.2f} μg/m³" for k, v in avg_pollutants.items()])
+
+    # Format AQI value properly
+    aqi_display = f"{avg_aqi:.1f}" if avg_aqi is not None else "N/A"
+
+    prompt = f"""Based on air quality predictions for the {period_desc}:
 
 Location: Coordinates ({lat_val}, {lon_val})
 Time Period: {period_desc}
@@ -684,21 +464,14 @@ Provide a comprehensive 5-6 sentence summary including:
 5. **Actionable Recommendations**: Practical steps people should take based on predictions
 
 Make it practical, forward-looking, and actionable for long-term planning."""
+    return prompt, {
+        'period': period_desc,
+        'avg_predicted_aqi': avg_aqi,
+        'avg_pollutants': avg_pollutants,
+    }
 
-            response = model.generate_content(prompt)
-            print(f"Generated AI summary successfully")
-            response_payload['ai_summary'] = {
-                'summary': response.text.strip(),
-                'period': period_desc,
-                'avg_predicted_aqi': avg_aqi,
-                'avg_pollutants': avg_pollutants
-            }
-        except Exception as e:
-            print(f"Error generating AI summary: {str(e)}")
-            response_payload['ai_summary'] = {
-                'error': f"Failed to generate summary: {str(e)}"
-            }
 
+def _prediction_response(response_payload: dict) -> Response:
     # Validate/format output via serializer
     resp_ser = PredictAQIResponseSerializer(data=response_payload)
     if not resp_ser.is_valid():
@@ -707,56 +480,44 @@ Make it practical, forward-looking, and actionable for long-term planning."""
         return Response(response_payload)
     return Response(resp_ser.data)
 
-@api_view(['POST'])
-def prediction_followup(request):
+
+# --- Gemini prompts (shared with api/async_views.py) ---
+
+def _followup_prompt(data) -> Tuple[Optional[str], Optional[str], Optional[Response]]:
     """
-    Handle follow-up questions specifically for prediction summaries.
-    
-    Expected POST body:
-    {
-        "question": "What crops are best for these conditions?",
-        "prediction_context": {
-            "period": "next 7 days",
-            "avg_predicted_aqi": 85,
-            "avg_pollutants": {...},
-            "summary": "Previous AI summary..."
-        }
-    }
+    (question, Gemini prompt) for a prediction_followup request.
+
+    Returns (question, prompt, None) or (None, None, error Response).
     """
-    try:
-        question = request.data.get('question', '').strip()
-        prediction_context = request.data.get('prediction_context', {})
-        
-        if not question:
-            return Response({
-                "success": False,
-                "error": "Question is required"
-            }, status=400)
-        
-        if not prediction_context:
-            return Response({
-                "success": False,
-                "error": "Prediction context is required"
-            }, status=400)
-        
-        # Extract context information
-        period = prediction_context.get('period', 'the predicted period')
-        avg_aqi = prediction_context.get('avg_predicted_aqi', 'N/A')
-        avg_pollutants = prediction_context.get('avg_pollutants', {})
-        previous_summary = prediction_context.get('summary', '')
-        
-        # Format pollutant information
-        pollutant_info = ", ".join([f"{k}: {v:.2f} μg/m³" for k, v in avg_pollutants.items()])
-        
-        # Format AQI display
-        aqi_display = f"{avg_aqi:.1f}" if isinstance(avg_aqi, (int, float)) else str(avg_aqi)
-        
-        # Initialize Gemini
-        genai.configure(api_key=decouple.config("GEMINI_API_KEY", default=""))
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        
-        # Build comprehensive prompt with prediction context
-        prompt = f"""You are an air quality expert providing advice based on PREDICTED air quality data.
+    question = data.get('question', '').strip()
+    prediction_context = data.get('prediction_context', {})
+
+    if not question:
+        return None, None, Response({
+            "success": False,
+            "error": "Question is required"
+        }, status=400)
+
+    if not prediction_context:
+        return None, None, Response({
+            "success": False,
+            "error": "Prediction context is required"
+        }, status=400)
+
+    # Extract context information
+    period = prediction_context.get('period', 'the predicted period')
+    avg_aqi = prediction_context.get('avg_predicted_aqi', 'N/A')
+    avg_pollutants = prediction_context.get('avg_pollutants', {})
+    previous_summary = prediction_context.get('summary', '')
+
+    # Format pollutant information
+    pollutant_info = ", ".join([f"{k}: {v:.2f} μg/m³" for k, v in avg_pollutants.items()])
+
+    # Format AQI display
+    aqi_display = f"{avg_aqi:.1f}" if isinstance(avg_aqi, (int, float)) else str(avg_aqi)
+
+    # Build comprehensive prompt with prediction context
+    prompt = f"""You are an air quality expert providing advice based on PREDICTED air quality data.
 
 PREDICTION CONTEXT:
 - Time Period: {period}
@@ -777,141 +538,75 @@ Provide a detailed, actionable 4-5 sentence response that:
 5. Is specific and actionable (avoid generic advice)
 
 Remember: This is PREDICTED data for future planning, not current conditions."""
-        
-        try:
-            response = model.generate_content(prompt)
-            answer_text = response.text.strip()
-            
-            return Response({
-                "success": True,
-                "answer": answer_text,
-                "question": question
-            })
-            
-        except Exception as ai_error:
-            return Response({
-                "success": False,
-                "error": f"AI processing error: {str(ai_error)}"
-            }, status=500)
-        
-    except Exception as e:
-        return Response({
-            "success": False,
-            "error": f"Failed to process follow-up: {str(e)}"
-        }, status=500)
+    return question, prompt, None
 
-@api_view(['POST'])
-def generate_report(request):
+
+def _report_context(validated: dict, data) -> Tuple[Optional[dict], Optional[Response]]:
     """
-    Generate AI-powered summaries for air quality report categories with weather context.
-    
-    Expected POST body:
-    {
-        "categories": [
-            {
-                "category": "Agriculture Consultation",
-                "parameters": ["PM2.5", "PM10", "O3"],
-                "values": {
-                    "PM2.5": 35.5,
-                    "PM10": 78.2,
-                    "O3": 45.1
-                },
-                "aqi": 85,
-                "location": "Chennai, IN",
-                "weather": {
-                    "temperature": 23.1,
-                    "humidity": 86,
-                    "wind_speed": 0.99,
-                    "pressure": 1011,
-                    "description": "broken clouds"
-                }
-            }
-        ],
-        "follow_up_question": "Optional follow-up question for chat continuation"
-    }
-    
-    Returns:
-    {
-        "success": true,
-        "summary": "AI-generated summary...",
-        "category": "Category name",
-        "chat_session_id": "unique_id"
-    }
+    Gemini prompt and context for a generate_report request.
+
+    Returns (context, None) or (None, error Response).
     """
-    try:
-        # Validate request data
-        request_serializer = GenerateReportRequestSerializer(data=request.data)
-        if not request_serializer.is_valid():
-            return Response({
-                "success": False,
-                "error": "Invalid request data",
-                "details": request_serializer.errors
-            }, status=400)
-        
-        categories = request_serializer.validated_data.get('categories', [])
-        follow_up_question = request.data.get('follow_up_question', None)
-        previous_context = request.data.get('previous_context', None)
-        
-        # Initialize Gemini client with chat capability
-        genai.configure(api_key=decouple.config("GEMINI_API_KEY", default=""))
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        
-        # Process only the first category (single summary at a time)
-        if not categories:
-            return Response({
-                "success": False,
-                "error": "No categories provided"
-            }, status=400)
-            
-        cat_data = categories[0]  # Take only first category
-        category = cat_data.get('category')
-        parameters = cat_data.get('parameters', [])
-        values = cat_data.get('values', {})
-        aqi = cat_data.get('aqi', 'N/A')
-        location = cat_data.get('location', 'Unknown location')
-        weather = cat_data.get('weather', {})
-        
-        if not category:
-            return Response({
-                "success": False,
-                "error": "Category name is required"
-            }, status=400)
-        
-        # Build context for AI including weather data
-        pollutant_info = []
-        for param in parameters:
-            value = values.get(param, 'N/A')
-            pollutant_info.append(f"{param}: {value} μg/m³")
-        
-        pollutant_text = ", ".join(pollutant_info) if pollutant_info else "No data available"
-        
-        # Build weather context
-        weather_info = []
-        if weather.get('temperature'):
-            weather_info.append(f"Temperature: {weather.get('temperature')}°C")
-        if weather.get('humidity'):
-            weather_info.append(f"Humidity: {weather.get('humidity')}%")
-        if weather.get('wind_speed'):
-            weather_info.append(f"Wind Speed: {weather.get('wind_speed')} m/s")
-        if weather.get('pressure'):
-            weather_info.append(f"Pressure: {weather.get('pressure')} hPa")
-        if weather.get('description'):
-            weather_info.append(f"Conditions: {weather.get('description')}")
-        
-        weather_text = ", ".join(weather_info) if weather_info else "Weather data not available"
-        
-        # Handle follow-up questions (chat continuation)
-        if follow_up_question and previous_context:
-            prompt = f"""Previous context:
+    categories = validated.get('categories', [])
+    follow_up_question = data.get('follow_up_question', None)
+    previous_context = data.get('previous_context', None)
+
+    # Process only the first category (single summary at a time)
+    if not categories:
+        return None, Response({
+            "success": False,
+            "error": "No categories provided"
+        }, status=400)
+
+    cat_data = categories[0]  # Take only first category
+    category = cat_data.get('category')
+    parameters = cat_data.get('parameters', [])
+    values = cat_data.get('values', {})
+    aqi = cat_data.get('aqi', 'N/A')
+    location = cat_data.get('location', 'Unknown location')
+    weather = cat_data.get('weather', {})
+
+    if not category:
+        return None, Response({
+            "success": False,
+            "error": "Category name is required"
+        }, status=400)
+
+    # Build context for AI including weather data
+    pollutant_info = []
+    for param in parameters:
+        value = values.get(param, 'N/A')
+        pollutant_info.append(f"{param}: {value} μg/m³")
+
+    pollutant_text = ", ".join(pollutant_info) if pollutant_info else "No data available"
+
+    # Build weather context
+    weather_info = []
+    if weather.get('temperature'):
+        weather_info.append(f"Temperature: {weather.get('temperature')}°C")
+    if weather.get('humidity'):
+        weather_info.append(f"Humidity: {weather.get('humidity')}%")
+    if weather.get('wind_speed'):
+        weather_info.append(f"Wind Speed: {weather.get('wind_speed')} m/s")
+    if weather.get('pressure'):
+        weather_info.append(f"Pressure: {weather.get('pressure')} hPa")
+    if weather.get('description'):
+        weather_info.append(f"Conditions: {weather.get('description')}")
+
+    weather_text = ", ".join(weather_info) if weather_info else "Weather data not available"
+
+    # Handle follow-up questions (chat continuation)
+    if follow_up_question and previous_context:
+        prompt = f"""Previous context:
 {previous_context}
 
 User's follow-up question: {follow_up_question}
 
 Provide a helpful, concise answer (2-3 sentences) based on the air quality and weather data."""
-        else:
-            # Create category-specific prompts with weather data
-            prompts = {
-                "Agriculture Consultation": f"""Based on the current environmental data for {location}:
+    else:
+        # Create category-specific prompts with weather data
+        prompts = {
+            "Agriculture Consultation": f"""Based on the current environmental data for {location}:
 
 Air Quality:
 - AQI: {aqi}
@@ -927,7 +622,7 @@ Provide a comprehensive 4-5 sentence summary for farmers including:
 4. Best crops to plant in current conditions
 Keep it practical and actionable.""",
 
-                "Health Advisory": f"""Based on the current environmental data for {location}:
+            "Health Advisory": f"""Based on the current environmental data for {location}:
 
 Air Quality:
 - AQI: {aqi}
@@ -943,7 +638,7 @@ Provide a comprehensive 4-5 sentence health advisory including:
 4. Tips to reduce exposure in current weather conditions
 Keep it clear and medically sound.""",
 
-                "Air Quality Report": f"""Based on the current environmental data for {location}:
+            "Air Quality Report": f"""Based on the current environmental data for {location}:
 
 Air Quality:
 - AQI: {aqi}
@@ -959,7 +654,7 @@ Provide a comprehensive 4-5 sentence technical summary including:
 4. Trend analysis and outlook considering weather patterns
 Keep it scientific but accessible.""",
 
-                "Emergency Services": f"""Based on the current environmental data for {location}:
+            "Emergency Services": f"""Based on the current environmental data for {location}:
 
 Air Quality:
 - AQI: {aqi}
@@ -974,10 +669,10 @@ Provide a comprehensive 4-5 sentence emergency response summary including:
 3. When to seek medical help
 4. Emergency measures for vulnerable groups in current conditions
 Keep it urgent and actionable."""
-            }
-            
-            # Use default prompt if category not in predefined list
-            prompt = prompts.get(category, f"""Based on the current environmental data for {location}:
+        }
+
+        # Use default prompt if category not in predefined list
+        prompt = prompts.get(category, f"""Based on the current environmental data for {location}:
 
 Air Quality:
 - AQI: {aqi}
@@ -987,10 +682,589 @@ Weather Conditions:
 - {weather_text}
 
 Provide a comprehensive 4-5 sentence summary for the category "{category}" with actionable insights considering both air quality and weather conditions.""")
+
+    return {
+        'prompt': prompt,
+        'category': category,
+        'location': location,
+        'aqi': aqi,
+        'pollutant_text': pollutant_text,
+        'weather_text': weather_text,
+        'previous_context': previous_context,
+    }, None
+
+
+def _report_response(ctx: dict, summary_text: str) -> dict:
+    import hashlib
+    import time
+
+    # Generate session ID for chat continuation
+    category, location = ctx['category'], ctx['location']
+    session_id = hashlib.md5(f"{category}{location}{time.time()}".encode()).hexdigest()
+    return {
+        "success": True,
+        "summary": summary_text,
+        "category": category,
+        "chat_session_id": session_id,
+        "context": f"Category: {category}\nLocation: {location}\nAQI: {ctx['aqi']}\nPollutants: {ctx['pollutant_text']}\nWeather: {ctx['weather_text']}\n\nSummary: {summary_text}"
+    }
+
+
+# Create your views here.
+
+@api_view(['GET'])
+def latest_measurements(request):
+    # Use OpenWeather Air Pollution API instead of OpenAQ
+    api_key = decouple.config("OPENWEATHER_API", default=None) or decouple.config("OPENWHEATHER_API", default=None)
+    if not api_key:
+        return Response({"error": "OpenWeather API key missing. Set OPENWEATHER_API in backend/.env"}, status=500)
+
+    # Accept lat/lon or city query; default to Chennai, IN
+    # Validate query params via serializer
+    query_serializer = PredictAQIQuerySerializer(data=request.query_params)
+    if not query_serializer.is_valid():
+        return Response({'error': 'Invalid query parameters', 'details': query_serializer.errors}, status=400)
+
+    coords, error = _resolve_coordinates(query_serializer.validated_data, api_key)
+    if error is not None:
+        return error
+    lat_val, lon_val = coords
+
+    try:
+        payload = _air_quality_payload(api_key, lat_val, lon_val)
+    except UpstreamError as e:
+        return _upstream_error_response(e, "OpenWeather Air Pollution API error", "Failed to reach OpenWeather", "Invalid JSON from OpenWeather")
+    return Response(payload)
+
+
+@api_view(['GET'])
+def instert_data(request):
+    # Small regions only: large re-syncs belong in `manage.py ingest_locations`,
+    # which is checkpointed/resumable and does not hold a web worker.
+    OPENAQ_API = decouple.config("OPENAQ_API")
+    client = OpenAQ(OPENAQ_API)
+    stats = ingest_locations(client, bbox=DEFAULT_BBOX)
+
+    return Response({
+        "message": f"Inserted/Updated {stats.rows} locations successfully",
+        "stats": stats.as_dict(),
+    })
+
+@api_view(['GET'])
+def latest_weather(request):
+    # Get API key from env; accept either OPENWEATHER_API (correct) or OPENWHEATHER_API (legacy)
+    api_key = decouple.config("OPENWEATHER_API", default=None)
+    if not api_key:
+        # Backward-compat: typo variant in .env
+        api_key = decouple.config("OPENWHEATHER_API", default=None)
+
+    if not api_key:
+        return Response({
+            "error": "OpenWeather API key missing. Set OPENWEATHER_API in backend/.env",
+        }, status=500)
+
+    # Parse query params
+    q_city = request.query_params.get('q') or request.query_params.get('city')
+    lat = request.query_params.get('lat')
+    lon = request.query_params.get('lon')
+    units = request.query_params.get('units', 'metric')
+
+    units = units if units in ('standard', 'metric', 'imperial') else 'metric'
+
+    coords, error = _resolve_coordinates({'lat': lat, 'lon': lon, 'q': q_city}, api_key)
+    if error is not None:
+        return error
+
+    try:
+        curated, cache_state = _weather_payload(api_key, coords[0], coords[1], units)
+    except UpstreamError as e:
+        return _upstream_error_response(e, "OpenWeather API error", "Failed to reach OpenWeather", "Invalid JSON from OpenWeather", include_status=True)
+
+    if q_city and (lat is None or lon is None):
+        query = {'q': q_city, 'units': units}
+    else:
+        query = {'lat': coords[0], 'lon': coords[1], 'units': units}
+
+    return Response({
+        "message": "Latest current weather from OpenWeather",
+        "query": query,
+        "result": curated,
+        "cached": cache_state != response_cache.MISS,
+        "stale": cache_state == response_cache.STALE,
+    })
+
+
+@api_view(['GET'])
+def dashboard(request):
+    """
+    Latest air pollution and current weather in one response.
+
+    Query params: lat/lon or q/city (as /api/aqi/latest/), units (as /api/weather/latest/).
+    Coordinates are resolved once and both upstream calls run concurrently.
+    If one of them fails (upstream error or anything else building that
+    section) its section is null and the error is reported under "errors";
+    only when both fail is the response an error.
+    """
+    api_key = decouple.config("OPENWEATHER_API", default=None) or decouple.config("OPENWHEATHER_API", default=None)
+    if not api_key:
+        return Response({"error": "OpenWeather API key missing. Set OPENWEATHER_API in backend/.env"}, status=500)
+
+    query_serializer = PredictAQIQuerySerializer(data=request.query_params)
+    if not query_serializer.is_valid():
+        return Response({'error': 'Invalid query parameters', 'details': query_serializer.errors}, status=400)
+    units = request.query_params.get('units', 'metric')
+    units = units if units in ('standard', 'metric', 'imperial') else 'metric'
+
+    coords, error = _resolve_coordinates(query_serializer.validated_data, api_key)
+    if error is not None:
+        return error
+    lat_val, lon_val = coords
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        air_future = pool.submit(_air_quality_payload, api_key, lat_val, lon_val)
+        weather_future = pool.submit(_weather_payload, api_key, lat_val, lon_val, units)
+
+    payload = {'coordinates': {'lat': lat_val, 'lon': lon_val}, 'air': None, 'weather': None}
+    errors = {}
+    try:
+        payload['air'] = air_future.result()
+    except UpstreamError as e:
+        errors['air'] = _upstream_error_response(e, "OpenWeather Air Pollution API error", "Failed to reach OpenWeather", "Invalid JSON from OpenWeather")
+    except Exception as e:
+        # Unexpected payload shape etc.: degrade this section, not the dashboard
+        errors['air'] = Response({"error": f"Failed to build air quality section: {str(e)}"}, status=500)
+    try:
+        curated, cache_state = weather_future.result()
+        payload['weather'] = {
+            'result': curated,
+            'units': units,
+            'cached': cache_state != response_cache.MISS,
+            'stale': cache_state == response_cache.STALE,
+        }
+    except UpstreamError as e:
+        errors['weather'] = _upstream_error_response(e, "OpenWeather API error", "Failed to reach OpenWeather", "Invalid JSON from OpenWeather", include_status=True)
+    except Exception as e:
+        errors['weather'] = Response({"error": f"Failed to build weather section: {str(e)}"}, status=500)
+
+    if len(errors) == 2:
+        return Response({
+            "error": "OpenWeather unavailable",
+            "errors": {name: resp.data for name, resp in errors.items()},
+        }, status=max(resp.status_code for resp in errors.values()))
+    if errors:
+        payload['errors'] = {name: resp.data for name, resp in errors.items()}
+    return Response(payload)
+
+@api_view(['GET'])
+def predict_aqi(request):
+    """
+    Predict AQI for a specified period at a given coordinate/city.
+
+    Query params:
+      - lat, lon: coordinates (preferred)
+      - q or city: city name to geocode via OpenWeather
+      - start, end: Unix seconds or ISO-8601 timestamps in UTC (e.g. 2025-10-04T00:00:00Z)
+      - hours: integer hours lookback if start/end not provided (default: 24)
+    Behavior:
+      - Chooses nearest Location.location_id from DB to the resolved lat/lon (PostGIS KNN when available)
+      - Fetches OpenWeather Air Pollution history for [start,end], reusing what the
+        local store already holds for the nearest station and fetching only the gaps
+      - If TensorFlow model Models/AQI_prediction_model.h5 is available, outputs model predictions
+      - Always returns OpenWeather components and their AQI as baseline
+    """
+
+    # 1) Resolve coordinates from lat/lon or city query
+    api_key = decouple.config("OPENWEATHER_API", default=None) or decouple.config("OPENWHEATHER_API", default=None)
+    if not api_key:
+        return Response({"error": "OpenWeather API key missing. Set OPENWEATHER_API in backend/.env"}, status=500)
+
+    # Validate query params via serializer
+    query_serializer = PredictAQIQuerySerializer(data=request.query_params)
+    if not query_serializer.is_valid():
+        return Response({'error': 'Invalid query parameters', 'details': query_serializer.errors}, status=400)
+
+    coords, error = _resolve_coordinates(query_serializer.validated_data, api_key)
+    if error is not None:
+        return error
+    lat_val, lon_val = coords
+
+    # 2) Parse time range
+    start_ts, end_ts = _resolve_time_range(query_serializer.validated_data)
+    if end_ts <= start_ts:
+        return Response({"error": "end must be greater than start"}, status=400)
+
+    # 3) Choose nearest Location (PostGIS KNN, or the in-memory index on SQLite)
+    nearest = spatial.nearest_location(lat_val, lon_val)
+    if nearest is None:
+        if not Location.objects.exists():
+            return Response({"error": "No locations found. Load locations first via /api/aqi/insert/."}, status=404)
+        return Response({"error": "Could not resolve nearest location from DB coordinates."}, status=404)
+    nearest_loc_id, nearest_dist = nearest
+
+    # 4) Air Pollution history
+    try:
+        items, history_info = _prediction_history(lat_val, lon_val, nearest_loc_id, nearest_dist, start_ts, end_ts, api_key)
+    except UpstreamError as e:
+        return _history_error_response(e)
+
+    # 5) Prepare features and optionally run model predictions
+    X, rows_meta = _prediction_features(items)
+    prediction = _run_aqi_model(X, rows_meta, nearest_loc_id)
+
+    # 6) Build response aligning predictions back to timeline
+    response_payload = _prediction_payload(
+        lat_val, lon_val, nearest_loc_id, nearest_dist, start_ts, end_ts, history_info, rows_meta, prediction,
+    )
+
+    # Generate AI summary if requested
+    generate_summary = request.query_params.get('generate_summary', '').lower() == 'true'
+    print(f"Generate summary requested: {generate_summary}, Results count: {len(response_payload['results'])}")
+    if generate_summary and response_payload['results']:
+        try:
+            prompt, summary_meta = _prediction_summary_prompt(response_payload['results'], start_ts, end_ts, lat_val, lon_val)
+            print(f"Calculated average AQI: {summary_meta['avg_predicted_aqi']}")
+
+            # Generate AI summary for predictions
+            genai.configure(api_key=decouple.config("GEMINI_API_KEY", default=""))
+            model = genai.GenerativeModel('gemini-2.0-flash-exp')
+            response = model.generate_content(prompt)
+            print(f"Generated AI summary successfully")
+            response_payload['ai_summary'] = {'summary': response.text.strip(), **summary_meta}
+        except Exception as e:
+            print(f"Error generating AI summary: {str(e)}")
+            response_payload['ai_summary'] = {
+                'error': f"Failed to generate summary: {str(e)}"
+            }
+
+    return _prediction_response(response_payload)
+
+def _closing_db(fn):
+    """Wrap fn for a pool thread: Django only closes the request thread's DB connections."""
+    def run(*args):
+        try:
+            return fn(*args)
+        finally:
+            connections.close_all()
+    return run
+
+
+def _batch_error(resp: Response) -> dict:
+    return {**resp.data, 'status': resp.status_code}
+
+
+@api_view(['POST'])
+def predict_aqi_batch(request):
+    """
+    AQI predictions for many locations over one shared time range, in one call.
+
+    Body: {"locations": [{"lat": .., "lon": ..} or {"q": "City"}, ...],
+           "start": .., "end": .. or "hours": ..}  (as predict_aqi's query params;
+    at most PREDICT_BATCH_MAX_LOCATIONS locations).
+    Geocoding and history fetches run concurrently, nearest stations come from
+    one spatial query, and every location's feature rows go through a single
+    model call. "results" follows the input order; a location that fails holds
+    its own error and status without affecting the others.
+    """
+    api_key = decouple.config("OPENWEATHER_API", default=None) or decouple.config("OPENWHEATHER_API", default=None)
+    if not api_key:
+        return Response({"error": "OpenWeather API key missing. Set OPENWEATHER_API in backend/.env"}, status=500)
+
+    request_serializer = PredictAQIBatchRequestSerializer(data=request.data)
+    if not request_serializer.is_valid():
+        return Response({'error': 'Invalid request data', 'details': request_serializer.errors}, status=400)
+    validated = request_serializer.validated_data
+    locations = validated['locations']
+    max_locations = settings.PREDICT_BATCH_MAX_LOCATIONS
+    if len(locations) > max_locations:
+        return Response({"error": f"At most {max_locations} locations per request"}, status=400)
+
+    start_ts, end_ts = _resolve_time_range(validated)
+    if end_ts <= start_ts:
+        return Response({"error": "end must be greater than start"}, status=400)
+
+    results: List[Optional[dict]] = [None] * len(locations)
+    workers = max(1, min(len(locations), settings.PREDICT_BATCH_CONCURRENCY))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # 1) Coordinates (cities are geocoded concurrently)
+        coords = {}
+        resolved = pool.map(_closing_db(_resolve_coordinates), locations, [api_key] * len(locations))
+        for i, (point, error) in enumerate(resolved):
+            if error is not None:
+                results[i] = _batch_error(error)
+            else:
+                coords[i] = point
+
+        # 2) Nearest station for every point in one query
+        nearest = {}
+        for i, hits in zip(coords, spatial.nearest_locations_many(list(coords.values()), 1)):
+            if hits:
+                nearest[i] = hits[0]
+            else:
+                results[i] = {"error": "No locations found. Load locations first via /api/aqi/insert/.", 'status': 404}
+
+        # 3) Histories, concurrently
+        fetch_history = _closing_db(_prediction_history)
+        futures = {
+            i: pool.submit(fetch_history, *coords[i], *nearest[i], start_ts, end_ts, api_key)
+            for i in nearest
+        }
+        histories = {}
+        for i, future in futures.items():
+            try:
+                histories[i] = future.result()
+            except UpstreamError as e:
+                results[i] = _batch_error(_history_error_response(e))
+
+    # 4) All locations' rows through one model call
+    features = {i: _prediction_features(items) for i, (items, _) in histories.items()}
+    predictions = _run_aqi_models([(features[i][0], features[i][1], nearest[i][0]) for i in histories])
+    for i, prediction in zip(histories, predictions):
+        lat_val, lon_val = coords[i]
+        nearest_loc_id, nearest_dist = nearest[i]
+        results[i] = _prediction_payload(
+            lat_val, lon_val, nearest_loc_id, nearest_dist, start_ts, end_ts, histories[i][1], features[i][1], prediction,
+        )
+
+    failed = [r for r in results if 'error' in r]
+    body = {
+        'message': 'AQI predictions',
+        'time_range': {'start_utc': start_ts, 'end_utc': end_ts},
+        'count': len(results),
+        'failed': len(failed),
+        'results': results,
+    }
+    if len(failed) == len(results):
+        return Response({"error": "No location could be predicted", **body}, status=max(r['status'] for r in failed))
+    return Response(body)
+
+
+@api_view(['POST'])
+def nearest_locations(request):
+    """
+    The k nearest stations for each of many points, in one call.
+
+    Body: {"points": [{"lat": .., "lon": ..}, ...], "k": 1, "radius_m": ..}
+    (at most NEAREST_BATCH_MAX_POINTS points, k <= 50). With radius_m, only
+    stations within that distance are returned, so a point may get fewer than k.
+    """
+    request_serializer = NearestLocationsRequestSerializer(data=request.data)
+    if not request_serializer.is_valid():
+        return Response({'error': 'Invalid request data', 'details': request_serializer.errors}, status=400)
+    validated = request_serializer.validated_data
+    points = [(p['lat'], p['lon']) for p in validated['points']]
+    max_points = settings.NEAREST_BATCH_MAX_POINTS
+    if len(points) > max_points:
+        return Response({"error": f"At most {max_points} points per request"}, status=400)
+
+    k = validated['k']
+    radius_m = validated.get('radius_m')
+    if radius_m is None:
+        neighbours = spatial.nearest_locations_many(points, k)
+    else:
+        # One radius query per point (ST_DWithin on PostGIS, a ball query on the index otherwise)
+        neighbours = [spatial.locations_within(lat, lon, radius_m)[:k] for lat, lon in points]
+    if not any(neighbours) and (radius_m is None or not Location.objects.exists()):
+        return Response({"error": "No locations found. Load locations first via /api/aqi/insert/."}, status=404)
+    return Response({
+        'k': k,
+        'radius_m': radius_m,
+        'count': len(points),
+        'results': [
+            {
+                'lat': lat,
+                'lon': lon,
+                'nearest': [{'location_id': loc_id, 'distance_m': round(dist, 2)} for loc_id, dist in hits],
+            }
+            for (lat, lon), hits in zip(points, neighbours)
+        ],
+    })
+
+
+@api_view(['GET'])
+def model_status(request):
+    """AQI model state, load/warmup timings, batching and executor counters."""
+    return Response({**aqi_model.stats(), 'batching': batching.stats(), 'executor': inference.stats()})
+
+@api_view(['GET'])
+def aqi_history(request):
+    """
+    Stored pollutant series for a station, served from the rollup tables.
+
+    Query params:
+      - location_id, or lat/lon / q / city (nearest station is used)
+      - parameters: comma-separated keys (default: all OpenWeather components and aqi)
+      - start, end, hours: as for predict_aqi
+      - resolution: raw | hour | day | auto (default; finest table within HISTORY_MAX_POINTS buckets)
+    """
+    query_serializer = AQIHistoryQuerySerializer(data=request.query_params)
+    if not query_serializer.is_valid():
+        return Response({'error': 'Invalid query parameters', 'details': query_serializer.errors}, status=400)
+    validated = query_serializer.validated_data
+
+    start_ts, end_ts = _resolve_time_range(validated)
+    if end_ts <= start_ts:
+        return Response({"error": "end must be greater than start"}, status=400)
+
+    location_id = validated.get('location_id')
+    distance_m = None
+    if location_id is None:
+        api_key = decouple.config("OPENWEATHER_API", default=None) or decouple.config("OPENWHEATHER_API", default=None)
+        # Stored series need no key; only geocoding a city name does
+        geocode = (validated.get('q') or validated.get('city')) and (validated.get('lat') is None or validated.get('lon') is None)
+        if geocode and not api_key:
+            return Response({"error": "OpenWeather API key missing. Set OPENWEATHER_API in backend/.env"}, status=500)
+        coords, error = _resolve_coordinates(validated, api_key)
+        if error is not None:
+            return error
+        nearest = spatial.nearest_location(*coords)
+        if nearest is None:
+            return Response({"error": "No locations found. Load locations first via /api/aqi/insert/."}, status=404)
+        location_id, distance_m = nearest
+    elif not Location.objects.filter(location_id=location_id).exists():
+        return Response({"error": "Unknown location_id"}, status=404)
+
+    if validated.get('parameters'):
+        parameters = [p.strip() for p in validated['parameters'].split(',') if p.strip()]
+    else:
+        parameters = FEATURE_KEYS + [AQI_PARAMETER]
+
+    resolution = validated.get('resolution', 'auto')
+    if resolution == 'auto':
+        resolution = rollups.auto_resolution(end_ts - start_ts, settings.HISTORY_MAX_POINTS)
+    resolution_s = rollups.RESOLUTIONS[resolution]
+
+    start_dt = datetime.fromtimestamp(start_ts, tz=timezone.utc)
+    end_dt = datetime.fromtimestamp(end_ts, tz=timezone.utc)
+    series = {}
+    used = None
+    for parameter in parameters:
+        used, points = rollups.series(location_id, parameter, start_dt, end_dt, resolution_s)
+        series[parameter] = [
+            {
+                'timestamp_utc': int(p['bucket'].timestamp()),
+                'mean': p['mean'],
+                'min': p['min'],
+                'max': p['max'],
+                'count': p['count'],
+            }
+            for p in points
+        ]
+
+    return Response({
+        'message': 'Stored AQI history',
+        'location': {'location_id': location_id, 'distance_m': None if distance_m is None else round(distance_m, 2)},
+        'time_range': {'start_utc': start_ts, 'end_utc': end_ts},
+        'resolution': used or resolution,
+        'series': series,
+    })
+
+@api_view(['POST'])
+def prediction_followup(request):
+    """
+    Handle follow-up questions specifically for prediction summaries.
+    
+    Expected POST body:
+    {
+        "question": "What crops are best for these conditions?",
+        "prediction_context": {
+            "period": "next 7 days",
+            "avg_predicted_aqi": 85,
+            "avg_pollutants": {...},
+            "summary": "Previous AI summary..."
+        }
+    }
+    """
+    try:
+        question, prompt, error = _followup_prompt(request.data)
+        if error is not None:
+            return error
+
+        # Initialize Gemini
+        genai.configure(api_key=decouple.config("GEMINI_API_KEY", default=""))
+        model = genai.GenerativeModel('gemini-2.0-flash-exp')
+
+        try:
+            response = model.generate_content(prompt)
+            answer_text = response.text.strip()
+            
+            return Response({
+                "success": True,
+                "answer": answer_text,
+                "question": question
+            })
+            
+        except Exception as ai_error:
+            return Response({
+                "success": False,
+                "error": f"AI processing error: {str(ai_error)}"
+            }, status=500)
+        
+    except Exception as e:
+        return Response({
+            "success": False,
+            "error": f"Failed to process follow-up: {str(e)}"
+        }, status=500)
+
+@api_view(['POST'])
+def generate_report(request):
+    """
+    Generate AI-powered summaries for air quality report categories with weather context.
+    
+    Expected POST body:
+    {
+        "categories": [
+            {
+                "category": "Agriculture Consultation",
+                "parameters": ["PM2.5", "PM10", "O3"],
+                "values": {
+                    "PM2.5": 35.5,
+                    "PM10": 78.2,
+                    "O3": 45.1
+                },
+                "aqi": 85,
+                "location": "Chennai, IN",
+                "weather": {
+                    "temperature": 23.1,
+                    "humidity": 86,
+                    "wind_speed": 0.99,
+                    "pressure": 1011,
+                    "description": "broken clouds"
+                }
+            }
+        ],
+        "follow_up_question": "Optional follow-up question for chat continuation"
+    }
+    
+    Returns:
+    {
+        "success": true,
+        "summary": "AI-generated summary...",
+        "category": "Category name",
+        "chat_session_id": "unique_id"
+    }
+    """
+    try:
+        # Validate request data
+        request_serializer = GenerateReportRequestSerializer(data=request.data)
+        if not request_serializer.is_valid():
+            return Response({
+                "success": False,
+                "error": "Invalid request data",
+                "details": request_serializer.errors
+            }, status=400)
         
+        ctx, error = _report_context(request_serializer.validated_data, request.data)
+        if error is not None:
+            return error
+
+        # Initialize Gemini client with chat capability
+        genai.configure(api_key=decouple.config("GEMINI_API_KEY", default=""))
+        model = genai.GenerativeModel('gemini-2.0-flash-exp')
+        prompt = ctx['prompt']
+
         try:
             # Start or continue chat session
-            if previous_context:
+            if ctx['previous_context']:
                 # Continue existing chat
                 chat = model.start_chat()
                 response = chat.send_message(prompt)
@@ -999,21 +1273,7 @@ Provide a comprehensive 4-5 sentence summary for the category "{category}" with
                 response = model.generate_content(prompt)
             
             summary_text = response.text.strip()
-            
-            # Generate session ID for chat continuation
-            import hashlib
-            import time
-            session_id = hashlib.md5(f"{category}{location}{time.time()}".encode()).hexdigest()
-            
-            response_data = {
-                "success": True,
-                "summary": summary_text,
-                "category": category,
-                "chat_session_id": session_id,
-                "context": f"Category: {category}\nLocation: {location}\nAQI: {aqi}\nPollutants: {pollutant_text}\nWeather: {weather_text}\n\nSummary: {summary_text}"
-            }
-            
-            return Response(response_data)
+            return Response(_report_response(ctx, summary_text))
             
         except Exception as ai_error:
             return Response({
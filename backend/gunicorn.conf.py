@@ -0,0 +1,33 @@
+"""
+Gunicorn settings. From backend/:
+
+    gunicorn -c gunicorn.conf.py myapp.wsgi
+    # ASYNC_VIEWS=True:
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py myapp.asgi:application
+
+The app is preloaded in the master, which loads the AQI model and the location
+index once before forking (api/preload.py); workers share those pages
+copy-on-write and are ready as soon as they start.
+"""
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myapp.settings')
+# Tells ApiConfig.ready() not to warm up in a background thread; when_ready does it before forking
+os.environ.setdefault('MODEL_PRELOAD', 'True')
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', '2'))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '60'))
+preload_app = True
+
+
+def when_ready(server):
+    from api import preload
+    server.log.info("preloaded: %s", preload.preload())
+
+
+def post_fork(server, worker):
+    from api import preload
+    preload.after_fork()
@@ -182,3 +182,116 @@ CORS_ALLOW_HEADERS = [
     'x-csrftoken',
     'x-requested-with',
 ]
+
+# Upstream HTTP client (api/upstream.py)
+# Pooled keep-alive connections shared by all OpenWeather calls.
+UPSTREAM_TIMEOUT = config('UPSTREAM_TIMEOUT', default=10, cast=float)  # read timeout, seconds
+UPSTREAM_HISTORY_TIMEOUT = config('UPSTREAM_HISTORY_TIMEOUT', default=15, cast=float)
+UPSTREAM_CONNECT_TIMEOUT = config('UPSTREAM_CONNECT_TIMEOUT', default=5, cast=float)
+UPSTREAM_RETRIES = config('UPSTREAM_RETRIES', default=2, cast=int)
+UPSTREAM_BACKOFF = config('UPSTREAM_BACKOFF', default=0.3, cast=float)
+UPSTREAM_NUM_POOLS = config('UPSTREAM_NUM_POOLS', default=10, cast=int)  # distinct hosts kept alive
+UPSTREAM_POOL_MAXSIZE = config('UPSTREAM_POOL_MAXSIZE', default=10, cast=int)  # connections per host
+
+# Geocoding cache (api/geocoding.py)
+GEOCODE_CACHE_SIZE = config('GEOCODE_CACHE_SIZE', default=1024, cast=int)  # in-process LRU entries
+GEOCODE_NEGATIVE_TTL = config('GEOCODE_NEGATIVE_TTL', default=86400, cast=int)  # seconds to remember "City not found"
+
+# OpenAQ ingestion (api/ingestion.py)
+# OpenAQ v3 allows 60 requests/minute per key; keep the token bucket under that.
+OPENAQ_INGEST_WORKERS = config('OPENAQ_INGEST_WORKERS', default=4, cast=int)
+OPENAQ_RATE_PER_SEC = config('OPENAQ_RATE_PER_SEC', default=1.0, cast=float)
+OPENAQ_RATE_BURST = config('OPENAQ_RATE_BURST', default=5, cast=int)
+
+# Measurement loading (api/measurements.py): rows per COPY / bulk_create batch
+MEASUREMENT_BATCH_SIZE = config('MEASUREMENT_BATCH_SIZE', default=50000, cast=int)
+
+# /api/aqi/history/ with resolution=auto uses the finest rollup (hour, then day) within this many buckets
+HISTORY_MAX_POINTS = config('HISTORY_MAX_POINTS', default=1000, cast=int)
+
+# predict_aqi history store (api/history_store.py)
+# Serve history from the local store when the nearest station is within this distance
+# of the requested point (0 disables the store and always fetches upstream).
+HISTORY_STORE_MAX_DISTANCE_M = config('HISTORY_STORE_MAX_DISTANCE_M', default=10000, cast=float)
+# Most recent window that is always re-fetched because upstream may still fill it in
+HISTORY_SETTLE_SECONDS = config('HISTORY_SETTLE_SECONDS', default=7200, cast=int)
+# POST /api/aqi/predict/batch/: locations per request, and how many geocode/history
+# fetches run at once
+PREDICT_BATCH_MAX_LOCATIONS = config('PREDICT_BATCH_MAX_LOCATIONS', default=50, cast=int)
+PREDICT_BATCH_CONCURRENCY = config('PREDICT_BATCH_CONCURRENCY', default=8, cast=int)
+
+# Shared cache: Redis when REDIS_URL is set (shared by all workers), else per-process memory
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# In-process station coordinate store (api/spatial.py, SQLite only): how often (seconds) to
+# compare against the shared version counter for Location changes made by other workers
+SPATIAL_VERSION_CHECK = config('SPATIAL_VERSION_CHECK', default=5, cast=float)
+# POST /api/locations/nearest/: points per request, and the size (floats) of the temporary
+# distance matrices the vectorized haversine works through (api/distance.py)
+NEAREST_BATCH_MAX_POINTS = config('NEAREST_BATCH_MAX_POINTS', default=1000, cast=int)
+DISTANCE_CHUNK_ELEMENTS = config('DISTANCE_CHUNK_ELEMENTS', default=4000000, cast=int)
+
+# Latest air pollution / weather cache (api/response_cache.py)
+# Requests are snapped to a grid of this many degrees (0.05° ≈ 5.5 km) and share one upstream call
+RESPONSE_CACHE_GRID_DEG = config('RESPONSE_CACHE_GRID_DEG', default=0.05, cast=float)
+RESPONSE_CACHE_MIN_TTL = config('RESPONSE_CACHE_MIN_TTL', default=60, cast=int)  # seconds, when upstream dt is stale/missing
+# Expired entries are still served (flagged "stale") for this long while a background refresh runs
+RESPONSE_CACHE_STALE_TTL = config('RESPONSE_CACHE_STALE_TTL', default=3600, cast=int)
+
+# Coalesce concurrent identical upstream calls (api/singleflight.py); across workers
+# too when the default cache is shared (e.g. REDIS_URL), followers waiting up to
+# UPSTREAM_COALESCE_WAIT seconds for the leader's result.
+UPSTREAM_COALESCE = config('UPSTREAM_COALESCE', default=True, cast=bool)
+UPSTREAM_COALESCE_SHARED = config('UPSTREAM_COALESCE_SHARED', default=True, cast=bool)
+UPSTREAM_COALESCE_WAIT = config('UPSTREAM_COALESCE_WAIT', default=15, cast=float)
+
+# Per-endpoint circuit breaker (api/circuit.py): open after this many consecutive
+# failures and fail fast for the cooldown before letting one trial call through
+UPSTREAM_BREAKER_THRESHOLD = config('UPSTREAM_BREAKER_THRESHOLD', default=5, cast=int)
+UPSTREAM_BREAKER_COOLDOWN = config('UPSTREAM_BREAKER_COOLDOWN', default=30, cast=float)
+
+# Serve the upstream-bound views (latest air/weather, predict, Gemini) from
+# api/async_views.py; run under ASGI (uvicorn myapp.asgi:application)
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+if ASYNC_VIEWS:
+    INSTALLED_APPS.append('adrf')
+
+# AQI model (api/aqi_model.py). Empty path = ../Models/AQI_prediction_model.h5
+AQI_MODEL_PATH = config('AQI_MODEL_PATH', default='')
+# auto: detect the format (joblib/XGBoost HDF5, or Keras served from its converted .npz;
+#       an unconverted .h5 falls back to tensorflow.keras when TensorFlow is installed)
+# numpy: pure NumPy forward pass over the .npz from `manage.py convert_aqi_model` (no TensorFlow import)
+# keras: tensorflow.keras load_model on the .h5
+AQI_MODEL_BACKEND = config('AQI_MODEL_BACKEND', default='auto')
+# Load the model (and run one dummy predict) in the background when a server process starts
+MODEL_WARMUP = config('MODEL_WARMUP', default=True, cast=bool)
+# Set by gunicorn.conf.py: the master preloads the model and location index before forking
+# (api/preload.py), so workers skip the background warmup
+MODEL_PRELOAD = config('MODEL_PRELOAD', default=False, cast=bool)
+# After a failed load, callers get the cached error; retry after this many seconds, doubling up to the max
+MODEL_RETRY_BACKOFF = config('MODEL_RETRY_BACKOFF', default=30, cast=float)
+MODEL_RETRY_BACKOFF_MAX = config('MODEL_RETRY_BACKOFF_MAX', default=600, cast=float)
+
+# Cross-request micro-batching of model.predict (api/batching.py): concurrent requests'
+# rows are collected for up to MAX_WAIT_MS (or MAX_ROWS rows) and run in one call
+INFERENCE_BATCHING = config('INFERENCE_BATCHING', default=True, cast=bool)
+INFERENCE_BATCH_MAX_ROWS = config('INFERENCE_BATCH_MAX_ROWS', default=512, cast=int)
+INFERENCE_BATCH_MAX_WAIT_MS = config('INFERENCE_BATCH_MAX_WAIT_MS', default=5, cast=float)
+# Where model.predict runs (api/inference.py): inline (request process) or process (a pool
+# of INFERENCE_POOL_WORKERS processes, each loading the model once; inputs via shared memory)
+INFERENCE_EXECUTOR = config('INFERENCE_EXECUTOR', default='inline')
+INFERENCE_POOL_WORKERS = config('INFERENCE_POOL_WORKERS', default=2, cast=int)
+INFERENCE_TIMEOUT = config('INFERENCE_TIMEOUT', default=30, cast=float)
@@ -33,6 +33,25 @@ ChartJS.register(
 // Theme Context
 const ThemeContext = createContext();
 
+// Ranges longer than this are read from the stored hourly/daily rollups
+const LONG_RANGE_DAYS = 31;
+
+// Reshape /api/aqi/history/ series into the per-timestamp rows the chart and stats use
+const rollupsToResults = (series) => {
+  const rows = {};
+  Object.entries(series || {}).forEach(([parameter, points]) => {
+    points.forEach((point) => {
+      const row = rows[point.timestamp_utc] || (rows[point.timestamp_utc] = { timestamp_utc: point.timestamp_utc, components: {} });
+      if (parameter === 'aqi') {
+        row.openweather_aqi = point.mean;
+      } else {
+        row.components[parameter] = point.mean;
+      }
+    });
+  });
+  return Object.values(rows).sort((a, b) => a.timestamp_utc - b.timestamp_utc);
+};
+
 function HistoryView() {
   const [isDarkMode, setIsDarkMode] = useState(true);
   const [startDate, setStartDate] = useState('');
@@ -85,18 +104,30 @@ function HistoryView() {
       const startTimestamp = new Date(startDate + 'T00:00:00Z').getTime() / 1000;
       const endTimestamp = new Date(endDate + 'T23:59:59Z').getTime() / 1000;
 
+      const longRange = endTimestamp - startTimestamp > LONG_RANGE_DAYS * 86400;
+
       const params = new URLSearchParams({
         start: Math.floor(startTimestamp).toString(),
         end: Math.floor(endTimestamp).toString(),
-        generate_summary: 'true',  // Request AI summary
       });
+      if (!longRange) {
+        params.append('generate_summary', 'true');  // Request AI summary
+      }
 
       if (userLocation.latitude && userLocation.longitude) {
         params.append('lat', userLocation.latitude.toString());
         params.append('lon', userLocation.longitude.toString());
       }
 
-      const data = await fetchAPI(`${API_ENDPOINTS.PREDICT_AQI}?${params.toString()}`);
+      let data;
+      if (longRange) {
+        // Month/year views: one rollup bucket per hour or day instead of hourly predictions
+        params.append('parameters', 'aqi,pm2_5,pm10,no2,o3');
+        const history = await fetchAPI(`${API_ENDPOINTS.AQI_HISTORY}?${params.toString()}`);
+        data = { ...history, results: rollupsToResults(history.series) };
+      } else {
+        data = await fetchAPI(`${API_ENDPOINTS.PREDICT_AQI}?${params.toString()}`);
+      }
       console.log('API Response:', data);
       console.log('AI Summary:', data.ai_summary);
       setHistoryData(data);
@@ -608,56 +608,44 @@ function TodayView() {
 
   const toggleTheme = () => setIsDarkMode(!isDarkMode);
 
-  const fetchAQIData = React.useCallback(async () => {
-    setAqiLoading(true);
-    setAqiError(null);
-    try {
-      const params = new URLSearchParams();
-      
-      // Use user's coordinates if available, otherwise use default city
-      if (userLocation.latitude && userLocation.longitude) {
-        params.append('lat', userLocation.latitude);
-        params.append('lon', userLocation.longitude);
-      } else if (!userLocation.loading) {
-        // Only use default city if geolocation has finished loading
-        params.append('city', 'Chennai');
-      } else {
-        // Still loading geolocation, wait
-        return;
-      }
-      
-      const data = await fetchAPI(`${API_ENDPOINTS.AQI_LATEST}?${params.toString()}`);
-      setAqiData(data);
-    } catch (err) {
-      setAqiError(err.message || 'Failed to fetch AQI data');
-    } finally {
-      setAqiLoading(false);
+  // Air pollution and weather come from one request; the backend fetches them concurrently
+  const fetchDashboardData = React.useCallback(async () => {
+    const params = new URLSearchParams();
+    
+    // Use user's coordinates if available, otherwise use default city
+    if (userLocation.latitude && userLocation.longitude) {
+      params.append('lat', userLocation.latitude);
+      params.append('lon', userLocation.longitude);
+    } else if (!userLocation.loading) {
+      // Only use default city if geolocation has finished loading
+      params.append('city', 'Chennai');
+    } else {
+      // Still loading geolocation, wait
+      return;
     }
-  }, [userLocation.latitude, userLocation.longitude, userLocation.loading]);
 
-  const fetchWeatherData = React.useCallback(async () => {
+    setAqiLoading(true);
     setWeatherLoading(true);
+    setAqiError(null);
     setWeatherError(null);
     try {
-      const params = new URLSearchParams();
-      
-      // Use user's coordinates if available, otherwise use default city
-      if (userLocation.latitude && userLocation.longitude) {
-        params.append('lat', userLocation.latitude);
-        params.append('lon', userLocation.longitude);
-      } else if (!userLocation.loading) {
-        // Only use default city if geolocation has finished loading
-        params.append('city', 'Chennai');
+      const data = await fetchAPI(`${API_ENDPOINTS.DASHBOARD}?${params.toString()}`);
+      const errors = data.errors || {};
+      if (data.air) {
+        setAqiData(data.air);
       } else {
-        // Still loading geolocation, wait
-        return;
+        setAqiError(errors.air?.error || 'Failed to fetch AQI data');
+      }
+      if (data.weather) {
+        setWeatherData(data.weather);
+      } else {
+        setWeatherError(errors.weather?.error || 'Failed to fetch weather data');
       }
-      
-      const data = await fetchAPI(`${API_ENDPOINTS.WEATHER_LATEST}?${params.toString()}`);
-      setWeatherData(data);
     } catch (err) {
+      setAqiError(err.message || 'Failed to fetch AQI data');
       setWeatherError(err.message || 'Failed to fetch weather data');
     } finally {
+      setAqiLoading(false);
       setWeatherLoading(false);
     }
   }, [userLocation.latitude, userLocation.longitude, userLocation.loading]);
@@ -665,10 +653,9 @@ function TodayView() {
   useEffect(() => {
     // Only fetch data when geolocation is done loading (either success or error)
     if (!userLocation.loading) {
-      fetchAQIData();
-      fetchWeatherData();
+      fetchDashboardData();
     }
-  }, [fetchAQIData, fetchWeatherData, userLocation.loading]);
+  }, [fetchDashboardData, userLocation.loading]);
 
   // Generate summary for a specific category
   const handleGenerateSummary = React.useCallback(async (category) => {
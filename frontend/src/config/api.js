@@ -5,7 +5,11 @@ export const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'http://localho
 export const API_ENDPOINTS = {
   AQI_LATEST: `${API_BASE_URL}/api/aqi/latest/`,
   WEATHER_LATEST: `${API_BASE_URL}/api/weather/latest/`,
+  DASHBOARD: `${API_BASE_URL}/api/dashboard/`,
   PREDICT_AQI: `${API_BASE_URL}/api/aqi/predict/`,
+  PREDICT_AQI_BATCH: `${API_BASE_URL}/api/aqi/predict/batch/`,
+  AQI_HISTORY: `${API_BASE_URL}/api/aqi/history/`,
+  NEAREST_LOCATIONS: `${API_BASE_URL}/api/locations/nearest/`,
   GENERATE_REPORT: `${API_BASE_URL}/api/generate-report/`,
   PREDICTION_FOLLOWUP: `${API_BASE_URL}/api/prediction-followup/`,
 };